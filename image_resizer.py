@@ -1,12 +1,548 @@
+import io
+import csv
 import os
 import sys
+import math
 import subprocess
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 import threading
-from PIL import Image, ImageTk
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from PIL import Image, ImageTk, features
 import shutil
 
+# Search mode: a result within this fraction of the limit counts as converged
+SEARCH_TOLERANCE = 0.95
+# Encodes the search may spend after the full-size one
+MAX_SEARCH_PROBES = 4
+# Batch processing: files queued per worker process, UI poll period, and how often the preview may change
+FILES_IN_FLIGHT_PER_PROCESS = 2
+PROGRESS_POLL_MS = 100
+PREVIEW_INTERVAL = 0.5
+# Modes a trial can be written to PNG in without conversion
+PNG_MODES = ("1", "L", "LA", "P", "RGB", "RGBA")
+# Strategy ladder: palette sizes tried at full resolution before resizing
+PALETTE_LADDER = [256, 128, 64]
+# Output formats a file may be written as ("png" only unless negotiation is on)
+OUTPUT_FORMATS = ["png", "webp", "webp-lossy", "avif"]
+LOSSY_FORMATS = ["webp-lossy", "avif"]
+FORMAT_EXTENSIONS = {"png": ".png", "webp": ".webp", "webp-lossy": ".webp", "avif": ".avif"}
+AVIF_AVAILABLE = features.check("avif")
+# Written to the output folder when formats are negotiated
+FORMAT_REPORT_NAME = "format_report.csv"
+# Lossy candidates: encoder quality, and the PSNR they must keep against the source at their size
+LOSSY_QUALITY = 90
+MIN_LOSSY_PSNR = 40.0
+# Palette rungs must keep this PSNR against the source at the same size before they can win
+MIN_PALETTE_PSNR = 40.0
+# Ordered dithering threshold map
+BAYER_4X4 = np.array([[0, 8, 2, 10], [12, 4, 14, 6], [3, 11, 1, 9], [15, 7, 13, 5]], dtype=np.float32)
+
+def even_size(width, height, scale):
+    """Scaled dimensions rounded down to even numbers (required by some FFmpeg filters)"""
+    new_width = max(2, int(width * scale))
+    new_height = max(2, int(height * scale))
+    return max(2, new_width - (new_width % 2)), max(2, new_height - (new_height % 2))
+
+def search_scale(probe, limit_bytes, full_bytes, max_probes=MAX_SEARCH_PROBES, tolerance=SEARCH_TOLERANCE):
+    """
+    Find the largest scale whose encode fits limit_bytes. probe(scale) encodes at that
+    scale and returns the byte size. File size is modelled as bytes = c * area^alpha in
+    log space: the first guess assumes alpha = 1 (bytes proportional to pixel count),
+    later ones use the secant through the last two probes. A guess outside the bracket
+    of known fitting / too-large scales falls back to bisection.
+    Returns (scale, bytes) of the largest fitting probe, or (None, None).
+    """
+    # Aim for the middle of the accepted band [tolerance * limit, limit]
+    target = math.log(limit_bytes * (1 + tolerance) / 2)
+    # (log area ratio, log bytes) of every probe; scale 1 is the full-size encode
+    points = [(0.0, math.log(full_bytes))]
+    fits = None
+    too_big = 0.0  # log area ratio of the smallest scale known to be too large
+
+    for _ in range(max_probes):
+        alpha = 1.0
+        if len(points) >= 2:
+            (x0, y0), (x1, y1) = points[-2:]
+            if x1 != x0:
+                # Clamped so a noisy pair of probes can't send the next guess wild
+                alpha = min(2.0, max(0.3, (y1 - y0) / (x1 - x0)))
+        x_last, y_last = points[-1]
+        x = x_last + (target - y_last) / alpha
+
+        low = math.log(fits[0] ** 2) if fits else None
+        if x >= too_big or (low is not None and x <= low):
+            x = (low + too_big) / 2 if low is not None else too_big + (target - y_last)
+
+        scale = math.exp(x / 2)
+        size = probe(scale)
+        points.append((x, math.log(max(size, 1))))
+
+        if size <= limit_bytes:
+            if fits is None or scale > fits[0]:
+                fits = (scale, size)
+            if size >= limit_bytes * tolerance:
+                break
+        else:
+            too_big = min(too_big, x)
+
+    return fits if fits else (None, None)
+
+class PillowEngine:
+    """In-process trials: the source is decoded once, each trial resizes that buffer and encodes into memory"""
+    def __init__(self, input_path):
+        with Image.open(input_path) as img:
+            img.load()
+            self.source = img.copy()
+        self.size = self.source.size
+        self._image = None
+        self.encodes = 0
+    
+    @property
+    def image(self):
+        """The source in a mode Pillow can resample (converted on first use)"""
+        if self._image is None:
+            if self.source.mode in ("RGB", "RGBA", "L", "LA"):
+                self._image = self.source
+            else:
+                # Resampling needs a continuous-tone mode; keep alpha when there is any
+                has_alpha = "A" in self.source.getbands() or "transparency" in self.source.info
+                self._image = self.source.convert("RGBA" if has_alpha else "RGB")
+        return self._image
+    
+    def render(self, size=None, colors=None, dither=False):
+        """The trial image: resized to size (None = original), quantized to colors (see quantize_image)"""
+        resized = size and tuple(size) != self.size
+        if not resized and not colors and self.source.mode in PNG_MODES:
+            # Unresized, the source is encoded in its own mode (an indexed PNG stays indexed)
+            return self.source
+        img = self.image
+        if resized:
+            img = img.resize(size, Image.LANCZOS)
+        if colors:
+            img = quantize_image(img, colors, dither)
+        return img
+    
+    def encode(self, size=None, last_resort=False, colors=None, dither=False):
+        """PNG bytes of render(); last_resort adds Pillow's optimize pass"""
+        data = encode_candidate(self.render(size, colors, dither), "png", last_resort)
+        self.encodes += 1
+        return data
+
+class FFmpegEngine:
+    """One ffmpeg process per trial; the PNG comes back over stdout instead of through a temp file"""
+    def __init__(self, input_path, threads=1):
+        self.input_path = input_path
+        # Threads this ffmpeg may use (see plan_workers)
+        self.threads = threads
+        with Image.open(input_path) as img:
+            self.size = img.size
+        self.encodes = 0
+    
+    def encode(self, size=None, last_resort=False):
+        """PNG bytes at size (None = original); last_resort adds mixed prediction"""
+        cmd = ["ffmpeg", "-i", self.input_path]
+        if size:
+            cmd += ["-vf", f"scale={size[0]}:{size[1]}"]
+        cmd += ["-threads", str(self.threads), "-filter_threads", str(self.threads)]
+        cmd += ["-compression_level", "9"]  # Maximum compression for PNG
+        if last_resort:
+            cmd += ["-pred", "mixed"]  # Mixed prediction
+        cmd += ["-f", "image2pipe", "-c:v", "png", "-"]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        self.encodes += 1
+        return result.stdout
+
+def create_engine(input_path, engine="pillow", ffmpeg_threads=1):
+    """Trial encoder for one file"""
+    if engine == "ffmpeg":
+        return FFmpegEngine(input_path, ffmpeg_threads)
+    return PillowEngine(input_path)
+
+def ordered_dither(img, colors):
+    """Add a tiled 4x4 Bayer threshold to the color channels (ordered dithering in one NumPy pass)"""
+    arr = np.asarray(img, dtype=np.float32).copy()
+    height, width = arr.shape[:2]
+    threshold = np.tile((BAYER_4X4 + 0.5) / 16 - 0.5, (-(-height // 4), -(-width // 4)))[:height, :width]
+    # About one palette step per channel at this palette size
+    step = 255 / colors ** (1 / 3)
+    arr[..., :3] += threshold[..., None] * step
+    return Image.fromarray(np.clip(arr + 0.5, 0, 255).astype(np.uint8), img.mode)
+
+def quantize_image(img, colors, dither=False):
+    """Adaptive palette of colors entries ('P' image); alpha is kept in the palette"""
+    img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+    if dither:
+        img = ordered_dither(img, colors)
+    # Median cut only handles RGB; the octree quantizer keeps alpha
+    method = Image.FASTOCTREE if img.mode == "RGBA" else Image.MEDIANCUT
+    return img.quantize(colors=colors, method=method, dither=Image.NONE)
+
+def resize_by_steps(engine, size_limit_bytes, **options):
+    """Try fixed resize factors from 90% down; returns (PNG, size) of the first that fits, or (None, None)"""
+    for factor in [0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.2, 0.1]:
+        size = even_size(*engine.size, factor)
+        data = engine.encode(size, **options)
+        
+        # Check if we're now under the limit
+        if len(data) <= size_limit_bytes:
+            return data, size
+    return None, None
+
+def resize_by_search(engine, size_limit_bytes, full_size, **options):
+    """Search the scale that just fits the limit (see search_scale); returns (PNG, size), or (None, None)"""
+    best = {"scale": 0.0, "data": None, "size": None}
+    
+    def probe(scale):
+        # Never upscale; the full-size encode is known to be too large
+        scale = min(scale, 0.999)
+        size = even_size(*engine.size, scale)
+        data = engine.encode(size, **options)
+        # Keep the largest fitting trial in memory; nothing touches the disk until the end
+        if len(data) <= size_limit_bytes and scale > best["scale"]:
+            best.update(scale=scale, data=data, size=size)
+        return len(data)
+    
+    search_scale(probe, size_limit_bytes, full_size)
+    return best["data"], best["size"]
+
+def encode_candidate(img, output_format, last_resort=False, quality=LOSSY_QUALITY):
+    """img encoded as one of OUTPUT_FORMATS, in memory"""
+    buffer = io.BytesIO()
+    if output_format == "png":
+        img.save(buffer, "PNG", compress_level=9, optimize=last_resort)
+    elif output_format == "webp":
+        # For lossless WebP quality is encoder effort; 100 is many times slower for a few bytes
+        img.save(buffer, "WEBP", lossless=True, quality=90 if last_resort else 50, method=6)
+    elif output_format == "webp-lossy":
+        img.save(buffer, "WEBP", quality=quality, method=6 if last_resort else 4)
+    elif output_format == "avif":
+        img.save(buffer, "AVIF", quality=quality)
+    else:
+        raise ValueError(f"Unknown output format: {output_format}")
+    return buffer.getvalue()
+
+def psnr(reference, data):
+    """PSNR in dB of an encoded image against the image it was encoded from"""
+    with Image.open(io.BytesIO(data)) as decoded:
+        mode = "RGBA" if "A" in decoded.getbands() else "RGB"
+        a = np.asarray(reference.convert(mode), dtype=np.float32)
+        b = np.asarray(decoded.convert(mode), dtype=np.float32)
+    mse = float(np.mean((a - b) ** 2))
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+class NegotiatedTrial(bytes):
+    """Encoded trial that also carries its format, its pixel size and what its PNG would have weighed"""
+    def __new__(cls, data, output_format, png_bytes, size):
+        trial = super().__new__(cls, data)
+        trial.format = output_format
+        trial.png_bytes = png_bytes
+        trial.size = size
+        return trial
+
+class NegotiatingEngine:
+    """
+    Wraps a PNG engine so every trial is encoded in each allowed lossless format in
+    parallel and the smallest one is returned, as a NegotiatedTrial. The ladder and the
+    resize searches run unchanged on top of it. Lossy formats are slow to encode, so
+    negotiate_lossy() tries them once on the trial that was kept; they must keep min_psnr
+    against the source at their size.
+    """
+    def __init__(self, png_engine, pillow_engine, formats, pool, quality=LOSSY_QUALITY, min_psnr=MIN_LOSSY_PSNR):
+        self.png_engine = png_engine
+        # Decoded source the other formats are encoded from
+        self.pillow_engine = pillow_engine
+        self.formats = formats
+        self.lossless_formats = [fmt for fmt in formats if fmt not in LOSSY_FORMATS]
+        self.lossy_formats = [fmt for fmt in formats if fmt in LOSSY_FORMATS]
+        self.pool = pool
+        self.quality = quality
+        self.min_psnr = min_psnr
+        self.size = png_engine.size
+        self.encodes = 0
+        # Trial size -> PNG bytes of the unquantized trial, for reporting lossy results
+        self._png_bytes = {}
+    
+    def encode(self, size=None, last_resort=False, colors=None, dither=False):
+        img = self.pillow_engine.render(size, colors, dither)
+        
+        def encode_png():
+            if self.png_engine is self.pillow_engine:
+                return encode_candidate(img, "png", last_resort)
+            return self.png_engine.encode(size, last_resort)
+        
+        futures = {"png": self.pool.submit(encode_png)}
+        for output_format in self.lossless_formats:
+            if output_format != "png":
+                futures[output_format] = self.pool.submit(encode_candidate, img, output_format, last_resort)
+        candidates = {fmt: future.result() for fmt, future in futures.items()}
+        self.encodes += 1
+        
+        size = tuple(size) if size else tuple(self.size)
+        if not colors:
+            self._png_bytes[size] = len(candidates["png"])
+        output_format, data = min(candidates.items(), key=lambda candidate: len(candidate[1]))
+        return NegotiatedTrial(data, output_format, len(candidates["png"]), size)
+    
+    def encode_lossy(self, img, output_format):
+        """Lossy encode of img, or None when it falls below min_psnr against img"""
+        data = encode_candidate(img, output_format, True, self.quality)
+        return None if psnr(img, data) < self.min_psnr else data
+    
+    def negotiate_lossy(self, trial, size_limit_bytes):
+        """
+        (trial to keep, strategy or None to keep the trial's). The lossy formats are tried at
+        full resolution, which wins when it fits, then at the kept trial's size, where the
+        smaller encode wins. Both are encoded from the source, never from a quantized trial.
+        """
+        if not self.lossy_formats:
+            return trial, None
+        full_size = tuple(self.size)
+        sizes = [full_size] if trial.size == full_size else [full_size, trial.size]
+        for size in sizes:
+            img = self.pillow_engine.render(None if size == full_size else size)
+            futures = {fmt: self.pool.submit(self.encode_lossy, img, fmt) for fmt in self.lossy_formats}
+            candidates = {fmt: future.result() for fmt, future in futures.items()}
+            self.encodes += 1
+            candidates = [(fmt, data) for fmt, data in candidates.items() if data is not None]
+            if not candidates:
+                continue
+            output_format, data = min(candidates, key=lambda candidate: len(candidate[1]))
+            if len(data) > size_limit_bytes or (size == trial.size and len(data) >= len(trial)):
+                continue
+            png_bytes = self._png_bytes.get(size, trial.png_bytes)
+            strategy = "lossy" if size != trial.size else None
+            return NegotiatedTrial(data, output_format, png_bytes, size), strategy
+        return trial, None
+
+def keeps_fidelity(palette_engine, data, size=None, min_psnr=MIN_PALETTE_PSNR):
+    """Whether a palette trial keeps min_psnr against the source at the same size"""
+    source_engine = getattr(palette_engine, "pillow_engine", palette_engine)
+    return psnr(source_engine.render(size), data) >= min_psnr
+
+def fit_full_resolution(engine, palette_engine, size_limit_bytes, dither=False):
+    """
+    Lossless rungs of the ladder, then the palette ones, all at full resolution:
+    optimized PNG, then 256, 128 and 64 colors, each only while it keeps MIN_PALETTE_PSNR.
+    Returns (PNG, strategy, bytes) of the first rung that fits, or (None, None, bytes of
+    the smallest palette) to seed a resize search; those bytes are None when the palettes
+    lose too much detail (photos) to be worth resizing.
+    """
+    data = engine.encode(last_resort=True)
+    if len(data) <= size_limit_bytes:
+        return data, "optimized", len(data)
+    for colors in PALETTE_LADDER:
+        data = palette_engine.encode(colors=colors, dither=dither, last_resort=True)
+        if not keeps_fidelity(palette_engine, data):
+            return None, None, None  # Fewer colors only lose more
+        if len(data) <= size_limit_bytes:
+            return data, f"palette {colors}", len(data)
+    return None, None, len(data)
+
+def optimize_file(input_path, output_path, size_limit_bytes, search_mode="search", engine="pillow",
+                  threads=1, ladder=False, dither=False, formats=("png",), lossy_quality=LOSSY_QUALITY):
+    """
+    Encode trials in memory until one fits the limit and write only that one. Runs in a
+    worker process, so it reports back through its return value instead of the UI: a dict
+    with the output path, its format and byte size, the PNG size of the same trial, whether
+    it fits the limit and how it got there. With more than one format the output extension
+    follows the chosen format.
+    """
+    file = os.path.basename(input_path)
+    engine = create_engine(input_path, engine, threads)
+    # Palettes and non-PNG formats are always built in-process, whatever encoder does the PNG trials
+    pillow_engine = engine if isinstance(engine, PillowEngine) else None
+    if ladder or len(formats) > 1:
+        pillow_engine = pillow_engine or PillowEngine(input_path)
+    
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        palette_engine = pillow_engine
+        if len(formats) > 1:
+            negotiating = NegotiatingEngine(engine, pillow_engine, formats, pool, lossy_quality)
+            palette_engine = negotiating if palette_engine is engine else \
+                NegotiatingEngine(pillow_engine, pillow_engine, formats, pool, lossy_quality)
+            engine = negotiating
+        data, strategy = fit_to_limit(engine, palette_engine, size_limit_bytes, search_mode, ladder, dither)
+        if isinstance(engine, NegotiatingEngine):
+            data, lossy_strategy = engine.negotiate_lossy(data, size_limit_bytes)
+            strategy = lossy_strategy or strategy
+    
+    # Negotiated trials know their format; anything else is a plain PNG
+    output_format = getattr(data, "format", "png")
+    png_bytes = getattr(data, "png_bytes", len(data))
+    output_path = os.path.splitext(output_path)[0] + FORMAT_EXTENSIONS[output_format]
+    
+    write_file_atomic(data, output_path)
+    encodes = engine.encodes + (palette_engine.encodes if palette_engine not in (None, engine) else 0)
+    print(f"{file}: {len(data) / (1024 * 1024):.2f}MB {output_format} ({strategy}, "
+          f"{(png_bytes - len(data)) / 1024:.0f}KB under PNG) after {encodes} encodes")
+    return {"output_path": output_path, "format": output_format, "bytes": len(data), "png_bytes": png_bytes,
+            "fits": len(data) <= size_limit_bytes, "strategy": strategy}
+
+def write_file_atomic(data, output_path):
+    """Write via a temp file in the target folder so readers never see a partial file"""
+    # Unique per process and thread so parallel workers never share a temp file
+    temp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def read_report_outputs(report_path):
+    """Output file names an earlier format report recorded as written by this tool"""
+    try:
+        with open(report_path, newline="") as f:
+            return {row["output"] for row in csv.DictReader(f) if row.get("output")}
+    except (OSError, csv.Error, KeyError):
+        return set()
+
+def remove_stale_outputs(output_path, owned_outputs):
+    """
+    Remove outputs of the same stem in the other formats, left over from an earlier run.
+    Only names in owned_outputs are touched, so inputs and foreign files survive.
+    """
+    stem = os.path.splitext(output_path)[0]
+    for extension in set(FORMAT_EXTENSIONS.values()):
+        stale_path = stem + extension
+        if stale_path == output_path or os.path.basename(stale_path) not in owned_outputs:
+            continue
+        try:
+            if os.path.isfile(stale_path):
+                os.remove(stale_path)
+        except OSError as e:
+            print(f"Could not remove stale output {stale_path}: {e}")
+
+def output_stems(image_files):
+    """
+    Output name (without extension) for every input file. Inputs that share a stem, such
+    as a.jpg and a.png, get their source extension appended so their outputs never collide.
+    """
+    stems = [os.path.splitext(file)[0] for file in image_files]
+    # Output extensions follow the format, so stems must be unique on their own (and on case-insensitive disks)
+    counts = {}
+    for stem in stems:
+        counts[stem.lower()] = counts.get(stem.lower(), 0) + 1
+    return {file: stem if counts[stem.lower()] == 1 else f"{stem}_{os.path.splitext(file)[1].lstrip('.')}"
+            for file, stem in zip(image_files, stems)}
+
+def fit_to_limit(engine, palette_engine, size_limit_bytes, search_mode="search", ladder=False, dither=False):
+    """The encode to keep and how it was reached: as is, a ladder rung, a resize or the last resort"""
+    # First convert to PNG with maximum compression to see if it's already under the limit
+    data = engine.encode()
+    strategy = "as is"
+    
+    if len(data) > size_limit_bytes:
+        full_size = len(data)
+        fitting = None
+        palette_full_size = None
+        if ladder:
+            fitting, strategy, palette_full_size = fit_full_resolution(engine, palette_engine, size_limit_bytes, dither)
+        
+        if fitting is None:
+            # Need to resize with an iterative approach
+            resize = resize_by_search if search_mode == "search" else resize_by_steps
+            search_args = (full_size,) if search_mode == "search" else ()
+            fitting, size = resize(engine, size_limit_bytes, *search_args)
+            strategy = f"resize {size[0]}x{size[1]}" if size else None
+            
+            if palette_full_size:
+                # The smallest palette may keep more pixels than truecolor; whichever keeps more wins,
+                # as long as it still holds MIN_PALETTE_PSNR at its size
+                colors = PALETTE_LADDER[-1]
+                palette_args = (palette_full_size,) if search_mode == "search" else ()
+                palette_data, palette_size = resize(palette_engine, size_limit_bytes, *palette_args,
+                                                    colors=colors, dither=dither)
+                if palette_size and (size is None or palette_size[0] * palette_size[1] > size[0] * size[1]) \
+                        and keeps_fidelity(palette_engine, palette_data, palette_size):
+                    fitting = palette_data
+                    strategy = f"palette {colors} + resize {palette_size[0]}x{palette_size[1]}"
+        
+        if fitting is not None:
+            data = fitting
+        else:
+            # If we tried all factors and still couldn't get under the limit,
+            # use the smallest resize with optimized compression options
+            data = engine.encode(even_size(*engine.size, 0.1), last_resort=True)
+            strategy = "last resort"
+    return data, strategy
+
+def plan_workers(file_count, engine="pillow", cores=None, negotiate=False):
+    """
+    (processes, threads per process) so that processes x threads matches the core count:
+    one process per core for big folders; for a handful of files, the spare cores go to
+    each ffmpeg's own threads or to encoding the format candidates side by side
+    """
+    cores = cores or os.cpu_count() or 1
+    processes = max(1, min(cores, file_count))
+    threads = max(1, cores // processes) if engine == "ffmpeg" or negotiate else 1
+    return processes, threads
+
+def write_format_report(report_path, decisions):
+    """CSV of the format chosen for every file and the bytes it saved against PNG"""
+    with open(report_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file", "output", "format", "strategy", "bytes", "png_bytes", "saved_bytes"])
+        for file, result in decisions:
+            writer.writerow([file, os.path.basename(result["output_path"]), result["format"], result["strategy"],
+                             result["bytes"], result["png_bytes"], result["png_bytes"] - result["bytes"]])
+
+class ProgressAggregator:
+    """
+    Batch progress shared by the dispatcher thread (writes) and the Tk thread (reads a
+    snapshot from an after() poll), so no Tk call is ever made off the main thread
+    """
+    def __init__(self, total):
+        self.total = total
+        self._lock = threading.Lock()
+        self.done = 0
+        self.current_file = ""
+        self.last_output = None
+        self.oversized = []
+        self.errors = []
+        # (file, result) of every file written
+        self.decisions = []
+        self.finished = False
+    
+    def started(self, file):
+        with self._lock:
+            self.current_file = file
+    
+    def completed(self, file, result):
+        with self._lock:
+            self.done += 1
+            self.last_output = result["output_path"]
+            self.decisions.append((file, result))
+            if not result["fits"]:
+                self.oversized.append((file, result["bytes"]))
+    
+    def failed(self, file, error):
+        with self._lock:
+            self.done += 1
+            self.errors.append((file, str(error)))
+    
+    def finish(self):
+        with self._lock:
+            self.finished = True
+    
+    def snapshot(self):
+        with self._lock:
+            return {
+                "total": self.total,
+                "done": self.done,
+                "current_file": self.current_file,
+                "last_output": self.last_output,
+                "oversized": list(self.oversized),
+                "errors": list(self.errors),
+                "saved_bytes": sum(result["png_bytes"] - result["bytes"] for _, result in self.decisions),
+                "finished": self.finished,
+            }
+
 class ImageOptimizerApp:
     def __init__(self, root):
         self.root = root
@@ -14,21 +550,44 @@ class ImageOptimizerApp:
         self.root.geometry("800x600")
         self.root.minsize(800, 600)
         
-        # Check if ffmpeg is installed
+        # FFmpeg is optional; trials are encoded in-process by default
         try:
             subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+            self.ffmpeg_available = True
         except (subprocess.SubprocessError, FileNotFoundError):
-            messagebox.showerror("Error", "FFmpeg is not installed or not in PATH. Please install FFmpeg before using this application.")
-            root.destroy()
-            return
+            print("FFmpeg is not installed or not in PATH; only the in-process encoder is available")
+            self.ffmpeg_available = False
             
         # Variables
         self.input_folder = tk.StringVar()
         self.output_folder = tk.StringVar()
         self.size_limit = tk.StringVar(value="2")  # Default 2MB
+        # "search" models bytes vs. pixel count to hit the limit in a few encodes;
+        # "steps" walks the fixed 90%..10% ladder
+        self.search_mode = tk.StringVar(value="search")
+        # "pillow" decodes once and encodes trials in memory; "ffmpeg" runs one process per trial
+        self.engine = tk.StringVar(value="pillow")
+        # Before resizing, try an optimized PNG and 256/128/64-color palettes at full resolution
+        # (off by default: it pays off for flat graphics, photos rarely keep MIN_PALETTE_PSNR)
+        self.use_ladder = tk.BooleanVar(value=False)
+        self.use_dithering = tk.BooleanVar(value=False)
+        # "png" always writes PNG; "negotiate" keeps the smallest of PNG / lossless WebP
+        # (and lossy WebP/AVIF when allowed) that fits
+        self.output_format = tk.StringVar(value="png")
+        self.allow_lossy = tk.BooleanVar(value=False)
+        self.lossy_quality = tk.StringVar(value=str(LOSSY_QUALITY))
         self.current_file = tk.StringVar()
         self.progress_value = tk.DoubleVar()
         self.status = tk.StringVar(value="Ready")
+        # Batch state, read by poll_progress
+        self.progress = None
+        self.previewed = None
+        self.preview_time = 0.0
+        # Owned by the dispatcher thread; closing the window cancels what it has queued
+        self.pool = None
+        self.in_flight = {}
+        self.closing = threading.Event()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         
         # Create UI
         self.create_ui()
@@ -58,6 +617,39 @@ class ImageOptimizerApp:
         size_spinbox = ttk.Spinbox(settings_frame, from_=0.1, to=100, increment=0.1, textvariable=self.size_limit, width=10)
         size_spinbox.grid(row=0, column=1, sticky=tk.W, padx=5, pady=5)
         
+        ttk.Label(settings_frame, text="Resize Search:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        search_frame = ttk.Frame(settings_frame)
+        search_frame.grid(row=1, column=1, sticky=tk.W, padx=5, pady=5)
+        ttk.Radiobutton(search_frame, text="Fit to limit (3-4 encodes)", variable=self.search_mode, value="search").pack(side=tk.LEFT)
+        ttk.Radiobutton(search_frame, text="Fixed steps", variable=self.search_mode, value="steps").pack(side=tk.LEFT, padx=10)
+        
+        ttk.Label(settings_frame, text="Encoder:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        engine_frame = ttk.Frame(settings_frame)
+        engine_frame.grid(row=2, column=1, sticky=tk.W, padx=5, pady=5)
+        ttk.Radiobutton(engine_frame, text="In-process (Pillow)", variable=self.engine, value="pillow").pack(side=tk.LEFT)
+        ffmpeg_button = ttk.Radiobutton(engine_frame, text="FFmpeg", variable=self.engine, value="ffmpeg")
+        ffmpeg_button.pack(side=tk.LEFT, padx=10)
+        if not self.ffmpeg_available:
+            ffmpeg_button.state(["disabled"])
+        
+        ttk.Label(settings_frame, text="Before Resizing:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        ladder_frame = ttk.Frame(settings_frame)
+        ladder_frame.grid(row=3, column=1, sticky=tk.W, padx=5, pady=5)
+        ttk.Checkbutton(ladder_frame, text="Try lossless optimization and palettes (256/128/64 colors)",
+                        variable=self.use_ladder).pack(side=tk.LEFT)
+        ttk.Checkbutton(ladder_frame, text="Dither palettes", variable=self.use_dithering).pack(side=tk.LEFT, padx=10)
+        
+        ttk.Label(settings_frame, text="Output Format:").grid(row=4, column=0, sticky=tk.W, pady=5)
+        format_frame = ttk.Frame(settings_frame)
+        format_frame.grid(row=4, column=1, sticky=tk.W, padx=5, pady=5)
+        ttk.Radiobutton(format_frame, text="PNG", variable=self.output_format, value="png").pack(side=tk.LEFT)
+        ttk.Radiobutton(format_frame, text="Smallest of PNG/WebP", variable=self.output_format,
+                        value="negotiate").pack(side=tk.LEFT, padx=10)
+        ttk.Checkbutton(format_frame, text="Allow lossy WebP/AVIF" if AVIF_AVAILABLE else "Allow lossy WebP",
+                        variable=self.allow_lossy).pack(side=tk.LEFT, padx=10)
+        ttk.Label(format_frame, text="Quality:").pack(side=tk.LEFT)
+        ttk.Spinbox(format_frame, from_=50, to=100, increment=1, textvariable=self.lossy_quality, width=5).pack(side=tk.LEFT, padx=5)
+        
         # Progress section
         progress_frame = ttk.LabelFrame(main_frame, text="Progress", padding="10")
         progress_frame.pack(fill=tk.X, pady=5)
@@ -84,7 +676,7 @@ class ImageOptimizerApp:
         button_frame.pack(fill=tk.X, pady=10)
         
         ttk.Button(button_frame, text="Process Images", command=self.start_processing).pack(side=tk.RIGHT, padx=5)
-        ttk.Button(button_frame, text="Exit", command=self.root.destroy).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Exit", command=self.close).pack(side=tk.RIGHT, padx=5)
     
     def browse_input_folder(self):
         folder = filedialog.askdirectory(title="Select Input Folder")
@@ -100,6 +692,10 @@ class ImageOptimizerApp:
         input_folder = self.input_folder.get()
         output_folder = self.output_folder.get()
         
+        if self.progress is not None and not self.progress.finished:
+            messagebox.showinfo("Info", "Images are still being processed.")
+            return
+        
         if not input_folder or not os.path.isdir(input_folder):
             messagebox.showerror("Error", "Please select a valid input folder.")
             return
@@ -116,15 +712,14 @@ class ImageOptimizerApp:
         except ValueError:
             messagebox.showerror("Error", "Please enter a valid number for the size limit.")
             return
-            
-        # Start processing in a separate thread to keep the UI responsive
-        threading.Thread(target=self.process_images, daemon=True).start()
-    
-    def process_images(self):
-        input_folder = self.input_folder.get()
-        output_folder = self.output_folder.get()
-        size_limit_mb = float(self.size_limit.get())
-        size_limit_bytes = size_limit_mb * 1024 * 1024  # Convert MB to bytes
+        
+        try:
+            lossy_quality = int(self.lossy_quality.get())
+            if not 1 <= lossy_quality <= 100:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Quality must be a whole number from 1 to 100.")
+            return
         
         # Get list of image files
         image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif']
@@ -140,147 +735,154 @@ class ImageOptimizerApp:
             self.status.set("No image files found in the input folder.")
             messagebox.showinfo("Info", "No image files found in the input folder.")
             return
-            
+        
         # Update UI
         self.status.set(f"Processing {total_files} images...")
         self.progress_value.set(0)
+        self.previewed = None
+        self.progress = ProgressAggregator(total_files)
         
-        # Process each file
-        for i, file in enumerate(image_files):
-            input_path = os.path.join(input_folder, file)
-            self.current_file.set(file)
-            
-            # Update preview
-            self.update_preview(input_path)
-            
-            # Get file size
-            file_size = os.path.getsize(input_path)
-            
-            # Get file extension without the dot
-            filename, _ = os.path.splitext(file)
-            output_path = os.path.join(output_folder, f"{filename}.png")
-            
-            # First convert to PNG with maximum compression to see if it's already under the limit
-            temp_output_path = os.path.join(output_folder, f"{filename}_temp.png")
-            
-            try:
-                # Get original image dimensions
-                img = Image.open(input_path)
-                orig_width, orig_height = img.size
-                img.close()
-                
-                # Initial conversion with high compression and no resize
-                cmd = [
-                    "ffmpeg",
-                    "-i", input_path,
-                    "-compression_level", "9",  # Maximum compression for PNG
-                    "-y",
-                    temp_output_path
-                ]
-                subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        # Dispatch from a separate thread to keep the UI responsive; the UI polls the progress
+        settings = {
+            "input_folder": input_folder,
+            "output_folder": output_folder,
+            "size_limit_bytes": size_limit * 1024 * 1024,  # Convert MB to bytes
+            "search_mode": self.search_mode.get(),
+            "engine": "ffmpeg" if self.engine.get() == "ffmpeg" and self.ffmpeg_available else "pillow",
+            "ladder": self.use_ladder.get(),
+            "dither": self.use_dithering.get(),
+            "formats": self.get_output_formats(),
+            "lossy_quality": lossy_quality,
+        }
+        threading.Thread(target=self.process_images, args=(image_files, settings, self.progress), daemon=True).start()
+        self.root.after(PROGRESS_POLL_MS, self.poll_progress)
+    
+    def get_output_formats(self):
+        """Candidate formats for the output, per the format settings"""
+        if self.output_format.get() != "negotiate":
+            return ("png",)
+        formats = ["png", "webp"]
+        if self.allow_lossy.get():
+            formats.append("webp-lossy")
+            if AVIF_AVAILABLE:
+                formats.append("avif")
+        return tuple(formats)
+    
+    def process_images(self, image_files, settings, progress):
+        """Dispatcher thread: feed files to a bounded process pool and record the results"""
+        negotiate = len(settings["formats"]) > 1
+        processes, threads = plan_workers(len(image_files), settings["engine"], negotiate=negotiate)
+        print(f"Processing {len(image_files)} images with {processes} processes "
+              f"({settings['engine']}, {'/'.join(settings['formats'])}, {threads} threads each)")
+        remaining = iter(image_files)
+        in_flight = {}
+        stems = output_stems(image_files)
+        report_path = os.path.join(settings["output_folder"], FORMAT_REPORT_NAME)
+        # Outputs the previous negotiated run wrote here; never the inputs, if the folders are one
+        owned_outputs = read_report_outputs(report_path)
+        if os.path.samefile(settings["input_folder"], settings["output_folder"]):
+            owned_outputs -= set(image_files)
+        
+        try:
+            # Spawned workers never inherit the Tk interpreter
+            with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+                self.pool = pool
+                self.in_flight = in_flight
                 
-                # Check if the output file is under the size limit after initial conversion
-                current_size = os.path.getsize(temp_output_path)
+                def submit_next():
+                    if self.closing.is_set():
+                        return False
+                    file = next(remaining, None)
+                    if file is None:
+                        return False
+                    output_path = os.path.join(settings["output_folder"], f"{stems[file]}.png")
+                    try:
+                        future = pool.submit(optimize_file, os.path.join(settings["input_folder"], file), output_path,
+                                             settings["size_limit_bytes"], settings["search_mode"],
+                                             settings["engine"], threads, settings["ladder"], settings["dither"],
+                                             settings["formats"], settings["lossy_quality"])
+                    except Exception as e:
+                        # e.g. BrokenProcessPool: the file is out of remaining and not in flight, so report it here
+                        progress.failed(file, e)
+                        raise
+                    in_flight[future] = file
+                    progress.started(file)
+                    return True
                 
-                if current_size <= size_limit_bytes:
-                    # If already under the limit, just rename the temp file
-                    self.status.set(f"Converting {file} (already under size limit)...")
-                    os.rename(temp_output_path, output_path)
-                else:
-                    # Need to resize with an iterative approach
-                    self.status.set(f"Resizing {file} to meet size limit...")
-                    
-                    # Try several resize factors until we get under the limit
-                    resize_factors = [0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.2, 0.1]
-                    success = False
-                    
-                    for factor in resize_factors:
-                        new_width = int(orig_width * factor)
-                        new_height = int(orig_height * factor)
-                        
-                        # Ensure dimensions are even (required by some FFmpeg filters)
-                        new_width = max(2, new_width - (new_width % 2))
-                        new_height = max(2, new_height - (new_height % 2))
-                        
-                        # Use FFmpeg to resize with high compression
-                        cmd = [
-                            "ffmpeg",
-                            "-i", input_path,
-                            "-vf", f"scale={new_width}:{new_height}",
-                            "-compression_level", "9",  # Maximum compression
-                            "-y",
-                            temp_output_path
-                        ]
-                        
-                        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-                        
-                        # Check if we're now under the limit
-                        current_size = os.path.getsize(temp_output_path)
-                        if current_size <= size_limit_bytes:
-                            os.rename(temp_output_path, output_path)
-                            success = True
-                            break
-                    
-                    # If we tried all factors and still couldn't get under the limit,
-                    # use the smallest resize with optimized compression options
-                    if not success:
-                        self.status.set(f"Using advanced compression for {file}...")
-                        
-                        # Last resort: most aggressive resize and optimized PNG settings
-                        smallest_width = max(2, int(orig_width * 0.1))
-                        smallest_height = max(2, int(orig_height * 0.1))
-                        
-                        # Ensure dimensions are even
-                        smallest_width = smallest_width - (smallest_width % 2)
-                        smallest_height = smallest_height - (smallest_height % 2)
-                        
-                        # Try pngquant optimization through FFmpeg
-                        cmd = [
-                            "ffmpeg",
-                            "-i", input_path,
-                            "-vf", f"scale={smallest_width}:{smallest_height}",
-                            "-compression_level", "9",
-                            "-pred", "mixed",    # Mixed prediction
-                            "-y",
-                            temp_output_path
-                        ]
-                        
-                        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-                        
-                        # If we still can't get under the limit, inform the user
-                        current_size = os.path.getsize(temp_output_path)
-                        if current_size <= size_limit_bytes:
-                            os.rename(temp_output_path, output_path)
+                # Only a few files per process are queued at a time, however big the folder
+                while len(in_flight) < processes * FILES_IN_FLIGHT_PER_PROCESS and submit_next():
+                    pass
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        file = in_flight.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            progress.failed(file, e)
                         else:
-                            # Image is still too large, but we'll use our best attempt
-                            os.rename(temp_output_path, output_path)
-                            self.status.set(f"Warning: {file} could not be reduced below the size limit")
-                            messagebox.showwarning("Size Limit Warning", 
-                                f"Image {file} could not be reduced below the size limit of {size_limit_mb}MB.\n"
-                                f"Best result: {current_size / (1024 * 1024):.2f}MB")
-            except Exception as e:
-                self.status.set(f"Error processing {file}: {str(e)}")
-                messagebox.showerror("Error", f"Error processing {file}: {str(e)}")
-                # Clean up temp file if it exists
-                if os.path.exists(temp_output_path):
-                    try:
-                        os.remove(temp_output_path)
-                    except:
-                        pass
-            
-            # Update progress
-            progress_percent = (i + 1) / total_files * 100
-            self.progress_value.set(progress_percent)
-            self.root.update_idletasks()
-            
-            # Clean up any leftover temp files
-            if os.path.exists(temp_output_path):
+                            progress.completed(file, result)
+                            remove_stale_outputs(result["output_path"], owned_outputs)
+                        submit_next()
+        except Exception as e:
+            # e.g. a worker process died and took the pool down
+            print(f"Processing stopped: {e}")
+            for file in list(in_flight.values()) + list(remaining):
+                progress.failed(file, e)
+        finally:
+            self.pool = None
+            if negotiate:
                 try:
-                    os.remove(temp_output_path)
-                except:
-                    pass
+                    write_format_report(report_path, progress.decisions)
+                    print(f"Format decisions written to {report_path}")
+                except OSError as e:
+                    print(f"Could not write {report_path}: {e}")
+            progress.finish()
+    
+    def close(self):
+        """Tk thread: drop the queued files, let the running ones finish, and close the window"""
+        self.closing.set()
+        pool = self.pool
+        if pool is not None:
+            print("Closing: cancelling queued images")
+            # Running files cannot be cancelled; their workers finish them before exiting
+            for future in list(self.in_flight):
+                future.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
+    
+    def poll_progress(self):
+        """Tk thread: show the aggregated progress, then report once the batch is done"""
+        snapshot = self.progress.snapshot()
+        total = snapshot["total"]
+        self.progress_value.set(snapshot["done"] / total * 100)
+        self.current_file.set(snapshot["current_file"])
+        
+        # The preview follows the latest output, at most once per interval
+        now = time.monotonic()
+        if snapshot["last_output"] != self.previewed and now - self.preview_time >= PREVIEW_INTERVAL:
+            self.previewed = snapshot["last_output"]
+            self.preview_time = now
+            self.update_preview(self.previewed)
+        
+        if not snapshot["finished"]:
+            self.status.set(f"Processed {snapshot['done']} of {total} images...")
+            self.root.after(PROGRESS_POLL_MS, self.poll_progress)
+            return
         
-        self.status.set("Processing complete!")
+        if snapshot["saved_bytes"] > 0:
+            self.status.set(f"Processing complete! Choosing formats saved "
+                            f"{snapshot['saved_bytes'] / (1024 * 1024):.2f}MB against PNG")
+        else:
+            self.status.set("Processing complete!")
+        if snapshot["errors"]:
+            messagebox.showerror("Error", f"{len(snapshot['errors'])} images could not be processed:\n" +
+                "\n".join(f"{file}: {error}" for file, error in snapshot["errors"][:10]))
+        if snapshot["oversized"]:
+            # Image is still too large, but we'll use our best attempt
+            messagebox.showwarning("Size Limit Warning",
+                f"{len(snapshot['oversized'])} images could not be reduced below the size limit of {self.size_limit.get()}MB.\n" +
+                "\n".join(f"{file}: {size / (1024 * 1024):.2f}MB" for file, size in snapshot["oversized"][:10]))
         messagebox.showinfo("Success", "All images have been processed!")
     
     def update_preview(self, image_path):
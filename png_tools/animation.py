@@ -0,0 +1,173 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
+from PIL import ImageSequence, GifImagePlugin, PngImagePlugin
+
+# GIF disposal methods (graphic control extension)
+GIF_DISPOSAL_KEEP = 1
+GIF_DISPOSAL_BACKGROUND = 2
+
+def is_animated(file_path):
+    """True when the file has more than one frame (animated GIF / APNG / multi-page TIFF)"""
+    with PILImage.open(file_path) as img:
+        return getattr(img, "n_frames", 1) > 1
+
+def read_frames(file_path):
+    """Decode every frame to RGBA; returns (frames, durations in ms, loop count)"""
+    frames = []
+    durations = []
+    with PILImage.open(file_path) as img:
+        loop = img.info.get("loop", 0)
+        for frame in ImageSequence.Iterator(img):
+            frames.append(frame.convert("RGBA"))
+            durations.append(frame.info.get("duration", img.info.get("duration", 100)) or 100)
+    return frames, durations, loop
+
+def sample_frames(frames, max_samples=8):
+    """Evenly spaced subset of frames (always including the first and last)"""
+    if len(frames) <= max_samples:
+        return list(frames)
+    picks = np.linspace(0, len(frames) - 1, max_samples).round().astype(int)
+    return [frames[i] for i in sorted(set(picks.tolist()))]
+
+def stack_opaque_pixels(frames, max_pixels=1 << 20):
+    """Opaque pixels of frames as one (n, 1) RGB image, strided down to about max_pixels"""
+    pixels = []
+    for frame in frames:
+        rgba = np.asarray(frame)
+        pixels.append(rgba[rgba[..., 3] >= 128][:, :3])
+    pixels = np.concatenate(pixels) if pixels else np.zeros((0, 3), dtype=np.uint8)
+    if len(pixels) == 0:
+        # Fully transparent animation: any color will do
+        pixels = np.zeros((1, 3), dtype=np.uint8)
+
+    step = max(1, len(pixels) // max_pixels)
+    return PILImage.fromarray(np.ascontiguousarray(pixels[::step, None, :]), "RGB")
+
+def map_frames(frames, palette_img, transparent_index, dither=0, max_workers=None):
+    """
+    Map RGBA frames onto palette_img in parallel; returns one uint8 index array per frame.
+    palette_img must hold only the real colors, so transparent_index (one past the last
+    color) is never picked by the quantizer and only marks alpha < 128 pixels.
+    """
+    def map_one(frame):
+        indices = np.array(frame.convert("RGB").quantize(palette=palette_img, dither=dither))
+        indices[np.asarray(frame)[..., 3] < 128] = transparent_index
+        return indices
+
+    max_workers = max_workers or min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="frames") as executor:
+        return list(executor.map(map_one, frames))
+
+def _bbox(mask):
+    """(left, top, right, bottom) of the True pixels of a 2D mask, or None"""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+def _union(box_a, box_b):
+    if box_a is None:
+        return box_b
+    if box_b is None:
+        return box_a
+    return min(box_a[0], box_b[0]), min(box_a[1], box_b[1]), max(box_a[2], box_b[2]), max(box_a[3], box_b[3])
+
+def plan_frame_deltas(index_frames, durations, transparent_index):
+    """
+    Turn full index frames into delta frames for a "keep previous frame" canvas.
+    Unchanged pixels become transparent_index and each frame is cropped to the box of
+    what changed; frames identical to the previous one are merged into its duration.
+
+    A transparent pixel can't erase an opaque one on a kept canvas, so when a frame
+    turns pixels transparent, the frame before it is disposed to background (its box
+    grows to cover everything opaque) and this frame is written in full over the
+    cleared canvas.
+
+    Returns a list of dicts: data (full-size index array), box, duration, disposal.
+    """
+    height, width = index_frames[0].shape
+    plan = [{
+        "data": index_frames[0],
+        "box": (0, 0, width, height),
+        "duration": durations[0],
+        "disposal": GIF_DISPOSAL_KEEP,
+    }]
+
+    for i in range(1, len(index_frames)):
+        previous, current = index_frames[i - 1], index_frames[i]
+        changed = previous != current
+        if not changed.any():
+            plan[-1]["duration"] += durations[i]
+            continue
+
+        if (changed & (current == transparent_index)).any():
+            # Clear the canvas with the previous frame, then draw this one in full
+            plan[-1]["disposal"] = GIF_DISPOSAL_BACKGROUND
+            plan[-1]["box"] = _union(plan[-1]["box"], _bbox(previous != transparent_index))
+            data = current
+            box = _bbox(current != transparent_index) or (0, 0, 1, 1)
+        else:
+            data = np.where(changed, current, np.uint8(transparent_index)).astype(np.uint8)
+            box = _bbox(changed)
+
+        plan.append({"data": data, "box": box, "duration": durations[i], "disposal": GIF_DISPOSAL_KEEP})
+
+    return plan
+
+def delta_coverage(plan, size):
+    """Share of canvas pixels actually written across all frames (1.0 = naive full frames)"""
+    written = sum((box[2] - box[0]) * (box[3] - box[1]) for box in (entry["box"] for entry in plan))
+    return written / (len(plan) * size[0] * size[1])
+
+def _frame_image(data, palette_data):
+    frame = PILImage.fromarray(np.ascontiguousarray(data), "P")
+    frame.putpalette(palette_data)
+    return frame
+
+def encode_indexed_gif(plan, palette_data, transparent_index, loop=0):
+    """Encode a frame plan as GIF bytes, writing each frame only over its own box"""
+    first = _frame_image(plan[0]["data"], palette_data)
+    header, _ = GifImagePlugin.getheader(first, info={"loop": loop, "transparency": transparent_index})
+    chunks = list(header)
+
+    for entry in plan:
+        left, top, right, bottom = entry["box"]
+        frame = _frame_image(entry["data"][top:bottom, left:right], palette_data)
+        chunks.extend(GifImagePlugin.getdata(
+            frame, (left, top),
+            duration=entry["duration"],
+            disposal=entry["disposal"],
+            transparency=transparent_index,
+        ))
+
+    chunks.append(b";")
+    return b"".join(chunks)
+
+def encode_indexed_apng(plan, index_frames, durations, palette_data, transparent_index, loop=0):
+    """
+    Encode as APNG. Delta frames are blended OVER the kept canvas; if the plan needs
+    a canvas clear anywhere, the full frames are written with SOURCE blending instead
+    (APNG frames can then replace alpha directly). Pillow crops every frame to the box
+    that differs from the previous one.
+    """
+    uses_clear = any(entry["disposal"] == GIF_DISPOSAL_BACKGROUND for entry in plan)
+    if uses_clear:
+        frames = [_frame_image(data, palette_data) for data in index_frames]
+        blend = PngImagePlugin.Blend.OP_SOURCE
+        frame_durations = list(durations)
+    else:
+        frames = [_frame_image(entry["data"], palette_data) for entry in plan]
+        blend = [PngImagePlugin.Blend.OP_SOURCE] + [PngImagePlugin.Blend.OP_OVER] * (len(frames) - 1)
+        frame_durations = [entry["duration"] for entry in plan]
+
+    buffer = io.BytesIO()
+    frames[0].save(
+        buffer, format="PNG", save_all=True, append_images=frames[1:],
+        duration=frame_durations, loop=loop, transparency=transparent_index,
+        disposal=PngImagePlugin.Disposal.OP_NONE, blend=blend,
+    )
+    return buffer.getvalue()
@@ -0,0 +1,201 @@
+import os
+import json
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
+from palette_tools import pack_rgb, unpack_rgb, find_exact_colors, palette_to_list
+from image_io import encode_image, write_file_atomic
+
+class SkylinePacker:
+    """Bottom-left skyline rectangle packer for one fixed-size atlas page"""
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        # Skyline segments as [x, y, width], left to right, covering the whole page width
+        self.skyline = [[0, 0, width]]
+        self.used_width = 0
+        self.used_height = 0
+
+    def _fit(self, index, width, height):
+        """Top y if a width x height rect fits with its left edge on segment index, else None"""
+        x = self.skyline[index][0]
+        if x + width > self.width:
+            return None
+        # Candidates always start on a segment, so whole segments are consumed
+        y = 0
+        remaining = width
+        while remaining > 0:
+            _, segment_y, segment_width = self.skyline[index]
+            y = max(y, segment_y)
+            if y + height > self.height:
+                return None
+            remaining -= segment_width
+            index += 1
+        return y
+
+    def insert(self, width, height):
+        """Place a rect and return its (x, y), or None when the page is full"""
+        best = None
+        for i, (x, _, _) in enumerate(self.skyline):
+            y = self._fit(i, width, height)
+            if y is not None and (best is None or (y + height, x) < (best[1] + height, best[0])):
+                best = (x, y, i)
+        if best is None:
+            return None
+
+        x, y, index = best
+        self._raise_skyline(index, x, y + height, width)
+        self.used_width = max(self.used_width, x + width)
+        self.used_height = max(self.used_height, y + height)
+        return x, y
+
+    def _raise_skyline(self, index, x, top, width):
+        """Insert the new segment and shrink or drop the ones it now covers"""
+        self.skyline.insert(index, [x, top, width])
+        i = index + 1
+        while i < len(self.skyline):
+            segment = self.skyline[i]
+            covered = x + width - segment[0]
+            if covered <= 0:
+                break
+            if covered < segment[2]:
+                segment[0] += covered
+                segment[2] -= covered
+                break
+            del self.skyline[i]
+
+        # Merge neighbours at the same height
+        i = 0
+        while i < len(self.skyline) - 1:
+            if self.skyline[i][1] == self.skyline[i + 1][1]:
+                self.skyline[i][2] += self.skyline[i + 1][2]
+                del self.skyline[i + 1]
+            else:
+                i += 1
+
+def pack_rects(sizes, page_size=2048, padding=1):
+    """
+    Pack (width, height) rects into as many page_size pages as needed, tallest first.
+    Returns (placements, pages): placements[i] = (page, x, y), pages = list of packers.
+    """
+    order = sorted(range(len(sizes)), key=lambda i: (sizes[i][1], sizes[i][0]), reverse=True)
+    placements = [None] * len(sizes)
+    pages = []
+
+    for i in order:
+        width, height = sizes[i][0] + padding, sizes[i][1] + padding
+        if width > page_size or height > page_size:
+            raise ValueError(f"Sprite of {sizes[i][0]}x{sizes[i][1]} does not fit a {page_size}px atlas")
+
+        # Earlier pages first, so late small sprites fill the gaps
+        for page_index, page in enumerate(pages):
+            position = page.insert(width, height)
+            if position is not None:
+                break
+        else:
+            pages.append(SkylinePacker(page_size, page_size))
+            page_index = len(pages) - 1
+            position = pages[-1].insert(width, height)
+
+        placements[i] = (page_index, position[0], position[1])
+
+    return placements, pages
+
+def build_shared_palette(images, max_colors=255):
+    """Exact union of the sprite colors when it fits, else one quantized palette over all sprites"""
+    packed = np.concatenate([pack_rgb(np.asarray(img.convert("RGB"))).ravel() for img in images])
+    colors = find_exact_colors(packed, max_colors)
+    if colors is not None:
+        return palette_to_list(colors)
+
+    sample = packed[::max(1, packed.size // (1 << 20))]
+    sample_img = PILImage.fromarray(unpack_rgb(sample)[:, None, :], "RGB")
+    return sample_img.quantize(colors=max_colors, dither=0).getpalette()[:max_colors * 3]
+
+def sprite_indices(img, palette_img, palette_data, transparent_index):
+    """Index array of a sprite on the atlas palette; sprites already on it are copied as is"""
+    if img.mode == 'P' and img.getpalette()[:len(palette_data)] == palette_data:
+        indices = np.array(img)
+    else:
+        indices = np.array(img.convert("RGB").quantize(palette=palette_img, dither=0))
+
+    transparency = img.info.get("transparency")
+    if img.mode == 'P' and isinstance(transparency, int):
+        indices[np.asarray(img) == transparency] = transparent_index
+    elif img.mode in ("RGBA", "LA", "PA"):
+        indices[np.asarray(img.getchannel("A")) < 128] = transparent_index
+    return indices
+
+def build_atlases(image_paths, output_folder, name="atlas", palette_colors=None, page_size=2048, padding=1):
+    """
+    Pack indexed sprites into <name>_<n>.png pages sharing one palette and write <name>.json
+    with every frame rectangle. palette_colors is an optional list of RGB tuples (the batch
+    palette); one extra palette entry marks the transparent background.
+    Returns the list of written paths (pages first, then the index).
+    """
+    images = [PILImage.open(path) for path in image_paths]
+    try:
+        for img in images:
+            img.load()
+
+        if palette_colors:
+            palette_data = [channel for color in palette_colors[:255] for channel in color]
+        else:
+            palette_data = build_shared_palette(images)
+        transparent_index = len(palette_data) // 3
+        palette_img = PILImage.new('P', (1, 1))
+        palette_img.putpalette(palette_data)
+
+        placements, pages = pack_rects([img.size for img in images], page_size, padding)
+
+        # Crop each page to what was used, then copy sprite indices into it
+        page_arrays = [np.full((page.used_height, page.used_width), transparent_index, dtype=np.uint8)
+                       for page in pages]
+        frames = {}
+        for path, img, (page_index, x, y) in zip(image_paths, images, placements):
+            page_arrays[page_index][y:y + img.height, x:x + img.width] = sprite_indices(
+                img, palette_img, palette_data, transparent_index)
+            frame_name, _ = os.path.splitext(os.path.basename(path))
+            frames[frame_name] = {"atlas": page_index, "x": x, "y": y, "w": img.width, "h": img.height}
+    finally:
+        for img in images:
+            img.close()
+
+    output_paths = []
+    atlases = []
+    for page_index, indices in enumerate(page_arrays):
+        page_img = PILImage.fromarray(indices, 'P')
+        page_img.putpalette(palette_data + [0, 0, 0])
+        page_path = os.path.join(output_folder, f"{name}_{page_index}.png")
+        write_file_atomic(encode_image(page_img, page_path, transparency=transparent_index, optimize=True), page_path)
+        atlases.append({"file": os.path.basename(page_path), "width": page_img.width, "height": page_img.height})
+        output_paths.append(page_path)
+
+    index_path = os.path.join(output_folder, f"{name}.json")
+    index = {"atlases": atlases, "palette_size": transparent_index + 1,
+             "transparent_index": transparent_index, "frames": frames}
+    write_file_atomic(json.dumps(index, indent=1).encode("utf-8"), index_path)
+    output_paths.append(index_path)
+
+    print(f"Packed {len(frames)} sprites into {len(atlases)} atlas page(s) in {output_folder}")
+    return output_paths
+
+class AtlasPackerThread(QThread):
+    """Runs build_atlases off the UI thread"""
+    processing_complete = pyqtSignal(list)
+
+    def __init__(self, image_paths, output_folder, palette_colors=None, page_size=2048):
+        super().__init__()
+        self.image_paths = image_paths
+        self.output_folder = output_folder
+        self.palette_colors = palette_colors
+        self.page_size = page_size
+
+    def run(self):
+        try:
+            output_paths = build_atlases(self.image_paths, self.output_folder,
+                                         palette_colors=self.palette_colors, page_size=self.page_size)
+        except Exception as e:
+            print(f"Error building atlas: {e}")
+            output_paths = []
+        self.processing_complete.emit(output_paths)
@@ -0,0 +1,91 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
+
+# Bytes per pixel for PIL modes we commonly decode
+MODE_BYTES = {"1": 1, "L": 1, "P": 1, "LA": 2, "PA": 2, "I;16": 2, "RGB": 3, "YCbCr": 3,
+              "LAB": 3, "HSV": 3, "RGBA": 4, "RGBX": 4, "CMYK": 4, "I": 4, "F": 4}
+
+def read_image_header(file_path):
+    """Return (width, height, mode) without decoding the pixel data"""
+    with PILImage.open(file_path) as img:
+        return img.width, img.height, img.mode
+
+def estimate_peak_memory(source_size, source_mode, working_size, upscale_size=None, upscale_dithering=False):
+    """
+    Rough upper bound in bytes for one indexing job:
+    decoded source + resized copy + RGB working copy + packed uint32 colors (exact-palette check)
+    + quantizer scratch + indexed result + upscaled result (RGB copies when dithering on upscale).
+    """
+    src_pixels = source_size[0] * source_size[1]
+    work_pixels = working_size[0] * working_size[1]
+
+    total = src_pixels * MODE_BYTES.get(source_mode, 4)
+    if working_size != source_size:
+        total += work_pixels * MODE_BYTES.get(source_mode, 4)
+    total += work_pixels * (3 + 4 + 4 + 1)
+
+    if upscale_size:
+        up_pixels = upscale_size[0] * upscale_size[1]
+        total += up_pixels * (3 + 3 + 1 if upscale_dithering else 1)
+        # The encoder holds roughly one more copy of the final frame
+        total += up_pixels
+    else:
+        total += work_pixels
+
+    return int(total)
+
+class MemoryBudgetScheduler:
+    """
+    Runs jobs on a thread pool, admitting each job only while the sum of running estimates
+    fits in the budget. Jobs are ordered largest-first and admitted in that order, so giant
+    files run a few at a time and the small ones at the end fan out across all workers.
+    A job larger than the whole budget still runs, but alone.
+    """
+    def __init__(self, budget_bytes, max_workers=None):
+        self.budget_bytes = budget_bytes
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._in_use = 0
+        self._running = 0
+        self._condition = threading.Condition()
+
+    def _admit(self, estimate):
+        with self._condition:
+            # Wait until there's room, or nothing else is running (oversized jobs run solo)
+            self._condition.wait_for(lambda: self._running == 0 or (
+                self._running < self.max_workers and self._in_use + estimate <= self.budget_bytes))
+            self._in_use += estimate
+            self._running += 1
+
+    def _release(self, estimate):
+        with self._condition:
+            self._in_use -= estimate
+            self._running -= 1
+            self._condition.notify_all()
+
+    def run(self, jobs, worker):
+        """
+        jobs: list of (key, estimated_bytes); worker(key) is called once per job.
+        Returns {key: worker result}; exceptions from worker propagate per job.
+        """
+        ordered = sorted(jobs, key=lambda job: job[1], reverse=True)
+        results = {}
+
+        def run_job(key, estimate):
+            try:
+                return worker(key)
+            finally:
+                self._release(estimate)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch") as executor:
+            futures = {}
+            for key, estimate in ordered:
+                # Admission happens here, on the dispatching thread, so order is kept
+                self._admit(estimate)
+                futures[key] = executor.submit(run_job, key, estimate)
+
+            for key, future in futures.items():
+                results[key] = future.result()
+
+        return results
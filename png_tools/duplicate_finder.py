@@ -0,0 +1,156 @@
+import os
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
+
+# Side of the grayscale proxy the perceptual hashes are computed from
+PROXY_SIZE = 32
+
+def _dct_matrix(size):
+    """Orthonormal DCT-II basis, so a 2D DCT is two matrix products"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+_DCT = _dct_matrix(PROXY_SIZE)
+
+# Popcount of every byte value, for NumPy versions without bitwise_count
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def load_fingerprint(file_path):
+    """Decode once; return (pixel content hash, 32x32 grayscale proxy)"""
+    with PILImage.open(file_path) as img:
+        img.load()
+        # Hash what gets processed, so re-saved or renamed copies still match
+        digest = hashlib.sha1(f"{img.mode}{img.size}".encode())
+        digest.update(img.tobytes())
+        if img.palette is not None:
+            # For palette images the pixels are only indices; the colors live in the palette
+            digest.update(img.palette.mode.encode())
+            digest.update(img.palette.tobytes())
+        digest.update(repr(img.info.get("transparency")).encode())
+        if getattr(img, "n_frames", 1) > 1:
+            # Animations can share a first frame, so the remaining frames go in via the file
+            with open(file_path, "rb") as f:
+                digest.update(f.read())
+        proxy = img.convert("L").resize((PROXY_SIZE, PROXY_SIZE), PILImage.BOX)
+    return digest.hexdigest(), np.asarray(proxy, dtype=np.float32)
+
+def perceptual_hashes(proxies):
+    """
+    dHash and pHash for a stack of (n, 32, 32) grayscale proxies, both as (n, 8) uint8
+    arrays of packed bits. Computed for the whole stack at once.
+    """
+    # dHash: is each pixel brighter than its right neighbour, on a 9x8 thumbnail
+    blocks = proxies.reshape(len(proxies), 8, 4, PROXY_SIZE)
+    rows = blocks.mean(axis=2)
+    columns = np.linspace(0, PROXY_SIZE - 1, 9).round().astype(int)
+    thumb = rows[:, :, columns]
+    dhash = np.packbits((thumb[:, :, 1:] > thumb[:, :, :-1]).reshape(len(proxies), 64), axis=1)
+
+    # pHash: low 8x8 DCT frequencies compared with their median (DC term left out)
+    coefficients = (_DCT @ proxies @ _DCT.T)[:, :8, :8].reshape(len(proxies), 64)
+    median = np.median(coefficients[:, 1:], axis=1, keepdims=True)
+    phash = np.packbits(coefficients > median, axis=1)
+    return dhash, phash
+
+def hamming_rows(hashes, start, stop):
+    """Hamming distances from hashes[start:stop] to every hash, as a (stop - start, n) array"""
+    # One 64-bit XOR per pair instead of eight byte XORs
+    words = np.ascontiguousarray(hashes).view(np.uint64).ravel()
+    xor = words[start:stop, None] ^ words[None, :]
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor).astype(np.int32)
+    return _POPCOUNT[xor[..., None].view(np.uint8)].sum(axis=-1, dtype=np.int32)
+
+def near_duplicate_pairs(dhash, phash, threshold, chunk_rows=256):
+    """(a, b, distance) index pairs, a < b, whose dHash and pHash both differ by <= threshold bits"""
+    pairs = []
+    # Row chunks keep the XOR table at chunk_rows * n words
+    for start in range(0, len(dhash), chunk_rows):
+        stop = min(start + chunk_rows, len(dhash))
+        distance = np.maximum(hamming_rows(dhash, start, stop), hamming_rows(phash, start, stop))
+        rows, columns = np.nonzero(distance <= threshold)
+        for row, column in zip(rows, columns):
+            if start + row < column:
+                pairs.append((int(start + row), int(column), int(distance[row, column])))
+    return pairs
+
+def find_duplicates(file_paths, near_threshold=6, max_workers=None):
+    """
+    Group exact duplicates (same decoded pixels) and report near duplicates (perceptual
+    hashes within near_threshold bits, e.g. the same picture at another size).
+    Returns (unique paths, {kept path: [duplicate paths]}, [(path_a, path_b, distance)]).
+    """
+    max_workers = max_workers or min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hash") as executor:
+        fingerprints = dict(zip(file_paths, executor.map(_safe_fingerprint, file_paths)))
+
+    unique = []
+    duplicates = {}
+    first_by_digest = {}
+    for file_path, fingerprint in fingerprints.items():
+        if fingerprint is None:
+            unique.append(file_path)  # Unreadable: let the pipeline report the error
+            continue
+        kept = first_by_digest.setdefault(fingerprint[0], file_path)
+        if kept == file_path:
+            unique.append(file_path)
+        else:
+            duplicates.setdefault(kept, []).append(file_path)
+
+    # Near duplicates among the files that are left, on both hashes
+    hashed = [path for path in unique if fingerprints[path] is not None]
+    near = []
+    if len(hashed) > 1:
+        dhash, phash = perceptual_hashes(np.stack([fingerprints[path][1] for path in hashed]))
+        for a, b, distance in near_duplicate_pairs(dhash, phash, near_threshold):
+            near.append((hashed[a], hashed[b], distance))
+
+    return unique, duplicates, near
+
+def _safe_fingerprint(file_path):
+    try:
+        return load_fingerprint(file_path)
+    except Exception as e:
+        print(f"Could not fingerprint {file_path}: {e}")
+        return None
+
+def _path_key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+def duplicate_output_path(output_path, kept_name, duplicate_name, taken=()):
+    """
+    Where a duplicate's copy of output_path goes: the kept source name swapped for the
+    duplicate's. Same-named inputs (a.png and a.bmp, or sprite.png from two folders) would
+    land on the output itself or another taken path, so those get a counter instead.
+    """
+    output_dir, output_name = os.path.split(output_path)
+    suffix = output_name[len(kept_name):]
+    taken = {_path_key(path) for path in taken} | {_path_key(output_path)}
+    target_path = os.path.join(output_dir, duplicate_name + suffix)
+    counter = 1
+    while _path_key(target_path) in taken:
+        target_path = os.path.join(output_dir, f"{duplicate_name}_{counter}{suffix}")
+        counter += 1
+    return target_path
+
+def link_or_copy(source_path, target_path, hard_link=True):
+    """Give a duplicate input its own output: a hard link when possible, else a copy"""
+    if _path_key(source_path) == _path_key(target_path):
+        # Removing the target would delete the only copy
+        raise ValueError(f"Duplicate output would overwrite its source: {target_path}")
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    if hard_link:
+        try:
+            os.link(source_path, target_path)
+            return target_path
+        except OSError:
+            pass  # Different filesystem or no link support
+    shutil.copy2(source_path, target_path)
+    return target_path
@@ -0,0 +1,25 @@
+import io
+import os
+import threading
+from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
+
+def encode_image(img, output_path, **save_kwargs):
+    """Encode an image in memory using the format implied by output_path"""
+    _, ext = os.path.splitext(output_path)
+    save_kwargs.setdefault("format", PILImage.registered_extensions().get(ext.lower(), "PNG"))
+
+    buffer = io.BytesIO()
+    img.save(buffer, **save_kwargs)
+    return buffer.getvalue()
+
+def write_file_atomic(data, output_path):
+    """Write via a temp file in the target folder so readers never see a partial file"""
+    # Unique per thread so parallel workers never share a temp file
+    temp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
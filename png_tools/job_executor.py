@@ -0,0 +1,169 @@
+import io
+import os
+import heapq
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
+from source_cache import DecodedSourceCache
+from palette_tools import srgb_to_oklab
+
+# Lower runs first; interactive work (convert, render, transparency) jumps ahead of batches
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+PRIORITY_IDLE = 20
+
+class PaletteCache:
+    """Thread-safe LRU of palette images keyed by their colors, shared by every job"""
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, colors, build):
+        key = tuple(tuple(int(c) for c in color) for color in colors)
+        with self._lock:
+            palette_img = self._entries.get(key)
+            if palette_img is not None:
+                self._entries.move_to_end(key)
+                return palette_img
+
+        palette_img = build()
+        # Load now, so threads quantizing against it later only ever read it
+        palette_img.load()
+        with self._lock:
+            self._entries[key] = palette_img
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return palette_img
+
+def warm_up():
+    """Touch Pillow's quantizer and PNG encoder and the OKLab tables once, so the first real job starts hot"""
+    img = PILImage.new("RGB", (16, 16), (128, 64, 32))
+    img.quantize(colors=4).save(io.BytesIO(), "PNG")
+    srgb_to_oklab(np.zeros((1, 3), dtype=np.uint8))
+
+class PriorityExecutor:
+    """
+    App-wide pool of persistent worker threads taking typed jobs by priority. A job is a
+    QThread-style worker (its run() is called on a warm thread; its signals still reach
+    the UI as queued calls) or a plain callable. The first reserved_interactive workers
+    only take interactive jobs, so a preview never waits behind a long batch.
+    """
+    def __init__(self, max_workers=None, reserved_interactive=1):
+        self.max_workers = max_workers or max(2, min(4, os.cpu_count() or 1))
+        # Caches that outlive any single job
+        self.source_cache = DecodedSourceCache(max_bytes=512 * 1024 * 1024)
+        self.palette_cache = PaletteCache()
+
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._shutdown = False
+        # Set by shutdown(); handed to jobs that have a cancel_event attribute so long
+        # batches can stop between files
+        self.cancel_event = threading.Event()
+        # Worker name -> kind of the job it is running (guarded by _condition)
+        self._running = {}
+
+        self._workers = []
+        for i in range(reserved_interactive + self.max_workers):
+            worker = threading.Thread(target=self._worker_loop, args=(i < reserved_interactive,),
+                                      name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        self.submit("warm-up", warm_up, PRIORITY_IDLE)
+        print(f"PriorityExecutor started with {self.max_workers} workers (+{reserved_interactive} interactive)")
+
+    def submit(self, kind, job, priority=PRIORITY_BATCH):
+        """Queue a job; returns a Future that resolves when its run() returns"""
+        future = Future()
+        run = job.run if hasattr(job, "run") else job
+        if hasattr(job, "cancel_event"):
+            job.cancel_event = self.cancel_event
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Executor has been shut down")
+            heapq.heappush(self._queue, (priority, next(self._sequence), kind, run, future))
+            self._condition.notify_all()
+        return future
+
+    def running(self):
+        """Snapshot of worker name -> kind of the job it is running"""
+        with self._condition:
+            return dict(self._running)
+
+    def pending(self):
+        """Number of queued jobs not yet picked up"""
+        with self._condition:
+            return len(self._queue)
+
+    def _take(self, interactive_only):
+        """Pop the next job this worker may run (caller holds the lock)"""
+        if not self._queue:
+            return None
+        # The heap top is the most urgent job, so if it is not interactive none is
+        if interactive_only and self._queue[0][0] > PRIORITY_INTERACTIVE:
+            return None
+        return heapq.heappop(self._queue)
+
+    def _worker_loop(self, interactive_only):
+        name = threading.current_thread().name
+        while True:
+            with self._condition:
+                item = self._take(interactive_only)
+                while item is None and not self._shutdown:
+                    self._condition.wait()
+                    item = self._take(interactive_only)
+                if item is None:
+                    return
+
+                _, _, kind, run, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._running[name] = kind
+            try:
+                future.set_result(run())
+            except BaseException as e:
+                print(f"{kind} job failed: {e}")
+                future.set_exception(e)
+            finally:
+                with self._condition:
+                    self._running.pop(name, None)
+
+    def shutdown(self, wait=True):
+        """
+        Cancel queued jobs, tell running ones to stop (cancel_event) and stop the workers;
+        with wait, returns once every running job has reached its next check and returned
+        """
+        self.cancel_event.set()
+        with self._condition:
+            self._shutdown = True
+            queued, self._queue = self._queue, []
+            self._condition.notify_all()
+        for item in queued:
+            item[-1].cancel()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """The application-wide executor, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = PriorityExecutor()
+        return _executor
+
+def shutdown_executor(wait=True):
+    """Stop the application-wide executor (at application exit)"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait)
@@ -0,0 +1,125 @@
+import numpy as np
+from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
+from palette_tools import srgb_to_oklab
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None  # Falls back to the NumPy solver below
+
+def palette_cost_matrix(colors_a, colors_b):
+    """(m, n) squared OKLab distances between two (k, 3) uint8 color lists"""
+    lab_a = srgb_to_oklab(np.asarray(colors_a, dtype=np.uint8))
+    lab_b = srgb_to_oklab(np.asarray(colors_b, dtype=np.uint8))
+    return ((lab_a[:, None, :] - lab_b[None, :, :]) ** 2).sum(axis=-1)
+
+def _hungarian(cost):
+    """
+    Minimum-cost assignment of every row of an (n, m) matrix, n <= m, to a distinct column
+    (shortest augmenting paths with potentials, O(n^2 m); the inner scan is vectorized).
+    Returns (rows, columns) like scipy's linear_sum_assignment.
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    # match[j] = 1-based row assigned to column j (column 0 is the augmenting root)
+    match = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        min_slack = np.full(m + 1, np.inf)
+        visited = np.zeros(m + 1, dtype=bool)
+        while True:
+            visited[j0] = True
+            i0 = match[j0]
+            free = ~visited[1:]
+            slack = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (slack < min_slack[1:])
+            min_slack[1:][better] = slack[better]
+            way[1:][better] = j0
+
+            candidates = np.where(free, min_slack[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[match[visited]] += delta
+            v[visited] -= delta
+            min_slack[1:][free] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+
+        # Flip the augmenting path back to the root
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+
+    columns = np.flatnonzero(match[1:])
+    rows = match[1:][columns] - 1
+    order = np.argsort(rows)
+    return rows[order], columns[order]
+
+def assign(cost):
+    """Optimal one-to-one assignment for a rectangular cost matrix: (rows, columns)"""
+    if linear_sum_assignment is not None:
+        return linear_sum_assignment(cost)
+    if cost.shape[0] <= cost.shape[1]:
+        return _hungarian(cost)
+    columns, rows = _hungarian(cost.T)
+    order = np.argsort(rows)
+    return rows[order], columns[order]
+
+def match_palette(colors, reference_colors):
+    """
+    For each of colors, the position in reference_colors it should take: an optimal
+    one-to-one OKLab assignment, with any colors left over (more colors than the
+    reference) sent to their nearest reference entry.
+    """
+    cost = palette_cost_matrix(colors, reference_colors)
+    targets = np.argmin(cost, axis=1)
+    rows, columns = assign(cost)
+    targets[rows] = columns
+    return targets
+
+def align_to_reference(img_indexed, reference_palette):
+    """
+    Remap a 'P' image so its colors sit at the indices of the matching reference colors.
+    reference_palette is a list of (index, (r, g, b)); the transparent index is left out
+    of the match and moved to a slot the reference does not use.
+    """
+    indices = np.asarray(img_indexed)
+    palette = np.array(img_indexed.getpalette(), dtype=np.uint8).reshape(-1, 3)
+    palette = np.concatenate([palette, np.zeros((256 - len(palette), 3), dtype=np.uint8)])
+    reference_indices = np.array([int(idx) for idx, _ in reference_palette], dtype=np.int64)
+    reference_colors = np.array([color for _, color in reference_palette], dtype=np.uint8)
+
+    transparency = img_indexed.info.get("transparency")
+    if not isinstance(transparency, int):
+        transparency = None
+    used = np.flatnonzero(np.bincount(indices.ravel(), minlength=256))
+    used = used[used != transparency]
+
+    lut = np.arange(256, dtype=np.uint8)
+    new_palette = palette.copy()
+    # Reference slots keep the reference color unless a file color is assigned to them
+    new_palette[reference_indices] = reference_colors
+
+    targets = reference_indices[match_palette(palette[used], reference_colors)]
+    lut[used] = targets
+    # Where several colors merge into one slot, the most frequent keeps its color
+    counts = np.bincount(indices.ravel(), minlength=256)[used]
+    for color, target in zip(palette[used][np.argsort(counts)], targets[np.argsort(counts)]):
+        new_palette[target] = color
+
+    if transparency is not None:
+        free = np.setdiff1d(np.arange(256), reference_indices)
+        if free.size:
+            lut[transparency] = free[0]
+            new_palette[free[0]] = palette[transparency]
+
+    result = PILImage.fromarray(lut[indices], 'P')
+    result.putpalette(new_palette.ravel().tolist())
+    if transparency is not None:
+        result.info["transparency"] = int(lut[transparency])
+    return result
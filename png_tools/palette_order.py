@@ -0,0 +1,138 @@
+import numpy as np
+from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
+from image_io import encode_image
+
+PALETTE_ORDERS = ["luminance", "adjacency"]
+
+def adjacency_counts(indices):
+    """Symmetric 256x256 count of horizontally and vertically neighbouring index pairs"""
+    values = indices.astype(np.int32)
+    pairs = np.concatenate([
+        (values[:, :-1] * 256 + values[:, 1:]).ravel(),
+        (values[:-1, :] * 256 + values[1:, :]).ravel(),
+    ])
+    counts = np.bincount(pairs, minlength=256 * 256).reshape(256, 256)
+    counts = counts + counts.T
+    # An index next to itself says nothing about where to put it
+    np.fill_diagonal(counts, 0)
+    return counts
+
+def luminance_order(palette_rgb, entries):
+    """entries sorted dark to light"""
+    luma = palette_rgb.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return entries[np.argsort(luma[entries], kind="stable")]
+
+def adjacency_order(indices, entries, frequencies):
+    """
+    Greedy nearest-neighbour walk over the adjacency graph: start at the most frequent
+    entry, then always step to the unvisited entry that borders the current one most
+    often (ties go to the more frequent entry). Colors that touch end up with close
+    indices, which keeps PNG filter residuals small.
+    """
+    if len(entries) == 0:
+        return entries
+    counts = adjacency_counts(indices)
+    remaining = list(entries[np.argsort(-frequencies[entries], kind="stable")])
+    order = [remaining.pop(0)]
+
+    while remaining:
+        candidates = np.array(remaining)
+        scores = counts[order[-1], candidates]
+        best = int(np.lexsort((-frequencies[candidates], -scores))[0])
+        order.append(remaining.pop(best))
+
+    return np.array(order)
+
+def reorder_palette(img_indexed, method="adjacency", pinned_indices=None):
+    """
+    Return a copy of a 'P' image with its palette permuted by method (None keeps the
+    current order, so only the packing below applies) and the index buffer
+    remapped through one lookup table. Pinned indices keep their slot; used entries are
+    packed into the lowest free slots (a transparent entry first, so tRNS stays one byte)
+    and the palette is cut after the last one. Pillow writes palette PNGs unfiltered, so
+    the saving comes from the shorter PLTE/tRNS and the 1/2/4-bit depths a short palette
+    allows, where the order also decides which indices share a byte.
+    """
+    indices = np.asarray(img_indexed)
+    palette = np.array(img_indexed.getpalette(), dtype=np.uint8).reshape(-1, 3)
+    size = len(palette)
+
+    frequencies = np.bincount(indices.ravel(), minlength=size)[:size]
+    pinned = {int(i) for i in (pinned_indices or []) if 0 <= int(i) < size}
+    used = np.array([i for i in np.flatnonzero(frequencies) if i not in pinned], dtype=np.int64)
+
+    if method == "luminance":
+        order = list(luminance_order(palette, used))
+    elif method == "adjacency":
+        order = list(adjacency_order(indices, used, frequencies))
+    else:
+        order = list(used)
+
+    transparency = img_indexed.info.get("transparency")
+    if not isinstance(transparency, int) or transparency >= size:
+        transparency = None
+    elif transparency in order:
+        order.remove(transparency)
+        order.insert(0, transparency)
+    elif transparency not in pinned:
+        # No pixel uses the transparent entry; its slot goes to another color, so keeping
+        # tRNS would make that color transparent
+        transparency = None
+
+    free_slots = [i for i in range(size) if i not in pinned]
+    lut = np.arange(size, dtype=np.uint8)
+    new_palette = palette.copy()
+    for old, new in zip(order, free_slots):
+        lut[old] = new
+        new_palette[new] = palette[old]
+
+    # Everything after the last used or pinned slot is dropped
+    length = max([free_slots[len(order) - 1] + 1 if order else 1] + [i + 1 for i in pinned])
+    # Free slots below that length that no used entry took keep some unused color
+    unused = [i for i in range(size) if i not in pinned and frequencies[i] == 0]
+    for slot, old in zip(free_slots[len(order):], unused):
+        if slot >= length:
+            break
+        new_palette[slot] = palette[old]
+
+    result = PILImage.fromarray(lut[indices], 'P')
+    result.putpalette(new_palette[:length].ravel().tolist())
+    if transparency is not None:
+        result.info["transparency"] = int(lut[transparency])
+    return result
+
+def compact_palette(img_indexed, pinned_indices=None):
+    """
+    Drop unused palette entries: used indices become 0..n-1 in their old order (one bincount,
+    one LUT pass over the index buffer) and the palette holds exactly those n colors.
+    Pinned indices (e.g. a custom palette) keep their slot and only the free slots are packed.
+    """
+    if pinned_indices:
+        return reorder_palette(img_indexed, None, pinned_indices)
+    indices = np.asarray(img_indexed)
+    palette = np.array(img_indexed.getpalette(), dtype=np.uint8).reshape(-1, 3)
+    used = np.bincount(indices.ravel(), minlength=256) > 0
+    palette = np.concatenate([palette, np.zeros((len(used) - len(palette), 3), dtype=np.uint8)])
+
+    lut = (np.cumsum(used) - 1).clip(0).astype(np.uint8)
+    result = PILImage.fromarray(lut[indices], 'P')
+    result.putpalette(palette[used].ravel().tolist())
+    transparency = img_indexed.info.get("transparency")
+    if isinstance(transparency, int) and transparency < len(used) and used[transparency]:
+        result.info["transparency"] = int(lut[transparency])
+    return result
+
+def encode_with_palette_order(img_indexed, output_path, method, pinned_indices=None):
+    """
+    Encode the image as is and with a reordered palette and keep the smaller one.
+    Returns (image, encoded bytes, bytes saved against the original order).
+    """
+    original_data = encode_image(img_indexed, output_path)
+    if img_indexed.mode != 'P':
+        return img_indexed, original_data, 0
+
+    reordered = reorder_palette(img_indexed, method, pinned_indices)
+    reordered_data = encode_image(reordered, output_path)
+    if len(reordered_data) < len(original_data):
+        return reordered, reordered_data, len(original_data) - len(reordered_data)
+    return img_indexed, original_data, 0
@@ -11,6 +11,8 @@ from PyQt5.QtCore import Qt, QThread, pyqtSignal
 import threading
 from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
 import numpy as np
+from image_io import write_file_atomic
+from palette_order import PALETTE_ORDERS, compact_palette, encode_with_palette_order
 
 class ConsistentPaletteProcessor(QThread):
     """A processor that applies the palette consistently like the ColorEditorThread"""
@@ -19,7 +21,8 @@ class ConsistentPaletteProcessor(QThread):
     
     def __init__(self, file_paths, num_colors, max_size=None, max_length=None, output_folder=None, 
                  custom_palette=None, use_dithering=True, upscale_size=None, upscale_method="NEAREST", 
-                 upscale_dithering=False, downscale_method="LANCZOS"):
+                 upscale_dithering=False, downscale_method="LANCZOS", palette_order=None,
+                 pin_custom_indices=True):
         super().__init__()
         self.file_paths = file_paths
         self.num_colors = num_colors
@@ -32,6 +35,11 @@ class ConsistentPaletteProcessor(QThread):
         self.upscale_method = upscale_method
         self.upscale_dithering = upscale_dithering
         self.downscale_method = downscale_method
+        # "luminance" or "adjacency" to reorder the (compacted) palette for a smaller PNG
+        self.palette_order = palette_order
+        # With a custom palette, its indices keep their slots through compaction and
+        # reordering, so outputs stay index-compatible with the reference image
+        self.pin_custom_indices = pin_custom_indices
         print(f"ConsistentPaletteProcessor initialized with dithering: {self.use_dithering}, "
               f"upscale method: {self.upscale_method}, upscale dithering: {self.upscale_dithering}, "
               f"downscale method: {self.downscale_method}")
@@ -63,35 +71,22 @@ class ConsistentPaletteProcessor(QThread):
             print("Warning: Image has no palette, creating new palette")
             return self.generate_standard_palette(img)
         
-        # Create a modified palette with our colors at the specified indices
-        new_palette = palette.copy()
-        
-        # Fill all entries with gray to prevent black pixels
-        for i in range(0, len(new_palette), 3):
-            new_palette[i] = 240    # R
-            new_palette[i+1] = 240  # G
-            new_palette[i+2] = 240  # B
-        
-        # Apply our custom colors at the specific indices
+        # Put our custom colors at their indices; entries nothing uses are dropped by
+        # compact_palette before saving, so they need no placeholder color
+        new_palette = np.array(palette, dtype=np.uint8).reshape(-1, 3)
+        # Quantize returns a palette only as long as the colors it used; extend it so every
+        # custom index has its slot (they stay pinned there through compaction)
+        length = max([len(new_palette)] + [idx + 1 for idx in color_mapping if idx < 256])
+        new_palette = np.concatenate([new_palette, np.zeros((length - len(new_palette), 3), dtype=np.uint8)])
         for idx, new_color in color_mapping.items():
-            if idx * 3 + 2 >= len(new_palette):
-                print(f"Warning: Color index {idx} out of range (palette length: {len(new_palette)//3})")
+            if idx >= len(new_palette):
+                print(f"Warning: Color index {idx} out of range (palette length: {len(new_palette)})")
                 continue
-                
-            r, g, b = new_color
-            new_palette[idx*3] = r
-            new_palette[idx*3 + 1] = g
-            new_palette[idx*3 + 2] = b
+            new_palette[idx] = new_color
         
         # Apply the palette directly
         new_img = img.copy()
-        new_img.putpalette(new_palette)
-        
-        # To prevent palette shifts during upscaling
-        img_array = np.array(new_img)
-        unique_indices = np.unique(img_array)
-        print(f"Image uses {len(unique_indices)} unique color indices: {sorted(unique_indices)[:10]}...")
-        
+        new_img.putpalette(new_palette.ravel().tolist())
         return new_img
     
     def generate_standard_palette(self, img):
@@ -101,37 +96,19 @@ class ConsistentPaletteProcessor(QThread):
         img_rgb = img.convert("RGB")
         palette_img = img_rgb.quantize(colors=self.num_colors, dither=0)
         
-        # Extract palette data
-        palette_data = palette_img.getpalette()
-        
-        # Find used colors
-        img_array = np.array(palette_img)
-        unique_indices = np.unique(img_array)
-        print(f"Found {len(unique_indices)} unique colors in use")
+        # Keep only the colors in use (one bincount instead of np.unique's full sort)
+        palette = np.array(palette_img.getpalette(), dtype=np.uint8).reshape(-1, 3)
+        used = np.flatnonzero(np.bincount(np.asarray(palette_img).ravel(), minlength=len(palette)))
+        print(f"Found {len(used)} unique colors in use")
         
-        # Create a new palette image
+        # A short palette is all quantize may pick from, so no padding is needed
         new_palette_img = PILImage.new('P', (1, 1))
-        new_palette_data = []
-        
-        # Flatten the palette data for used colors
-        for idx in unique_indices:
-            r = palette_data[idx*3]
-            g = palette_data[idx*3 + 1]
-            b = palette_data[idx*3 + 2]
-            new_palette_data.extend([r, g, b])
-        
-        # Fill the rest of the palette with light gray instead of zeros
-        remaining_colors = 256 - len(unique_indices)
-        for _ in range(remaining_colors):
-            new_palette_data.extend([240, 240, 240])  # Light gray
-        
-        # Set the palette
-        new_palette_img.putpalette(new_palette_data)
+        new_palette_img.putpalette(palette[used].ravel().tolist())
         
         # Step 2: Apply the palette with dithering
         dither_value = 1 if self.use_dithering else 0
         print(f"Applying quantize with generated palette, dither={dither_value}")
-        return img_rgb.quantize(colors=len(unique_indices), palette=new_palette_img, dither=dither_value)
+        return img_rgb.quantize(colors=len(used), palette=new_palette_img, dither=dither_value)
     
     def run(self):
         processed_files = []
@@ -193,6 +170,15 @@ class ConsistentPaletteProcessor(QThread):
                     # Generate a standard palette if no custom palette is provided
                     img_indexed = self.generate_standard_palette(img)
                 
+                # Minimal PLTE: only the entries the image uses (plus pinned custom entries),
+                # packed into the lowest free slots. Done before upscaling so a dithered
+                # re-index can only pick colors in use
+                pinned = None
+                if self.custom_palette and self.pin_custom_indices:
+                    pinned = [idx for idx, _ in self.custom_palette]
+                if img_indexed.mode == 'P':
+                    img_indexed = compact_palette(img_indexed, pinned)
+                
                 # Upscale if specified
                 if self.upscale_size:
                     # Calculate dimensions for upscaling
@@ -231,7 +217,12 @@ class ConsistentPaletteProcessor(QThread):
                         img_indexed = img_indexed.resize((upscale_width, upscale_height), upscale_method)
                 
                 # Save the processed image
-                img_indexed.save(output_path)
+                if self.palette_order and img_indexed.mode == 'P':
+                    _, data, saved = encode_with_palette_order(img_indexed, output_path, self.palette_order, pinned)
+                    write_file_atomic(data, output_path)
+                    print(f"Palette order '{self.palette_order}' saved {saved} bytes on {os.path.basename(output_path)}")
+                else:
+                    img_indexed.save(output_path)
                 
                 processed_files.append(output_path)
                 
@@ -336,7 +327,9 @@ def patch_indexed_color_converter(app_instance):
             upscale_size=upscale_size,
             upscale_method=upscale_method,
             upscale_dithering=upscale_dithering,
-            downscale_method=downscale_method
+            downscale_method=downscale_method,
+            pin_custom_indices=self.pin_indices_checkbox.isChecked(),
+            palette_order=self.get_palette_order()
         )
         self.batch_processor.progress_updated.connect(self.batch_progress.setValue)
         self.batch_processor.processing_complete.connect(self.on_batch_complete)
@@ -344,7 +337,13 @@ def patch_indexed_color_converter(app_instance):
         # Start processing
         self.batch_processor.start()
     
+    def get_palette_order(self):
+        """Palette order setting for the processor (None keeps the original order)"""
+        palette_order = self.palette_order_combo.currentText().lower()
+        return palette_order if palette_order in PALETTE_ORDERS else None
+    
     # Replace the original method with our patched version
+    app_instance.get_palette_order = get_palette_order.__get__(app_instance, type(app_instance))
     app_instance.process_batch = patched_process_batch.__get__(app_instance, type(app_instance))
     print("Successfully patched process_batch method to use ConsistentPaletteProcessor")
     
@@ -0,0 +1,74 @@
+import numpy as np
+
+def pack_rgb(rgb_array):
+    """Pack an (..., 3) uint8 RGB array into uint32 0x00RRGGBB values"""
+    rgb = rgb_array.astype(np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+def unpack_rgb(packed):
+    """Inverse of pack_rgb; returns an (..., 3) uint8 array"""
+    packed = np.asarray(packed, dtype=np.uint32)
+    return np.stack([(packed >> 16) & 0xFF, (packed >> 8) & 0xFF, packed & 0xFF], axis=-1).astype(np.uint8)
+
+def find_exact_colors(packed, max_colors, chunk_pixels=1 << 18, probe_pixels=4096):
+    """
+    Return the sorted unique packed colors, or None as soon as there are more than max_colors.
+    A strided probe rejects photos cheaply; the chunked scan stops at the first overflowing chunk.
+    """
+    flat = packed.ravel()
+
+    # Quick rejection from an evenly spread sample of the image
+    step = max(1, flat.size // probe_pixels)
+    if np.unique(flat[::step]).size > max_colors:
+        return None
+
+    colors = np.empty(0, dtype=np.uint32)
+    for start in range(0, flat.size, chunk_pixels):
+        colors = np.union1d(colors, np.unique(flat[start:start + chunk_pixels]))
+        if colors.size > max_colors:
+            return None
+
+    return colors
+
+def index_exact_colors(packed, colors):
+    """Map packed colors to their position in the sorted colors array (lossless, no dithering)"""
+    return np.searchsorted(colors, packed).astype(np.uint8)
+
+def palette_to_list(colors, total_entries=None):
+    """Flatten packed colors into a PIL putpalette list, optionally zero-padded"""
+    palette_data = unpack_rgb(colors).ravel().tolist()
+    if total_entries:
+        palette_data.extend([0] * ((total_entries - len(colors)) * 3))
+    return palette_data
+
+# sRGB byte -> linear light, as a lookup table
+_SRGB_TO_LINEAR = np.where(
+    np.arange(256) / 255.0 <= 0.04045,
+    np.arange(256) / 255.0 / 12.92,
+    ((np.arange(256) / 255.0 + 0.055) / 1.055) ** 2.4,
+).astype(np.float32)
+
+# Linear sRGB -> LMS, and LMS' -> OKLab (Ottosson 2020)
+_OKLAB_M1 = np.array([[0.4122214708, 0.5363325363, 0.0514459929],
+                      [0.2119034982, 0.6806995451, 0.1073969566],
+                      [0.0883024619, 0.2817188376, 0.6299787005]], dtype=np.float32)
+_OKLAB_M2 = np.array([[0.2104542553, 0.7936177850, -0.0040720468],
+                      [1.9779984951, -2.4285922050, 0.4505937099],
+                      [0.0259040371, 0.7827717662, -0.8086757660]], dtype=np.float32)
+
+def srgb_to_oklab(rgb_array):
+    """Convert an (..., 3) uint8 sRGB array to float32 OKLab"""
+    linear = _SRGB_TO_LINEAR[rgb_array]
+    lms = np.cbrt(linear @ _OKLAB_M1.T)
+    return lms @ _OKLAB_M2.T
+
+def mean_delta_e_oklab(lab_a, lab_b):
+    """Mean Euclidean distance in OKLab (about 0.02 is a just-noticeable difference)"""
+    return float(np.sqrt(((lab_a - lab_b) ** 2).sum(axis=-1)).mean())
+
+def psnr(rgb_a, rgb_b):
+    """Peak signal-to-noise ratio in dB between two uint8 RGB arrays"""
+    mse = np.mean((rgb_a.astype(np.float32) - rgb_b.astype(np.float32)) ** 2)
+    if mse == 0:
+        return float("inf")
+    return float(10 * np.log10(255.0 ** 2 / mse))
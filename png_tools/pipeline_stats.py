@@ -0,0 +1,116 @@
+import os
+import sys
+import csv
+import json
+import time
+import cProfile
+import pstats
+from contextlib import contextmanager
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+# Stage names in pipeline order; used for the CSV column layout
+STAGES = ["open", "decode", "resize", "convert", "palette", "quantize", "upscale", "encode", "write"]
+
+def get_peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if the platform can't tell"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+class FileStats:
+    """Wall and CPU time per pipeline stage, plus pixel counts, for one file"""
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.stages = {}  # stage name -> [wall seconds, cpu seconds]
+        self.pixels = {}  # label -> pixel count
+        self.peak_rss_mb = None
+        self.error = None
+        self._start_wall = time.perf_counter()
+        self.total_wall = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block; repeated stages accumulate"""
+        # thread_time so parallel workers don't charge each other's CPU
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            totals = self.stages.setdefault(name, [0.0, 0.0])
+            totals[0] += time.perf_counter() - wall_start
+            totals[1] += time.thread_time() - cpu_start
+
+    def count_pixels(self, label, img):
+        self.pixels[label] = img.width * img.height
+
+    def finish(self, error=None):
+        self.total_wall = time.perf_counter() - self._start_wall
+        self.peak_rss_mb = get_peak_rss_mb()
+        self.error = error
+        return self
+
+    def as_dict(self):
+        """Flat, JSON-friendly view used for the Qt signal and the exports"""
+        result = {
+            "file": self.file_path,
+            "total_wall_ms": round(self.total_wall * 1000, 3),
+            "peak_rss_mb": round(self.peak_rss_mb, 1) if self.peak_rss_mb is not None else None,
+            "error": self.error,
+        }
+        for name in STAGES + sorted(set(self.stages) - set(STAGES)):
+            wall, cpu = self.stages.get(name, (0.0, 0.0))
+            result[f"{name}_wall_ms"] = round(wall * 1000, 3)
+            result[f"{name}_cpu_ms"] = round(cpu * 1000, 3)
+        for label, count in self.pixels.items():
+            result[f"{label}_pixels"] = count
+        return result
+
+    def summary(self):
+        """One-line text for a live stats panel"""
+        parts = [f"{name} {wall * 1000:.0f}ms" for name, (wall, _) in self.stages.items()]
+        rss = f", peak RSS {self.peak_rss_mb:.0f} MB" if self.peak_rss_mb is not None else ""
+        return f"{os.path.basename(self.file_path)}: {self.total_wall * 1000:.0f}ms ({', '.join(parts)}){rss}"
+
+def export_batch_stats(stats_rows, output_folder, prefix="indexing_stats"):
+    """Write one CSV and one JSON file for a batch; returns the two paths"""
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    csv_path = os.path.join(output_folder, f"{prefix}_{timestamp}.csv")
+    json_path = os.path.join(output_folder, f"{prefix}_{timestamp}.json")
+
+    # Rows can have different pixel labels, so collect every column
+    fieldnames = []
+    for row in stats_rows:
+        for key in row:
+            if key not in fieldnames:
+                fieldnames.append(key)
+
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(stats_rows)
+
+    with open(json_path, "w") as f:
+        json.dump({"files": stats_rows}, f, indent=2)
+
+    print(f"Exported stage timings to {csv_path} and {json_path}")
+    return csv_path, json_path
+
+def profile_call(profile_path, func, *args, **kwargs):
+    """Run func under cProfile, dump a .prof file and print the hottest calls"""
+    # The pid lets py-spy attach (py-spy record --pid ...) to the same run
+    print(f"Profiling {getattr(func, '__name__', func)} in pid {os.getpid()}, writing {profile_path}")
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        profiler.dump_stats(profile_path)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
@@ -0,0 +1,188 @@
+import numpy as np
+from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
+from palette_tools import pack_rgb, unpack_rgb
+
+def _neighbours(indices, radius):
+    """Return a shift(dy, dx) accessor over an edge-padded copy of the index array"""
+    height, width = indices.shape
+    padded = np.pad(indices, radius, mode="edge")
+
+    def shift(dy, dx):
+        return padded[radius + dy:radius + dy + height, radius + dx:radius + dx + width]
+
+    return shift
+
+def _interleave(blocks, factor):
+    """Assemble factor*factor sub-pixel planes (row-major) into one upscaled array"""
+    height, width = blocks[0].shape
+    result = np.empty((height * factor, width * factor), dtype=blocks[0].dtype)
+    for i, block in enumerate(blocks):
+        result[i // factor::factor, i % factor::factor] = block
+    return result
+
+def scale2x(indices):
+    """Scale2x / EPX on an index array: 2x, palette exact"""
+    shift = _neighbours(indices, 1)
+    b, d, e, f, h = shift(-1, 0), shift(0, -1), shift(0, 0), shift(0, 1), shift(1, 0)
+
+    # Only corners on a clean diagonal edge take the neighbour's index
+    e0 = np.where((d == b) & (b != f) & (d != h), d, e)
+    e1 = np.where((b == f) & (b != d) & (f != h), f, e)
+    e2 = np.where((d == h) & (d != b) & (h != f), d, e)
+    e3 = np.where((h == f) & (h != d) & (b != f), f, e)
+    return _interleave([e0, e1, e2, e3], 2)
+
+def scale3x(indices):
+    """Scale3x (AdvMAME3x) on an index array: 3x, palette exact"""
+    shift = _neighbours(indices, 1)
+    a, b, c = shift(-1, -1), shift(-1, 0), shift(-1, 1)
+    d, e, f = shift(0, -1), shift(0, 0), shift(0, 1)
+    g, h, i = shift(1, -1), shift(1, 0), shift(1, 1)
+
+    # Pixels in flat or cross-shaped areas keep their own index
+    active = (b != h) & (d != f)
+    db, bf, dh, hf = active & (d == b), active & (b == f), active & (d == h), active & (h == f)
+
+    blocks = [
+        np.where(db, d, e),
+        np.where((db & (e != c)) | (bf & (e != a)), b, e),
+        np.where(bf, f, e),
+        np.where((db & (e != g)) | (dh & (e != a)), d, e),
+        e,
+        np.where((bf & (e != i)) | (hf & (e != c)), f, e),
+        np.where(dh, d, e),
+        np.where((dh & (e != i)) | (hf & (e != g)), h, e),
+        np.where(hf, f, e),
+    ]
+    return _interleave(blocks, 3)
+
+def _palette_distance_table(palette):
+    """256x256 xBR-style YUV distance between palette entries"""
+    rgb = np.zeros((256, 3), dtype=np.float32)
+    entries = np.asarray(palette[:768], dtype=np.float32).reshape(-1, 3)
+    rgb[:len(entries)] = entries
+
+    y = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    u = rgb @ np.array([-0.169, -0.331, 0.5], dtype=np.float32)
+    v = rgb @ np.array([0.5, -0.419, -0.081], dtype=np.float32)
+    return (48 * np.abs(y[:, None] - y[None, :])
+            + 7 * np.abs(u[:, None] - u[None, :])
+            + 6 * np.abs(v[:, None] - v[None, :]))
+
+def _xbr_bottom_right(indices, distance):
+    """Bottom-right sub-pixel of xBR level 1 without blending (picks an existing index)"""
+    shift = _neighbours(indices, 2)
+    b, c = shift(-1, 0), shift(-1, 1)
+    d, e, f, f4 = shift(0, -1), shift(0, 0), shift(0, 1), shift(0, 2)
+    g, h, i, i4 = shift(1, -1), shift(1, 0), shift(1, 1), shift(1, 2)
+    h5, i5 = shift(2, 0), shift(2, 1)
+
+    def dist(p, q):
+        return distance[p, q]
+
+    # Compare the weighted gradient along both diagonals through the corner
+    along_edge = dist(e, c) + dist(e, g) + dist(i, f4) + dist(i, h5) + 4 * dist(h, f)
+    across_edge = dist(h, d) + dist(h, i5) + dist(f, i4) + dist(f, b) + 4 * dist(e, i)
+    is_edge = (e != f) & (e != h) & (along_edge < across_edge)
+
+    closer = np.where(dist(e, f) <= dist(e, h), f, h)
+    return np.where(is_edge, closer, e)
+
+def xbr_lite(indices, palette):
+    """2x xBR-style edge-directed scaler restricted to existing palette indices"""
+    distance = _palette_distance_table(palette)
+
+    # Solve the bottom-right corner on each 90 degree rotation and rotate it back
+    corners = {}
+    for k, name in [(0, "br"), (1, "tr"), (2, "tl"), (3, "bl")]:
+        rotated = np.rot90(indices, k=-k)
+        corners[name] = np.rot90(_xbr_bottom_right(np.ascontiguousarray(rotated), distance), k=k)
+
+    return _interleave([corners["tl"], corners["tr"], corners["bl"], corners["br"]], 2)
+
+# Upscale method name -> scale factor of one pass
+PIXEL_ART_SCALERS = {
+    "SCALE2X": 2,
+    "SCALE3X": 3,
+    "XBR_LITE": 2,
+}
+
+def pixel_art_upscale(img_indexed, size, method):
+    """
+    Upscale a 'P' image to size with one of PIXEL_ART_SCALERS. The scaler is applied until the
+    image is at least the target size; any remaining non-integer step uses NEAREST on indices,
+    so the result always uses the original palette and needs no re-quantization.
+    """
+    palette = img_indexed.getpalette()
+    indices = np.asarray(img_indexed)
+
+    while indices.shape[1] < size[0] or indices.shape[0] < size[1]:
+        if method == "SCALE2X":
+            indices = scale2x(indices)
+        elif method == "SCALE3X":
+            indices = scale3x(indices)
+        else:
+            indices = xbr_lite(indices, palette)
+
+    result = PILImage.fromarray(np.ascontiguousarray(indices), 'P')
+    result.putpalette(palette)
+    if "transparency" in img_indexed.info:
+        result.info["transparency"] = img_indexed.info["transparency"]
+
+    if result.size != tuple(size):
+        result = result.resize(tuple(size), PILImage.NEAREST)
+    return result
+
+def mode_downscale(values, size, max_count_cells=1 << 24):
+    """
+    Downscale a 2D array of palette indices or packed colors by majority vote: each target
+    pixel takes the most frequent source value in the block of pixels that maps onto it.
+    """
+    height, width = values.shape
+    target_width, target_height = size
+
+    # Target cell of every source pixel (blocks may differ by one pixel for non-integer ratios)
+    row_cells = np.arange(height) * target_height // height
+    col_cells = np.arange(width) * target_width // width
+    cells = (row_cells[:, None] * target_width + col_cells[None, :]).ravel()
+    cell_count = target_width * target_height
+
+    # Compact value ids keep the count table small
+    uniques, value_ids = np.unique(values.ravel(), return_inverse=True)
+    value_ids = value_ids.ravel()
+    num_values = len(uniques)
+
+    if cell_count * num_values <= max_count_cells:
+        # One bincount over (cell, value) pairs, then argmax per cell
+        counts = np.bincount(cells * num_values + value_ids, minlength=cell_count * num_values)
+        winners = counts.reshape(cell_count, num_values).argmax(axis=1)
+    else:
+        # Too many distinct values for a dense table: count pairs, sort by cell then count
+        pair_keys, pair_counts = np.unique(cells.astype(np.int64) * num_values + value_ids, return_counts=True)
+        pair_cells = pair_keys // num_values
+        order = np.lexsort((-pair_counts, pair_cells))
+        sorted_cells = pair_cells[order]
+        first = np.r_[True, sorted_cells[1:] != sorted_cells[:-1]]
+        winners = np.empty(cell_count, dtype=np.int64)
+        winners[sorted_cells[first]] = pair_keys[order][first] % num_values
+
+    return uniques[winners].reshape(target_height, target_width)
+
+def mode_downscale_image(img, size):
+    """
+    Majority-vote downscale of a PIL image. Indexed images vote on indices and keep their
+    palette; everything else votes on packed RGB, so no new colors are ever created.
+    Falls back to NEAREST when the target is larger in either direction.
+    """
+    if size[0] > img.width or size[1] > img.height:
+        return img.resize(size, PILImage.NEAREST)
+
+    if img.mode == 'P':
+        result = PILImage.fromarray(mode_downscale(np.asarray(img), size).astype(np.uint8), 'P')
+        result.putpalette(img.getpalette())
+        if "transparency" in img.info:
+            result.info["transparency"] = img.info["transparency"]
+        return result
+
+    packed = pack_rgb(np.asarray(img.convert("RGB")))
+    return PILImage.fromarray(unpack_rgb(mode_downscale(packed, size)), "RGB")
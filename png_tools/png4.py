@@ -521,6 +521,19 @@ class IndexedColorConverter(QMainWindow):
         self.upscale_dithering_checkbox.setChecked(False)
         settings_layout.addWidget(self.upscale_dithering_checkbox, 6, 0, 1, 2)
         
+        # Batch outputs keep the custom palette's indices in place when their palette is compacted
+        self.pin_indices_checkbox = QCheckBox("Pin Custom Palette Indices")
+        self.pin_indices_checkbox.setChecked(True)
+        self.pin_indices_checkbox.setToolTip("Keep the indices of the current palette in place when compacting the palette")
+        settings_layout.addWidget(self.pin_indices_checkbox, 7, 0, 1, 2)
+        
+        # Palette order for batch outputs (kept only when the file gets smaller)
+        settings_layout.addWidget(QLabel("Palette Order:"), 8, 0)
+        self.palette_order_combo = QComboBox()
+        self.palette_order_combo.addItems(["Original", "Luminance", "Adjacency"])
+        self.palette_order_combo.setToolTip("Reorder palette entries so neighbouring pixels get nearby indices")
+        settings_layout.addWidget(self.palette_order_combo, 8, 1)
+        
         settings_group.setLayout(settings_layout)
         left_panel.addWidget(settings_group)
         
@@ -9,15 +9,40 @@ from PyQt5.QtGui import QPixmap, QImage, QColor
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 import threading
 from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
+from watch_folder import WatchFolderThread
+from pipeline_stats import FileStats, export_batch_stats, profile_call
+from palette_tools import (pack_rgb, find_exact_colors, index_exact_colors, palette_to_list,
+                           srgb_to_oklab, mean_delta_e_oklab, psnr)
+from batch_scheduler import MemoryBudgetScheduler, read_image_header, estimate_peak_memory
+from pixel_art_scalers import PIXEL_ART_SCALERS, pixel_art_upscale, mode_downscale_image
+from image_io import encode_image, write_file_atomic
+from video_frames import VideoIndexerThread
+from atlas_packer import AtlasPackerThread
+from duplicate_finder import find_duplicates, link_or_copy, duplicate_output_path
+from region_analysis import content_bbox, FlatRegions
+from palette_order import PALETTE_ORDERS, encode_with_palette_order
+from thumbnail_gallery import ThumbnailGallery
+from palette_matching import align_to_reference
+from job_executor import get_executor, shutdown_executor, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from shared_buffers import SharedBufferPool, SharedArray, share_indexed_result, qimage_over_indices
+from animation import (is_animated, read_frames, sample_frames, stack_opaque_pixels, map_frames,
+                       plan_frame_deltas, delta_coverage, encode_indexed_gif, encode_indexed_apng)
 import numpy as np
 
 class ImageProcessor(QThread):
     progress_updated = pyqtSignal(int)
     processing_complete = pyqtSignal(list)
+    stats_updated = pyqtSignal(dict)
+    # Shared-memory handles of a finished result (see share_indexed_result)
+    preview_ready = pyqtSignal(dict)
     
     def __init__(self, file_paths, num_colors, target_width=None, target_height=None, output_folder=None, 
                  custom_palette=None, use_dithering=True, upscale_width=None, upscale_height=None, 
-                 upscale_method="NEAREST", upscale_dithering=False, downscale_method="LANCZOS"):
+                 upscale_method="NEAREST", upscale_dithering=False, downscale_method="LANCZOS",
+                 export_stats=False, profile=False, memory_budget_mb=None, max_workers=None,
+                 output_variants=None, auto_colors=False, quality_metric="deltae", quality_threshold=0.02,
+                 source_cache=None, sequence_mode=False, skip_duplicates=False,
+                 auto_crop=False, skip_flat_regions=False, palette_order=None, pinned_indices=None):
         super().__init__()
         self.file_paths = file_paths
         self.num_colors = num_colors
@@ -32,6 +57,54 @@ class ImageProcessor(QThread):
         self.upscale_method = upscale_method
         self.upscale_dithering = upscale_dithering
         self.downscale_method = downscale_method
+        # Write per-stage timings as CSV/JSON after the batch
+        self.export_stats = export_stats
+        # Run each file under cProfile and dump <output>.prof next to it
+        self.profile = profile
+        # Parallel batch: admit files against this RAM budget (None = one file at a time)
+        self.memory_budget_mb = memory_budget_mb
+        self.max_workers = max_workers
+        # List of (longest side, upscale factor); when set, each source is decoded once
+        # and every variant is written from a single shared palette
+        self.output_variants = output_variants
+        # Auto mode: num_colors becomes the upper bound of a search for the smallest count
+        # whose proxy error is within quality_threshold ("deltae" = mean OKLab dE, "psnr" = dB)
+        self.auto_colors = auto_colors
+        self.quality_metric = quality_metric
+        self.quality_threshold = quality_threshold
+        self.search_proxy_pixels = 256 * 256
+        # Optional DecodedSourceCache shared across conversions of the same source
+        self.source_cache = source_cache
+        # Sequence mode: animated GIF/APNG sources keep all frames and are written as
+        # an animation with one shared palette and frame-delta encoding
+        self.sequence_mode = sequence_mode
+        # Hash every input first; exact pixel duplicates are processed once and get linked
+        # (or copied) outputs, near duplicates within the threshold in bits are only reported
+        self.skip_duplicates = skip_duplicates
+        self.near_duplicate_threshold = 6
+        self.hard_link_duplicates = True
+        self.near_duplicates = []
+        # Trim a uniform border off the working image before indexing
+        self.auto_crop = auto_crop
+        self.border_tolerance = 0
+        # Single-color tiles are kept out of palette building and dithering and filled
+        # with their nearest index; used once they cover at least min_flat_coverage
+        self.skip_flat_regions = skip_flat_regions
+        self.flat_tile_size = 16
+        self.min_flat_coverage = 0.1
+        # Optional PaletteCache (from the app-wide executor) so repeated conversions with the
+        # same custom palette reuse one built palette image
+        self.palette_cache = None
+        # When a SharedBufferPool is set, each result's index array, palette and preview
+        # proxy are published through it (preview_ready) so the UI never re-decodes the file
+        self.shared_buffers = None
+        # threading.Event set by the executor on shutdown; checked between files
+        self.cancel_event = None
+        # "luminance" or "adjacency": permute palette entries before encoding so PNG filters
+        # and deflate see smaller index jumps; kept only when the file gets smaller.
+        # pinned_indices (e.g. the indices a batch recolor maps) never move
+        self.palette_order = palette_order
+        self.pinned_indices = pinned_indices
         self.batch_processed_files = []
         self.batch_total_files = 0
         self.batch_current_file = 0
@@ -50,16 +123,57 @@ class ImageProcessor(QThread):
             print("No custom palette provided, will generate one during processing")
 
     ##################################################################################        
-    def generate_standard_palette(self, img):
+    def generate_standard_palette(self, img, stats=None, num_colors=None, regions=None):
         """Generate a palette without black color"""
+        stats = stats or FileStats("")
+        num_colors = num_colors or self.num_colors
+        
         # Convert to RGB to ensure consistent processing
         img_rgb = img.convert("RGB")
         
-        # Quantize to slightly more colors than requested to have room for removal
-        palette_img = img_rgb.quantize(colors=self.num_colors + 1, dither=0)
+        # Pixel art and UI assets often fit already - index those losslessly
+        exact_img = self.index_exact_palette(img_rgb, stats, num_colors)
+        if exact_img is not None:
+            return exact_img
+        
+        # Flat areas would dominate the palette: build it from the content only and give a few
+        # flat colors exact entries, or sample each flat color once when there are many
+        if regions is not None:
+            flat_count = len(regions.colors)
+            if 0 < flat_count <= num_colors // 4 and regions.coverage < 1.0:
+                content_palette = self.build_standard_palette(
+                    regions.palette_sample(include_flat_colors=False), stats, num_colors - flat_count)
+                palette_data = (content_palette.getpalette()[:(num_colors - flat_count) * 3]
+                                + palette_to_list(regions.colors))
+                new_palette_img = PILImage.new('P', (1, 1))
+                new_palette_img.putpalette(palette_data)
+            else:
+                new_palette_img = self.build_standard_palette(regions.palette_sample(), stats, num_colors)
+            return self.quantize_regions(img_rgb, new_palette_img, regions, stats)
+        
+        new_palette_img = self.build_standard_palette(img_rgb, stats, num_colors)
+        
+        # Apply the palette with or without dithering
+        dither_value = 1 if self.use_dithering else 0
         
-        # Get the full palette
-        full_palette = palette_img.getpalette()
+        with stats.stage("quantize"):
+            return img_rgb.quantize(
+                colors=num_colors, 
+                palette=new_palette_img, 
+                dither=dither_value
+            )
+    
+    def build_standard_palette(self, img_rgb, stats, num_colors=None):
+        """Build the black-free palette image (exactly num_colors entries) that generate_standard_palette quantizes against"""
+        num_colors = num_colors or self.num_colors
+        
+        with stats.stage("palette"):
+            # Quantize to slightly more colors than requested to have room for removal
+            # (PIL caps palettes at 256 entries)
+            palette_img = img_rgb.quantize(colors=min(num_colors + 1, 256), dither=0)
+            
+            # Get the full palette
+            full_palette = palette_img.getpalette()
         
         # Create a new palette without black
         new_palette_data = []
@@ -77,11 +191,11 @@ class ImageProcessor(QThread):
                 used_colors.add((r, g, b))
             
             # Stop when we have exactly the number of colors requested
-            if len(new_palette_data) // 3 == self.num_colors:
+            if len(new_palette_data) // 3 == num_colors:
                 break
         
         # If we don't have enough colors, pad with variations of existing colors
-        while len(new_palette_data) // 3 < self.num_colors:
+        while len(new_palette_data) // 3 < num_colors:
             # Add slightly modified version of an existing color
             last_color = (new_palette_data[-3], new_palette_data[-2], new_palette_data[-1])
             new_r = min(255, last_color[0] + 1)
@@ -89,170 +203,709 @@ class ImageProcessor(QThread):
             new_b = min(255, last_color[2] + 1)
             new_palette_data.extend([new_r, new_g, new_b])
         
-        # Fill the rest of the palette with zeros
-        remaining_colors = 256 - self.num_colors
-        new_palette_data.extend([0] * (remaining_colors * 3))
-        
+        # No zero padding: padded black entries would stay selectable, so a quantize
+        # against this palette could use num_colors + 1 colors
         # Create a new palette image
         new_palette_img = PILImage.new('P', (1, 1))
         new_palette_img.putpalette(new_palette_data)
         
-        # Apply the palette with or without dithering
+        return new_palette_img
+    
+    def build_custom_palette_image(self):
+        """Build a palette image holding custom_palette, padded to 256 entries"""
+        if self.palette_cache is not None:
+            return self.palette_cache.get_or_build(
+                [color for _, color in self.custom_palette], self._build_custom_palette_image)
+        return self._build_custom_palette_image()
+    
+    def _build_custom_palette_image(self):
+        # Create a palette image
+        palette_img = PILImage.new('P', (1, 1))
+        palette_data = []
+        
+        # Flatten the palette data
+        for idx, color in self.custom_palette:
+            r, g, b = color
+            palette_data.extend([r, g, b])
+        
+        # Fill the rest of the 256-color palette with zeros
+        remaining_colors = 256 - len(self.custom_palette)
+        palette_data.extend([0] * (remaining_colors * 3))
+        
+        # Set the palette
+        palette_img.putpalette(palette_data)
+        
+        return palette_img
+        
+    def quantize_regions(self, img_rgb, palette_img, regions, stats):
+        """Quantize (and dither) only the box around non-flat content, then fill the flat tiles"""
         dither_value = 1 if self.use_dithering else 0
         
-        return img_rgb.quantize(
-            colors=self.num_colors, 
-            palette=new_palette_img, 
-            dither=dither_value
-        )
+        with stats.stage("quantize"):
+            indices = np.zeros((img_rgb.height, img_rgb.width), dtype=np.uint8)
+            box = regions.content_box()
+            if box is not None:
+                left, top, right, bottom = box
+                indices[top:bottom, left:right] = np.asarray(
+                    img_rgb.crop(box).quantize(palette=palette_img, dither=dither_value))
+            regions.fill_flat(indices, palette_img)
+            
+            img_indexed = PILImage.fromarray(indices, 'P')
+            img_indexed.putpalette(palette_img.getpalette())
+        
+        return img_indexed
+    
+    def analyze_regions(self, img, stats, upscale_size):
+        """Apply auto-crop and find flat tiles; returns (image, FlatRegions or None, upscale size)"""
+        if self.auto_crop:
+            with stats.stage("analyze"):
+                box = content_bbox(np.asarray(img), self.border_tolerance)
+            if box is not None and box != (0, 0, img.width, img.height):
+                # Keep the configured upscale factor for the trimmed content
+                if upscale_size:
+                    upscale_size = (max(1, round((box[2] - box[0]) * upscale_size[0] / img.width)),
+                                    max(1, round((box[3] - box[1]) * upscale_size[1] / img.height)))
+                print(f"Auto-crop: trimming uniform border, content box {box} of {img.width}x{img.height}")
+                img = img.crop(box)
+        
+        regions = None
+        if self.skip_flat_regions:
+            with stats.stage("analyze"):
+                regions = FlatRegions(np.asarray(img), self.flat_tile_size)
+            if regions.coverage < self.min_flat_coverage:
+                regions = None
+            else:
+                print(f"Flat tiles cover {regions.coverage * 100:.0f}% of the image "
+                      f"({len(regions.colors)} colors), skipping them in palette and dither")
+        
+        return img, regions, upscale_size
+    
+    def index_exact_palette(self, img_rgb, stats, num_colors=None):
+        """Index without quantizing when the image has at most num_colors colors, else None"""
+        num_colors = num_colors or self.num_colors
+        
+        with stats.stage("palette"):
+            packed = pack_rgb(np.asarray(img_rgb))
+            colors = find_exact_colors(packed, num_colors)
+        
+        if colors is None:
+            return None
+        
+        print(f"Image already has {len(colors)} colors (<= {num_colors}), skipping quantization and dithering")
+        
+        # Direct lookup of every pixel's color in the sorted palette
+        with stats.stage("quantize"):
+            indices = index_exact_colors(packed, colors)
+            img_indexed = PILImage.fromarray(indices, 'P')
+            img_indexed.putpalette(palette_to_list(colors))
+        
+        return img_indexed
+    
+    def search_num_colors(self, img_rgb, stats):
+        """
+        Binary-search the smallest color count (2..num_colors) whose quantized proxy meets
+        the quality threshold. The proxy, its reference OKLab/RGB array and every probe
+        result are computed once and reused across probes.
+        """
+        with stats.stage("color_search"):
+            # Small proxy keeps each probe in the millisecond range; NEAREST subsampling
+            # keeps the source colors exact so pixel art is judged on its real palette
+            proxy = img_rgb
+            if img_rgb.width * img_rgb.height > self.search_proxy_pixels:
+                scale = (self.search_proxy_pixels / (img_rgb.width * img_rgb.height)) ** 0.5
+                proxy_size = (max(1, int(img_rgb.width * scale)), max(1, int(img_rgb.height * scale)))
+                proxy = img_rgb.resize(proxy_size, PILImage.NEAREST)
+            
+            proxy_array = np.asarray(proxy)
+            use_delta_e = self.quality_metric == "deltae"
+            reference = srgb_to_oklab(proxy_array) if use_delta_e else proxy_array
+            dither_value = 1 if self.use_dithering else 0
+            probe_stats = FileStats("")
+            errors = {}
+            
+            def meets_threshold(num_colors):
+                if num_colors not in errors:
+                    probe = self.index_exact_palette(proxy, probe_stats, num_colors)
+                    if probe is None:
+                        palette_img = self.build_standard_palette(proxy, probe_stats, num_colors)
+                        probe = proxy.quantize(palette=palette_img, dither=dither_value)
+                    probe_array = np.asarray(probe.convert("RGB"))
+                    if use_delta_e:
+                        errors[num_colors] = mean_delta_e_oklab(reference, srgb_to_oklab(probe_array))
+                    else:
+                        errors[num_colors] = psnr(reference, probe_array)
+                if use_delta_e:
+                    return errors[num_colors] <= self.quality_threshold
+                return errors[num_colors] >= self.quality_threshold
+            
+            low, high = 2, self.num_colors
+            if not meets_threshold(high):
+                print(f"Auto colors: {high} colors still miss the threshold, using {high}")
+                return high
+            
+            while low < high:
+                middle = (low + high) // 2
+                if meets_threshold(middle):
+                    high = middle
+                else:
+                    low = middle + 1
+        
+        unit = "mean dE (OKLab)" if use_delta_e else "dB PSNR"
+        print(f"Auto colors: {low} colors ({errors[low]:.4f} {unit}) after {len(errors)} probes")
+        return low
         
     ##################################################################################
 
 
-    def run(self):
-        processed_files = []
-        total_files = len(self.file_paths)
+    def get_output_path(self, file_path):
+        """Build the _indexed.png output path for a source file"""
+        basename = os.path.basename(file_path)
+        name, _ = os.path.splitext(basename)
         
-        for i, file_path in enumerate(self.file_paths):
+        if self.output_folder and os.path.isdir(self.output_folder):
+            return os.path.join(self.output_folder, f"{name}_indexed.png")
+        
+        dirname = os.path.dirname(file_path)
+        return os.path.join(dirname, f"{name}_indexed.png")
+    
+    def load_working_image(self, file_path, stats, size=None):
+        """Open, decode, optionally resize and convert to RGB, going through source_cache if set"""
+        cache_key = None
+        if self.source_cache is not None:
+            cache_key = self.source_cache.make_key(file_path, size, self.downscale_method if size else None)
+            with stats.stage("cache"):
+                cached = self.source_cache.get(cache_key)
+            if cached is not None:
+                print(f"Using cached decoded source for {os.path.basename(file_path)}")
+                img = PILImage.fromarray(cached, "RGB")
+                stats.count_pixels("working", img)
+                return img
+        
+        # Process the image (open only reads the header, load does the decode)
+        with stats.stage("open"):
+            img = PILImage.open(file_path)
+        with stats.stage("decode"):
+            img.load()
+        stats.count_pixels("source", img)
+        
+        # Resize if target dimensions are specified
+        if size:
+            with stats.stage("resize"):
+                img = self.downscale(img, size)
+        
+        # Convert to RGB to ensure consistent processing
+        with stats.stage("convert"):
+            img = img.convert("RGB")
+        stats.count_pixels("working", img)
+        
+        if cache_key is not None:
+            self.source_cache.put(cache_key, np.array(img))
+        
+        return img
+    
+    def process_file(self, file_path, output_path, stats=None):
+        """Run the full indexing pipeline for one file and save it to output_path"""
+        stats = stats or FileStats(file_path)
+        
+        target_size = None
+        if self.target_width and self.target_height:
+            target_size = (self.target_width, self.target_height)
+        img = self.load_working_image(file_path, stats, target_size)
+        
+        upscale_size = None
+        if self.upscale_width and self.upscale_height:
+            upscale_size = (self.upscale_width, self.upscale_height)
+        img, regions, upscale_size = self.analyze_regions(img, stats, upscale_size)
+        
+        # Pick the color count for this file when auto mode is on
+        num_colors = self.num_colors
+        if self.auto_colors and not self.custom_palette:
+            num_colors = self.search_num_colors(img, stats)
+        
+        # Use custom palette if provided
+        if self.custom_palette:
             try:
-                # Get output filename
-                basename = os.path.basename(file_path)
-                name, _ = os.path.splitext(basename)
-                
-                if self.output_folder and os.path.isdir(self.output_folder):
-                    output_path = os.path.join(self.output_folder, f"{name}_indexed.png")
-                else:
-                    dirname = os.path.dirname(file_path)
-                    output_path = os.path.join(dirname, f"{name}_indexed.png")
-                
-                print(f"Processing image {i+1}/{total_files}: {basename}")
+                palette_img = self.build_custom_palette_image()
                 
-                # Process the image
-                img = PILImage.open(file_path)
+                # Convert boolean to int for dithering (1=True, 0=False)
+                dither_value = 1 if self.use_dithering else 0
+                print(f"Applying quantize with custom palette, dither={dither_value}")
                 
-                # Store original dimensions
-                original_width, original_height = img.size
+                # Force conversion to RGB to ensure consistent palette application
+                img_rgb = img.convert("RGB")
                 
-                # Get downscale method
-                downscale_method = getattr(PILImage, self.downscale_method)
-                
-                # Resize if target dimensions are specified
-                if self.target_width and self.target_height:
-                    img = img.resize((self.target_width, self.target_height), downscale_method)
-                
-                # Convert to RGB to ensure consistent processing
-                img = img.convert("RGB")
-                
-                # Use custom palette if provided
-                if self.custom_palette:
-                    try:
-                        # Create a palette image
-                        palette_img = PILImage.new('P', (1, 1))
-                        palette_data = []
-                        
-                        # Flatten the palette data
-                        for idx, color in self.custom_palette:
-                            r, g, b = color
-                            palette_data.extend([r, g, b])
-                        
-                        # Fill the rest of the 256-color palette with zeros
-                        remaining_colors = 256 - len(self.custom_palette)
-                        palette_data.extend([0] * (remaining_colors * 3))
-                        
-                        # Set the palette
-                        palette_img.putpalette(palette_data)
-                        
-                        # Convert boolean to int for dithering (1=True, 0=False)
-                        dither_value = 1 if self.use_dithering else 0
-                        print(f"Applying quantize with custom palette, dither={dither_value}")
-                        
-                        # Force conversion to RGB to ensure consistent palette application
-                        img_rgb = img.convert("RGB")
-                        
-                        # Apply the palette with or without dithering
+                # Apply the palette with or without dithering
+                if regions is not None:
+                    img_indexed = self.quantize_regions(img_rgb, palette_img, regions, stats)
+                else:
+                    with stats.stage("quantize"):
                         img_indexed = img_rgb.quantize(
                             colors=len(self.custom_palette), 
                             palette=palette_img, 
                             dither=dither_value
                         )
-                        
-                        # Debug palette verification
-                        if file_path == self.file_paths[0]:  # First image only
-                            applied_palette = img_indexed.getpalette()
-                            print("Verification of applied palette:")
-                            for i in range(min(5, len(self.custom_palette))):
-                                idx, color = self.custom_palette[i]
-                                print(f"  Requested: Color {idx}: RGB{color}")
-                                actual_r = applied_palette[i*3]
-                                actual_g = applied_palette[i*3+1]
-                                actual_b = applied_palette[i*3+2]
-                                print(f"  Applied: Color {i}: RGB({actual_r}, {actual_g}, {actual_b})")
-                    
-                    except Exception as e:
-                        print(f"Error applying custom palette: {e}")
-                        # Fall back to standard palette generation
-                        print("Falling back to standard palette generation...")
-                        img_indexed = self.generate_standard_palette(img)
-                else:
-                    # Generate a standard palette if no custom palette is provided
-                    img_indexed = self.generate_standard_palette(img)
                 
-                # Upscale if specific dimensions are specified
-                if self.upscale_width and self.upscale_height:
-                    # Select upscale method
-                    upscale_method = getattr(PILImage, self.upscale_method)
+                # Debug palette verification
+                if self.file_paths and file_path == self.file_paths[0]:  # First image only
+                    applied_palette = img_indexed.getpalette()
+                    print("Verification of applied palette:")
+                    for i in range(min(5, len(self.custom_palette))):
+                        idx, color = self.custom_palette[i]
+                        print(f"  Requested: Color {idx}: RGB{color}")
+                        actual_r = applied_palette[i*3]
+                        actual_g = applied_palette[i*3+1]
+                        actual_b = applied_palette[i*3+2]
+                        print(f"  Applied: Color {i}: RGB({actual_r}, {actual_g}, {actual_b})")
+            
+            except Exception as e:
+                print(f"Error applying custom palette: {e}")
+                # Fall back to standard palette generation
+                print("Falling back to standard palette generation...")
+                img_indexed = self.generate_standard_palette(img, stats, num_colors, regions)
+        else:
+            # Generate a standard palette if no custom palette is provided
+            img_indexed = self.generate_standard_palette(img, stats, num_colors, regions)
+        
+        # Upscale if specific dimensions are specified
+        if upscale_size:
+            with stats.stage("upscale"):
+                img_indexed = self.upscale_indexed(img_indexed, upscale_size)
+            stats.count_pixels("output", img_indexed)
+        
+        # Save the processed image
+        img_indexed, data = self.encode_indexed(img_indexed, output_path, stats)
+        with stats.stage("write"):
+            write_file_atomic(data, output_path)
+        
+        if self.shared_buffers is not None and img_indexed.mode == 'P':
+            # Publish what was written (the encode may have reordered the palette)
+            with stats.stage("share"):
+                self.preview_ready.emit(share_indexed_result(self.shared_buffers, img_indexed, output_path))
+        
+        return output_path
+    
+    def get_pinned_indices(self):
+        """Palette slots that palette ordering must leave in place"""
+        if self.pinned_indices is None:
+            return None
+        if self.custom_palette:
+            # Custom palette colors are quantized to their position, not their source index
+            pinned = set(int(idx) for idx in self.pinned_indices)
+            return [i for i, (idx, _) in enumerate(self.custom_palette) if int(idx) in pinned]
+        return list(self.pinned_indices)
+    
+    def encode_indexed(self, img_indexed, output_path, stats):
+        """Encode the result, trying the palette order setting; returns (written image, bytes)"""
+        if not self.palette_order:
+            with stats.stage("encode"):
+                return img_indexed, encode_image(img_indexed, output_path)
+        
+        with stats.stage("encode"):
+            img_indexed, data, saved = encode_with_palette_order(
+                img_indexed, output_path, self.palette_order, self.get_pinned_indices())
+        if saved:
+            print(f"{self.palette_order.capitalize()} palette order saved {saved} bytes "
+                  f"({saved / (len(data) + saved) * 100:.1f}%) on {os.path.basename(output_path)}")
+        else:
+            print(f"Kept original palette order for {os.path.basename(output_path)} (reordering did not help)")
+        return img_indexed, data
+    
+    def downscale(self, img, size):
+        """Resize with the selected downscale method ("MODE" = majority vote per block)"""
+        if self.downscale_method == "MODE":
+            return mode_downscale_image(img, size)
+        return img.resize(size, getattr(PILImage, self.downscale_method))
+    
+    def upscale_indexed(self, img_indexed, size=None):
+        """Upscale the indexed result to size (default: the upscale width/height settings)"""
+        upscale_width, upscale_height = size or (self.upscale_width, self.upscale_height)
+        
+        # Pixel-art scalers work on the index buffer, so the palette stays exact
+        if self.upscale_method in PIXEL_ART_SCALERS and img_indexed.mode == 'P':
+            return pixel_art_upscale(img_indexed, (upscale_width, upscale_height), self.upscale_method)
+        
+        # Select upscale method
+        upscale_method = getattr(PILImage, self.upscale_method)
 
-                    # If upscale dithering is enabled, convert to RGB, upscale, and then re-index
-                    if self.upscale_dithering and img_indexed.mode == 'P':
-                        # Get the palette data for reuse
-                        original_palette = img_indexed.getpalette()
-                        
-                        # Convert to RGB for better interpolation
-                        rgb_img = img_indexed.convert('RGB')
-                        
-                        # Upscale using selected method
-                        upscaled_rgb = rgb_img.resize((self.upscale_width, self.upscale_height), upscale_method)
-                        
-                        # Re-index with the same palette, applying dithering
-                        palette_img = PILImage.new('P', (1, 1))
-                        palette_img.putpalette(original_palette)
-                        
-                        # Quantize the upscaled RGB image with dithering
-                        dither_value = 1 if self.use_dithering else 0
-                        img_indexed = upscaled_rgb.quantize(
-                            colors=min(256, self.num_colors),
-                            palette=palette_img,
-                            dither=dither_value
-                        )
+        # If upscale dithering is enabled, convert to RGB, upscale, and then re-index
+        if self.upscale_dithering and img_indexed.mode == 'P':
+            # Get the palette data for reuse
+            original_palette = img_indexed.getpalette()
+            
+            # Convert to RGB for better interpolation
+            rgb_img = img_indexed.convert('RGB')
+            
+            # Upscale using selected method
+            upscaled_rgb = rgb_img.resize((upscale_width, upscale_height), upscale_method)
+            
+            # Re-index with the same palette, applying dithering
+            palette_img = PILImage.new('P', (1, 1))
+            palette_img.putpalette(original_palette)
+            
+            # Quantize the upscaled RGB image with dithering
+            dither_value = 1 if self.use_dithering else 0
+            img_indexed = upscaled_rgb.quantize(
+                colors=min(256, self.num_colors),
+                palette=palette_img,
+                dither=dither_value
+            )
+        else:
+            # Standard upscale without re-dithering
+            img_indexed = img_indexed.resize((upscale_width, upscale_height), upscale_method)
+        
+        return img_indexed
+    
+    def fit_longest_side(self, width, height, size):
+        """Scale (width, height) so the longest side equals size, keeping the aspect ratio"""
+        scale = size / max(width, height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+    
+    def get_variant_output_path(self, file_path, size, factor):
+        """Build the output path for one size variant"""
+        name, _ = os.path.splitext(os.path.basename(self.get_output_path(file_path)))
+        if name.endswith("_indexed"):
+            name = name[:-len("_indexed")]
+        suffix = f"{size}px" if factor == 1 else f"{size}px_x{factor}"
+        return os.path.join(os.path.dirname(self.get_output_path(file_path)), f"{name}_{suffix}_indexed.png")
+    
+    def process_variants(self, file_path, stats=None):
+        """Decode once, build one palette and write every entry of output_variants"""
+        stats = stats or FileStats(file_path)
+        
+        img_rgb = self.load_working_image(file_path, stats)
+        original_width, original_height = img_rgb.size
+        
+        # Resize largest first so each variant comes from the nearest larger intermediate
+        sizes = sorted({size for size, _ in self.output_variants}, reverse=True)
+        intermediates = {}
+        current = img_rgb
+        for size in sizes:
+            target = self.fit_longest_side(original_width, original_height, size)
+            if target[0] < current.width or target[1] < current.height:
+                with stats.stage("resize"):
+                    current = self.downscale(current, target)
+            intermediates[size] = current
+        stats.count_pixels("working", intermediates[sizes[0]])
+        
+        # One palette for every variant, built from the largest intermediate
+        palette_source = intermediates[sizes[0]]
+        if self.custom_palette:
+            palette_img = self.build_custom_palette_image()
+        else:
+            num_colors = self.num_colors
+            if self.auto_colors:
+                num_colors = self.search_num_colors(palette_source, stats)
+            
+            with stats.stage("palette"):
+                colors = find_exact_colors(pack_rgb(np.asarray(palette_source)), num_colors)
+            if colors is not None:
+                print(f"Image already has {len(colors)} colors (<= {num_colors}), using them as the palette")
+                palette_img = PILImage.new('P', (1, 1))
+                palette_img.putpalette(palette_to_list(colors))
+            else:
+                palette_img = self.build_standard_palette(palette_source, stats, num_colors)
+        
+        dither_value = 1 if self.use_dithering else 0
+        indexed_by_size = {}
+        output_paths = []
+        
+        for size, factor in self.output_variants:
+            if self.is_cancelled():
+                break
+            # Variants that only differ in upscale factor share one quantize
+            if size not in indexed_by_size:
+                with stats.stage("quantize"):
+                    indexed_by_size[size] = intermediates[size].quantize(palette=palette_img, dither=dither_value)
+            img_indexed = indexed_by_size[size]
+            
+            if factor > 1:
+                with stats.stage("upscale"):
+                    img_indexed = self.upscale_indexed(
+                        img_indexed, (img_indexed.width * factor, img_indexed.height * factor))
+            
+            output_path = self.get_variant_output_path(file_path, size, factor)
+            _, data = self.encode_indexed(img_indexed, output_path, stats)
+            with stats.stage("write"):
+                write_file_atomic(data, output_path)
+            output_paths.append(output_path)
+        
+        print(f"Wrote {len(output_paths)} variants of {os.path.basename(file_path)} from one decode")
+        return output_paths
+
+    def get_animation_output_path(self, file_path):
+        """GIF sources stay GIF, everything else animated is written as APNG"""
+        output_path = self.get_output_path(file_path)
+        if os.path.splitext(file_path)[1].lower() == ".gif":
+            return os.path.splitext(output_path)[0] + ".gif"
+        return output_path
+    
+    def process_animation(self, file_path, output_path, stats=None):
+        """Index every frame against one shared palette and write an optimized GIF/APNG"""
+        stats = stats or FileStats(file_path)
+        
+        with stats.stage("decode"):
+            frames, durations, loop = read_frames(file_path)
+        stats.count_pixels("source", frames[0])
+        
+        # Resize every frame; RGBA keeps the alpha we need for the transparent index
+        if self.target_width and self.target_height:
+            resample = PILImage.NEAREST if self.downscale_method == "MODE" else getattr(PILImage, self.downscale_method)
+            with stats.stage("resize"):
+                frames = [frame.resize((self.target_width, self.target_height), resample) for frame in frames]
+        stats.count_pixels("working", frames[0])
+        
+        # One palette entry is reserved for transparency (real and frame-delta)
+        max_colors = min(self.num_colors, 255)
+        if self.custom_palette:
+            palette_data = [channel for _, color in self.custom_palette[:max_colors] for channel in color]
+        else:
+            # Build the palette from a handful of evenly spaced frames
+            sample = stack_opaque_pixels(sample_frames(frames))
+            num_colors = max_colors
+            if self.auto_colors:
+                num_colors = min(self.search_num_colors(sample, stats), max_colors)
+            
+            with stats.stage("palette"):
+                colors = find_exact_colors(pack_rgb(np.asarray(sample)), num_colors)
+            if colors is not None:
+                print(f"Sampled frames have {len(colors)} colors (<= {num_colors}), using them as the palette")
+                palette_data = palette_to_list(colors)
+            else:
+                palette_data = self.build_standard_palette(sample, stats, num_colors).getpalette()[:num_colors * 3]
+        
+        transparent_index = len(palette_data) // 3
+        palette_img = PILImage.new('P', (1, 1))
+        palette_img.putpalette(palette_data)
+        
+        # Frames are independent once the palette is fixed
+        dither_value = 1 if self.use_dithering else 0
+        with stats.stage("quantize"):
+            index_frames = map_frames(frames, palette_img, transparent_index, dither_value, self.max_workers)
+        palette_data = palette_data + [0, 0, 0]
+        
+        # Upscale on the indices only, so the transparent index survives
+        if self.upscale_width and self.upscale_height:
+            size = (self.upscale_width, self.upscale_height)
+            with stats.stage("upscale"):
+                for i, indices in enumerate(index_frames):
+                    frame = PILImage.fromarray(indices, 'P')
+                    frame.putpalette(palette_data)
+                    if self.upscale_method in PIXEL_ART_SCALERS:
+                        frame = pixel_art_upscale(frame, size, self.upscale_method)
                     else:
-                        # Standard upscale without re-dithering
-                        img_indexed = img_indexed.resize((self.upscale_width, self.upscale_height), upscale_method)
-                
-                # Save the processed image
-                img_indexed.save(output_path)
-                
-                processed_files.append(output_path)
+                        frame = frame.resize(size, PILImage.NEAREST)
+                    index_frames[i] = np.asarray(frame)
+            stats.count_pixels("output", frame)
+        
+        with stats.stage("delta"):
+            plan = plan_frame_deltas(index_frames, durations, transparent_index)
+        
+        with stats.stage("encode"):
+            if output_path.lower().endswith(".gif"):
+                data = encode_indexed_gif(plan, palette_data, transparent_index, loop)
+            else:
+                data = encode_indexed_apng(plan, index_frames, durations, palette_data, transparent_index, loop)
+        with stats.stage("write"):
+            write_file_atomic(data, output_path)
+        
+        height, width = index_frames[0].shape
+        print(f"Animation {os.path.basename(file_path)}: {len(frames)} frames -> {len(plan)} written, "
+              f"{delta_coverage(plan, (width, height)) * 100:.0f}% of canvas pixels, "
+              f"{transparent_index} colors, {len(data) / 1024:.1f} KB")
+        return output_path
+    
+    def estimate_job_memory(self, file_path):
+        """Estimate peak working memory in bytes for one file from its header and our settings"""
+        width, height, mode = read_image_header(file_path)
+        
+        working_size = (width, height)
+        if self.target_width and self.target_height:
+            working_size = (self.target_width, self.target_height)
+        
+        upscale_size = None
+        if self.upscale_width and self.upscale_height:
+            upscale_size = (self.upscale_width, self.upscale_height)
+        
+        if self.output_variants:
+            # The largest variant dominates; smaller ones are a fraction of it
+            largest = max(size for size, _ in self.output_variants)
+            working_size = self.fit_longest_side(width, height, min(largest, max(width, height)))
+            output_sizes = [tuple(side * factor for side in self.fit_longest_side(width, height, size))
+                            for size, factor in self.output_variants]
+            upscale_size = max(output_sizes, key=lambda wh: wh[0] * wh[1])
+        
+        return estimate_peak_memory((width, height), mode, working_size, upscale_size, self.upscale_dithering)
+    
+    def is_cancelled(self):
+        """True once the application is shutting down; the batch stops before its next file"""
+        return self.cancel_event is not None and self.cancel_event.is_set()
+    
+    def run_file(self, file_path, index, total_files):
+        """Process one file with stats and error handling; returns (output paths, stats dict)"""
+        if self.is_cancelled():
+            return [], None
+        stats = FileStats(file_path)
+        output_paths = []
+        error = None
+        try:
+            # Get output filename
+            output_path = self.get_output_path(file_path)
+            
+            print(f"Processing image {index+1}/{total_files}: {os.path.basename(file_path)}")
+            
+            if self.sequence_mode and is_animated(file_path):
+                output_path = self.get_animation_output_path(file_path)
+                process, args = self.process_animation, (file_path, output_path, stats)
+            elif self.output_variants:
+                process, args = self.process_variants, (file_path, stats)
+            else:
+                process, args = self.process_file, (file_path, output_path, stats)
+            
+            if self.profile:
+                result = profile_call(f"{output_path}.prof", process, *args)
+            else:
+                result = process(*args)
+            output_paths = result if isinstance(result, list) else [result]
+            
+        except Exception as e:
+            output_paths = []
+            error = str(e)
+            print(f"Error processing {file_path}: {e}")
+        
+        # Publish the timings for the live stats panel
+        stats.finish(error)
+        print(stats.summary())
+        self.stats_updated.emit(stats.as_dict())
+        
+        return output_paths, stats.as_dict()
+    
+    def run_parallel(self, total_files):
+        """Run the batch on a worker pool sized by the memory budget"""
+        jobs = []
+        for i, file_path in enumerate(self.file_paths):
+            try:
+                estimate = self.estimate_job_memory(file_path)
+            except Exception as e:
+                # Unreadable header: let run_file report the real error
+                print(f"Could not read header of {file_path}: {e}")
+                estimate = 0
+            jobs.append((i, estimate))
+        
+        budget_bytes = self.memory_budget_mb * 1024 * 1024
+        largest = max(estimate for _, estimate in jobs)
+        print(f"Scheduling {total_files} files against a {self.memory_budget_mb} MB budget "
+              f"(largest job ~{largest / (1024 * 1024):.0f} MB)")
+        
+        completed = [0]
+        progress_lock = threading.Lock()
+        
+        def worker(i):
+            result = self.run_file(self.file_paths[i], i, total_files)
+            
+            # Update progress
+            with progress_lock:
+                completed[0] += 1
+                self.progress_updated.emit(int(completed[0] / total_files * 100))
+            return result
+        
+        scheduler = MemoryBudgetScheduler(budget_bytes, self.max_workers)
+        results = scheduler.run(jobs, worker)
+        
+        # Keep the input order for the results list
+        return [results[i] for i in range(total_files)]
+
+    def collapse_duplicates(self):
+        """Drop inputs whose pixels match an earlier input; returns {kept path: [duplicate paths]}"""
+        unique, duplicates, self.near_duplicates = find_duplicates(
+            self.file_paths, self.near_duplicate_threshold, self.max_workers)
+        
+        for kept_path, duplicate_paths in duplicates.items():
+            print(f"Exact duplicates of {os.path.basename(kept_path)}: "
+                  f"{', '.join(os.path.basename(path) for path in duplicate_paths)}")
+        for path_a, path_b, distance in self.near_duplicates:
+            print(f"Near duplicate ({distance} bits): {os.path.basename(path_a)} ~ {os.path.basename(path_b)}")
+        
+        duplicate_count = sum(len(paths) for paths in duplicates.values())
+        print(f"Duplicate check: {len(self.file_paths)} inputs, {duplicate_count} exact duplicates skipped, "
+              f"{len(self.near_duplicates)} near-duplicate pairs")
+        self.file_paths = unique
+        return duplicates
+    
+    def link_duplicate_outputs(self, kept_path, duplicate_path, output_paths, taken=None):
+        """
+        Give a skipped duplicate the outputs of the file it duplicates, under its own name.
+        taken holds the batch's output paths; the new ones are added to it
+        """
+        taken = set(output_paths) if taken is None else taken
+        kept_name, _ = os.path.splitext(os.path.basename(kept_path))
+        duplicate_name, _ = os.path.splitext(os.path.basename(duplicate_path))
+        
+        linked = []
+        for output_path in output_paths:
+            # Every output name starts with the source name, so swap that prefix
+            target_path = duplicate_output_path(output_path, kept_name, duplicate_name, taken)
+            taken.add(target_path)
+            try:
+                linked.append(link_or_copy(output_path, target_path, self.hard_link_duplicates))
+            except (OSError, ValueError) as e:
+                print(f"Error linking output for duplicate {duplicate_path}: {e}")
+        return linked
+    
+    def run(self):
+        duplicates = {}
+        if self.skip_duplicates and len(self.file_paths) > 1:
+            duplicates = self.collapse_duplicates()
+        
+        total_files = len(self.file_paths)
+        
+        if self.memory_budget_mb and total_files > 1:
+            results = self.run_parallel(total_files)
+        else:
+            results = []
+            for i, file_path in enumerate(self.file_paths):
+                if self.is_cancelled():
+                    break
+                results.append(self.run_file(file_path, i, total_files))
                 
                 # Update progress
                 progress = int((i + 1) / total_files * 100)
                 self.progress_updated.emit(progress)
-                
+        
+        if self.is_cancelled():
+            print(f"Batch cancelled after {sum(1 for _, stats in results if stats is not None)} of {total_files} files")
+            return
+        
+        processed_files = [path for output_paths, _ in results for path in output_paths]
+        taken = set(processed_files)
+        for file_path, (output_paths, _) in zip(self.file_paths, results):
+            for duplicate_path in duplicates.get(file_path, []):
+                processed_files.extend(self.link_duplicate_outputs(file_path, duplicate_path, output_paths, taken))
+        batch_stats = [stats for _, stats in results]
+        
+        if self.export_stats and batch_stats:
+            try:
+                stats_folder = os.path.dirname(self.get_output_path(self.file_paths[0]))
+                export_batch_stats(batch_stats, stats_folder)
             except Exception as e:
-                print(f"Error processing {file_path}: {e}")
+                print(f"Error exporting stage timings: {e}")
                 
         self.processing_complete.emit(processed_files)
 
 class ColorEditorThread(QThread):
     progress_updated = pyqtSignal(int)
     processing_complete = pyqtSignal(str)
+    stats_updated = pyqtSignal(dict)
     
     def __init__(self, input_path, output_path, color_mapping, use_dithering=True, 
                  upscale_width=None, upscale_height=None, upscale_method="NEAREST", 
-                 upscale_dithering=False, downscale_method="LANCZOS"):
+                 upscale_dithering=False, downscale_method="LANCZOS", reference_palette=None):
         super().__init__()
         self.input_path = input_path
         self.output_path = output_path
         self.color_mapping = color_mapping
+        # List of (index, original color) of the reference image; when set, this file's
+        # palette is first matched to it (OKLab assignment) so color_mapping hits the same colors
+        self.reference_palette = reference_palette
         # Convert boolean to integer for consistency
         self.use_dithering = 1 if use_dithering else 0
         self.upscale_width = upscale_width
@@ -263,14 +916,19 @@ class ColorEditorThread(QThread):
         print(f"ColorEditorThread initialized with dithering: {self.use_dithering}, upscale method: {self.upscale_method}, upscale dithering: {self.upscale_dithering}, downscale method: {self.downscale_method}")
         
     def run(self):
+        stats = FileStats(self.input_path)
         try:
             # Disable PIL's warning temporarily
             import warnings
             warnings.filterwarnings("ignore", category=UserWarning)
             
             # Open the image - make sure to use a copy to avoid modifying the original
-            with PILImage.open(self.input_path) as original_img:
-                img = original_img.copy()
+            with stats.stage("open"):
+                original_img = PILImage.open(self.input_path)
+            with stats.stage("decode"):
+                with original_img:
+                    img = original_img.copy()
+            stats.count_pixels("source", img)
             
             # Re-enable warnings
             warnings.resetwarnings()
@@ -279,7 +937,8 @@ class ColorEditorThread(QThread):
             if img.mode != 'P':
                 # If not indexed, convert it
                 # No need to apply dithering here as we're just doing a direct conversion
-                img = img.convert('P', palette=PILImage.ADAPTIVE, colors=len(self.color_mapping))
+                with stats.stage("convert"):
+                    img = img.convert('P', palette=PILImage.ADAPTIVE, colors=len(self.color_mapping))
                 
             palette = img.getpalette()
             
@@ -288,6 +947,12 @@ class ColorEditorThread(QThread):
                 self.processing_complete.emit("Error: Not an indexed image")
                 return
             
+            # Move this file's colors to the indices of the matching reference colors
+            if self.reference_palette:
+                with stats.stage("match"):
+                    img = align_to_reference(img, self.reference_palette)
+                palette = img.getpalette()
+            
             # Make a copy of the palette for modification
             new_palette = palette.copy()
             
@@ -304,144 +969,69 @@ class ColorEditorThread(QThread):
                 new_palette[index*3 + 2] = b
             
             # Apply the new palette
-            new_img = img.copy()
-            new_img.putpalette(new_palette)
+            with stats.stage("palette"):
+                new_img = img.copy()
+                new_img.putpalette(new_palette)
             
             # Upscale if specific dimensions are specified
             if self.upscale_width and self.upscale_height:
-                # Select upscale method
-                upscale_method = getattr(PILImage, self.upscale_method)
-                
-                # If upscale dithering is enabled, convert to RGB, upscale, and then re-index
-                if self.upscale_dithering and new_img.mode == 'P':
-                    # Store the palette for reuse
-                    original_palette = new_img.getpalette()
-                    
-                    # Convert to RGB for better interpolation
-                    rgb_img = new_img.convert('RGB')
-                    
-                    # Upscale using selected method
-                    upscaled_rgb = rgb_img.resize((self.upscale_width, self.upscale_height), upscale_method)
-                    
-                    # Re-index with the same palette, applying dithering
-                    palette_img = PILImage.new('P', (1, 1))
-                    palette_img.putpalette(original_palette)
-                    
-                    # Quantize the upscaled RGB image with dithering if specified
-                    new_img = upscaled_rgb.quantize(
-                        colors=256,  # Use all palette entries
-                        palette=palette_img,
-                        dither=self.use_dithering  # Apply dithering if enabled
-                    )
-                else:
-                    # Standard upscale without re-dithering
-                    new_img = new_img.resize((self.upscale_width, self.upscale_height), upscale_method)
+                with stats.stage("upscale"):
+                    new_img = self.upscale_image(new_img)
+                stats.count_pixels("output", new_img)
             
             # Save the image
-            new_img.save(self.output_path)
+            with stats.stage("encode"):
+                data = encode_image(new_img, self.output_path)
+            with stats.stage("write"):
+                write_file_atomic(data, self.output_path)
+            
+            stats.finish()
+            print(stats.summary())
+            self.stats_updated.emit(stats.as_dict())
             
             self.progress_updated.emit(100)
             self.processing_complete.emit(self.output_path)
             
         except Exception as e:
             print(f"Color editor thread error: {str(e)}")
+            self.stats_updated.emit(stats.finish(str(e)).as_dict())
             self.processing_complete.emit(f"Error: {str(e)}")
+    
+    def upscale_image(self, new_img):
+        """Upscale the recolored image to the requested size"""
+        # Pixel-art scalers work on the index buffer, so the palette stays exact
+        if self.upscale_method in PIXEL_ART_SCALERS and new_img.mode == 'P':
+            return pixel_art_upscale(new_img, (self.upscale_width, self.upscale_height), self.upscale_method)
+        
+        # Select upscale method
+        upscale_method = getattr(PILImage, self.upscale_method)
+        
+        # If upscale dithering is enabled, convert to RGB, upscale, and then re-index
+        if self.upscale_dithering and new_img.mode == 'P':
+            # Store the palette for reuse
+            original_palette = new_img.getpalette()
             
-            # Get the palette
-            if img.mode != 'P':
-                # If not indexed, convert it
-                # No need to apply dithering here as we're just doing a direct conversion
-                img = img.convert('P', palette=PILImage.ADAPTIVE, colors=len(self.color_mapping))
-                
-            palette = img.getpalette()
-            
-            # If there's no palette, this isn't an indexed image
-            if not palette:
-                self.processing_complete.emit("Error: Not an indexed image")
-                return
-            
-            # Make a copy of the palette for modification
-            new_palette = palette.copy()
-            
-            # Check if we need transparency
-            has_transparency = any(len(color) > 3 and color[3] < 255 for index, color in self.color_mapping.items())
-            transparency_indices = []
-            
-            # Update the palette with new colors
-            for index, new_color in self.color_mapping.items():
-                if index * 3 + 2 >= len(new_palette):
-                    print(f"Warning: Color index {index} out of range (palette length: {len(new_palette)//3})")
-                    continue
-                
-                # Set RGB values    
-                r, g, b = new_color[:3]
-                new_palette[index*3] = r
-                new_palette[index*3 + 1] = g
-                new_palette[index*3 + 2] = b
-                
-                # Track transparent colors
-                if len(new_color) > 3 and new_color[3] < 255:
-                    transparency_indices.append((index, new_color[3]))
-            
-            # Apply the new palette
-            new_img = img.copy()
-            new_img.putpalette(new_palette)
-            
-            # Handle transparency if needed
-            if has_transparency:
-                # Convert to RGBA
-                rgba_img = new_img.convert("RGBA")
-                
-                # Apply transparency for each color index
-                pixels = np.array(new_img)
-                rgba_data = np.array(rgba_img)
-                
-                for idx, alpha in transparency_indices:
-                    # Find all pixels with this index and set their alpha
-                    mask = pixels == idx
-                    rgba_data[mask, 3] = alpha
-                
-                new_img = PILImage.fromarray(rgba_data, "RGBA")
-            
-            # Upscale if specific dimensions are specified
-            if self.upscale_width and self.upscale_height:
-                # Select upscale method
-                upscale_method = getattr(PILImage, self.upscale_method)
-                
-                # If upscale dithering is enabled, convert to RGB, upscale, and then re-index
-                if self.upscale_dithering and new_img.mode == 'P':
-                    # Store the palette for reuse
-                    original_palette = new_img.getpalette()
-                    
-                    # Convert to RGB for better interpolation
-                    rgb_img = new_img.convert('RGB')
-                    
-                    # Upscale using selected method
-                    upscaled_rgb = rgb_img.resize((self.upscale_width, self.upscale_height), upscale_method)
-                    
-                    # Re-index with the same palette, applying dithering
-                    palette_img = PILImage.new('P', (1, 1))
-                    palette_img.putpalette(original_palette)
-                    
-                    # Quantize the upscaled RGB image with dithering if specified
-                    new_img = upscaled_rgb.quantize(
-                        colors=256,  # Use all palette entries
-                        palette=palette_img,
-                        dither=self.use_dithering  # Apply dithering if enabled
-                    )
-                else:
-                    # Standard upscale without re-dithering
-                    new_img = new_img.resize((self.upscale_width, self.upscale_height), upscale_method)
+            # Convert to RGB for better interpolation
+            rgb_img = new_img.convert('RGB')
             
-            # Save the image
-            new_img.save(self.output_path)
+            # Upscale using selected method
+            upscaled_rgb = rgb_img.resize((self.upscale_width, self.upscale_height), upscale_method)
             
-            self.progress_updated.emit(100)
-            self.processing_complete.emit(self.output_path)
+            # Re-index with the same palette, applying dithering
+            palette_img = PILImage.new('P', (1, 1))
+            palette_img.putpalette(original_palette)
             
-        except Exception as e:
-            print(f"Color editor thread error: {str(e)}")
-            self.processing_complete.emit(f"Error: {str(e)}")
+            # Quantize the upscaled RGB image with dithering if specified
+            new_img = upscaled_rgb.quantize(
+                colors=256,  # Use all palette entries
+                palette=palette_img,
+                dither=self.use_dithering  # Apply dithering if enabled
+            )
+        else:
+            # Standard upscale without re-dithering
+            new_img = new_img.resize((self.upscale_width, self.upscale_height), upscale_method)
+        
+        return new_img
 
 class TransparencyMakerThread(QThread):
     progress_updated = pyqtSignal(int)
@@ -567,9 +1157,9 @@ class TransparencyMaker(QMainWindow):
         results_group = QGroupBox("Results")
         results_layout = QVBoxLayout()
         
-        # Results list
-        self.results_list = QListWidget()
-        self.results_list.setMinimumHeight(100)
+        # Results gallery (thumbnails load in the background as rows scroll into view)
+        self.results_list = ThumbnailGallery()
+        self.results_list.setMinimumHeight(150)
         self.results_list.itemDoubleClicked.connect(self.open_result)
         results_layout.addWidget(self.results_list)
         
@@ -713,8 +1303,8 @@ class TransparencyMaker(QMainWindow):
             self.transparency_maker.progress_updated.connect(self.progress_bar.setValue)
             self.transparency_maker.processing_complete.connect(self.on_transparency_complete)
             
-            # Start processing
-            self.transparency_maker.start()
+            # Run on the shared executor, ahead of any batch work
+            get_executor().submit("transparency", self.transparency_maker, PRIORITY_INTERACTIVE)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error starting transparency maker: {str(e)}")
             self.process_btn.setEnabled(True)
@@ -733,9 +1323,14 @@ class TransparencyMaker(QMainWindow):
             
         self.process_btn.setEnabled(True)
     
+    def closeEvent(self, event):
+        """Stop the thumbnail loaders before the window goes away"""
+        self.results_list.shutdown()
+        super().closeEvent(event)
+    
     def open_result(self, item):
         """Open the result file when double-clicked"""
-        file_path = item.text()
+        file_path = ThumbnailGallery.item_path(item)
         if os.path.isfile(file_path):
             # Use default system program to open the file
             if sys.platform == 'win32':
@@ -766,8 +1361,20 @@ class IndexedColorConverter(QMainWindow):
         self.current_image_path = None
         self.current_indexed_image_path = None
         self.current_palette = []
+        self.reference_palette = []
         self.use_dithering = True
         self.saved_version_count = {}  # Dictionary to track saved versions of files
+        self.watch_thread = None
+        self.video_thread = None
+        # Every action runs on the app-wide executor; its decoded sources and palette images
+        # stay warm between conversions (re-converting with new colors skips the decode)
+        self.executor = get_executor()
+        self.source_cache = self.executor.source_cache
+        self.transparency_window = None
+        self.video_future = None
+        # Single conversions hand their result to the UI through shared memory
+        self.shared_buffers = SharedBufferPool()
+        self.shared_preview_path = None
         
     def setup_unified_interface(self, main_layout):
         # Top section: Image selection and conversion
@@ -787,7 +1394,7 @@ class IndexedColorConverter(QMainWindow):
         
         # Convert button
         self.convert_btn = QPushButton("Convert to Indexed PNG")
-        self.convert_btn.clicked.connect(self.convert_single_image)
+        self.convert_btn.clicked.connect(lambda: self.convert_single_image())
         self.convert_btn.setEnabled(False)
         single_image_layout.addWidget(self.convert_btn)
         
@@ -835,12 +1442,71 @@ class IndexedColorConverter(QMainWindow):
         output_folder_layout.addWidget(self.select_output_btn)
         batch_layout.addLayout(output_folder_layout)
         
+        # RAM budget for parallel batch workers; off (sequential) unless set
+        memory_budget_layout = QHBoxLayout()
+        memory_budget_layout.addWidget(QLabel("Memory Budget (MB):"))
+        self.memory_budget_spin = QSpinBox()
+        self.memory_budget_spin.setRange(0, 1024 * 1024)
+        self.memory_budget_spin.setSingleStep(256)
+        self.memory_budget_spin.setValue(0)
+        self.memory_budget_spin.setSpecialValueText("Sequential")
+        memory_budget_layout.addWidget(self.memory_budget_spin)
+        batch_layout.addLayout(memory_budget_layout)
+        
+        # Hash the inputs first so copies of the same image are processed once
+        self.skip_duplicates_checkbox = QCheckBox("Skip Duplicate Inputs (link outputs)")
+        self.skip_duplicates_checkbox.setChecked(False)
+        batch_layout.addWidget(self.skip_duplicates_checkbox)
+        
+        # Align each file's palette to the reference image before recoloring by index
+        self.match_palettes_checkbox = QCheckBox("Match Palettes to Reference (OKLab)")
+        self.match_palettes_checkbox.setChecked(True)
+        batch_layout.addWidget(self.match_palettes_checkbox)
+        
+        # Atlas mode: pack the batch results into shared-palette sprite sheets
+        atlas_layout = QHBoxLayout()
+        self.atlas_checkbox = QCheckBox("Pack into Atlas")
+        self.atlas_checkbox.setChecked(False)
+        atlas_layout.addWidget(self.atlas_checkbox)
+        atlas_layout.addWidget(QLabel("Atlas Size:"))
+        self.atlas_size_spin = QSpinBox()
+        self.atlas_size_spin.setRange(64, 16384)
+        self.atlas_size_spin.setSingleStep(256)
+        self.atlas_size_spin.setValue(2048)
+        atlas_layout.addWidget(self.atlas_size_spin)
+        batch_layout.addLayout(atlas_layout)
+        
         # Process button
         self.process_batch_btn = QPushButton("Process Folder")
         self.process_batch_btn.clicked.connect(self.process_batch)
         self.process_batch_btn.setEnabled(False)
         batch_layout.addWidget(self.process_batch_btn)
         
+        # Watch mode: keep processing new arrivals in the input folder
+        self.watch_folder_btn = QPushButton("Start Watching Folder")
+        self.watch_folder_btn.setCheckable(True)
+        self.watch_folder_btn.toggled.connect(self.toggle_watch_folder)
+        self.watch_folder_btn.setEnabled(False)
+        batch_layout.addWidget(self.watch_folder_btn)
+        
+        # Video clips: frames are streamed from ffmpeg and indexed with the saved palette
+        video_layout = QHBoxLayout()
+        video_layout.addWidget(QLabel("Temporal Coherence:"))
+        self.temporal_threshold_spin = QSpinBox()
+        self.temporal_threshold_spin.setRange(0, 64)
+        self.temporal_threshold_spin.setValue(0)
+        self.temporal_threshold_spin.setSpecialValueText("Off")
+        self.temporal_threshold_spin.setToolTip("Keep a pixel's previous index while its color moves less than this")
+        video_layout.addWidget(self.temporal_threshold_spin)
+        self.video_output_combo = QComboBox()
+        self.video_output_combo.addItems(["Indexed PNG Frames", "Re-encoded Video"])
+        video_layout.addWidget(self.video_output_combo)
+        batch_layout.addLayout(video_layout)
+        
+        self.index_video_btn = QPushButton("Index Video...")
+        self.index_video_btn.clicked.connect(self.index_video)
+        batch_layout.addWidget(self.index_video_btn)
+        
         # Progress bar for batch
         self.batch_progress = QProgressBar()
         batch_layout.addWidget(self.batch_progress)
@@ -877,7 +1543,7 @@ class IndexedColorConverter(QMainWindow):
         # Downscale method dropdown
         settings_layout.addWidget(QLabel("Downscale Method:"), 3, 0)
         self.downscale_method_combo = QComboBox()
-        self.downscale_method_combo.addItems(["LANCZOS", "BICUBIC", "BILINEAR", "NEAREST"])
+        self.downscale_method_combo.addItems(["LANCZOS", "BICUBIC", "BILINEAR", "NEAREST", "MODE"])
         settings_layout.addWidget(self.downscale_method_combo, 3, 1)
         
         # Upscale dimensions
@@ -904,7 +1570,7 @@ class IndexedColorConverter(QMainWindow):
         # Upscale method dropdown
         settings_layout.addWidget(QLabel("Upscale Method:"), 7, 0)
         self.upscale_method_combo = QComboBox()
-        self.upscale_method_combo.addItems(["NEAREST", "BILINEAR", "BICUBIC"])
+        self.upscale_method_combo.addItems(["NEAREST", "BILINEAR", "BICUBIC"] + list(PIXEL_ART_SCALERS))
         settings_layout.addWidget(self.upscale_method_combo, 7, 1)
         
         # Dithering options
@@ -918,6 +1584,66 @@ class IndexedColorConverter(QMainWindow):
         self.upscale_dithering_checkbox.setChecked(False)
         settings_layout.addWidget(self.upscale_dithering_checkbox, 9, 0, 1, 2)
         
+        # Instrumentation options
+        self.export_stats_checkbox = QCheckBox("Export Stage Timings (CSV/JSON)")
+        self.export_stats_checkbox.setChecked(False)
+        settings_layout.addWidget(self.export_stats_checkbox, 10, 0, 1, 2)
+        
+        self.profile_checkbox = QCheckBox("Profile Single Conversion (cProfile)")
+        self.profile_checkbox.setChecked(False)
+        settings_layout.addWidget(self.profile_checkbox, 11, 0, 1, 2)
+        
+        # Multi-output mode: one decode and one palette, several sizes
+        settings_layout.addWidget(QLabel("Size Variants:"), 12, 0)
+        self.size_variants_edit = QLineEdit()
+        self.size_variants_edit.setPlaceholderText("e.g. 1024, 256, 128x2, 64x4 (overrides target size)")
+        settings_layout.addWidget(self.size_variants_edit, 12, 1)
+        
+        # Auto color count: Number of Colors becomes the upper bound of the search
+        self.auto_colors_checkbox = QCheckBox("Auto Colors (smallest count meeting quality)")
+        self.auto_colors_checkbox.setChecked(False)
+        settings_layout.addWidget(self.auto_colors_checkbox, 13, 0, 1, 2)
+        
+        settings_layout.addWidget(QLabel("Quality Metric:"), 14, 0)
+        self.quality_metric_combo = QComboBox()
+        self.quality_metric_combo.addItems(["Mean dE (OKLab)", "PSNR (dB)"])
+        self.quality_metric_combo.currentIndexChanged.connect(self.on_quality_metric_changed)
+        settings_layout.addWidget(self.quality_metric_combo, 14, 1)
+        
+        settings_layout.addWidget(QLabel("Quality Threshold:"), 15, 0)
+        self.quality_threshold_spin = QDoubleSpinBox()
+        self.quality_threshold_spin.setDecimals(3)
+        self.quality_threshold_spin.setRange(0.001, 0.5)
+        self.quality_threshold_spin.setSingleStep(0.005)
+        self.quality_threshold_spin.setValue(0.02)
+        settings_layout.addWidget(self.quality_threshold_spin, 15, 1)
+        
+        # Animated GIF/APNG sources: keep every frame instead of only the first
+        self.sequence_mode_checkbox = QCheckBox("Sequence Mode (index animated GIF/APNG frames)")
+        self.sequence_mode_checkbox.setChecked(False)
+        settings_layout.addWidget(self.sequence_mode_checkbox, 16, 0, 1, 2)
+        
+        # Region pre-analysis: trim uniform borders, keep flat tiles out of palette/dither
+        self.auto_crop_checkbox = QCheckBox("Auto-Crop Uniform Border")
+        self.auto_crop_checkbox.setChecked(False)
+        settings_layout.addWidget(self.auto_crop_checkbox, 17, 0, 1, 2)
+        
+        self.skip_flat_checkbox = QCheckBox("Fill Flat Regions Directly (skip palette/dither)")
+        self.skip_flat_checkbox.setChecked(False)
+        settings_layout.addWidget(self.skip_flat_checkbox, 18, 0, 1, 2)
+        
+        # Palette ordering for smaller PNGs (same colors, different index layout)
+        settings_layout.addWidget(QLabel("Palette Order:"), 19, 0)
+        self.palette_order_combo = QComboBox()
+        self.palette_order_combo.addItems(["Original", "Luminance", "Adjacency"])
+        self.palette_order_combo.setToolTip("Reorder palette entries so neighbouring pixels get nearby indices")
+        settings_layout.addWidget(self.palette_order_combo, 19, 1)
+        
+        self.pin_indices_checkbox = QCheckBox("Pin Custom Palette Indices")
+        self.pin_indices_checkbox.setChecked(True)
+        self.pin_indices_checkbox.setToolTip("Keep the indices of the current palette in place when reordering")
+        settings_layout.addWidget(self.pin_indices_checkbox, 20, 0, 1, 2)
+        
         # Connect value change signals for aspect ratio maintenance
         self.target_width_spin.valueChanged.connect(lambda: self.update_aspect_ratio('target', 'width'))
         self.target_height_spin.valueChanged.connect(lambda: self.update_aspect_ratio('target', 'height'))
@@ -1003,10 +1729,17 @@ class IndexedColorConverter(QMainWindow):
         results_group = QGroupBox("Batch Processing Results")
         results_layout = QVBoxLayout()
         
-        # Results list
-        self.results_list = QListWidget()
+        # Results gallery (thumbnails load in the background as rows scroll into view)
+        self.results_list = ThumbnailGallery()
+        self.results_list.setMinimumHeight(150)
         results_layout.addWidget(self.results_list)
         
+        # Live per-stage timings of the most recent file
+        self.stats_label = QLabel("Stage timings: -")
+        self.stats_label.setWordWrap(True)
+        self.stats_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        results_layout.addWidget(self.stats_label)
+        
         results_group.setLayout(results_layout)
         bottom_layout.addWidget(results_group)
         
@@ -1063,21 +1796,12 @@ class IndexedColorConverter(QMainWindow):
         # Keep the current palette
         saved_palette = self.current_palette
         
-        # Re-process the image with current settings
-        self.convert_single_image()
-        
-        # Restore the palette after conversion completes (via signal/slot)
-        # We'll connect a one-time handler to the processing_complete signal
-        self.processor.processing_complete.connect(lambda _: self.restore_saved_palette(saved_palette))
+        # Re-process the image with current settings; the one-time handler that restores
+        # the palette is connected before the job is submitted, so it cannot miss the signal
+        self.convert_single_image(on_complete=lambda _: self.restore_saved_palette(saved_palette))
         
     def restore_saved_palette(self, saved_palette):
         """Restore a saved color palette after reprocessing"""
-        # Disconnect the one-time handler to avoid multiple connections
-        try:
-            self.processor.processing_complete.disconnect(self.restore_saved_palette)
-        except:
-            pass  # Ignore if not connected
-            
         # Set the saved palette
         self.current_palette = saved_palette
         
@@ -1130,7 +1854,8 @@ class IndexedColorConverter(QMainWindow):
             
         label.setPixmap(pixmap)
     
-    def convert_single_image(self):
+    def convert_single_image(self, on_complete=None):
+        """Index the current image; on_complete is an extra processing_complete handler"""
         if not self.current_image_path:
             return
             
@@ -1162,6 +1887,13 @@ class IndexedColorConverter(QMainWindow):
         print(f"Single image conversion - Dithering: {use_dithering}, Upscale Method: {upscale_method}, Downscale Method: {downscale_method}, Upscale Dithering: {upscale_dithering}")
         print(f"Target dimensions: {target_width}x{target_height}, Upscale dimensions: {upscale_width}x{upscale_height}")
         
+        try:
+            output_variants = self.get_size_variants()
+        except ValueError as e:
+            QMessageBox.warning(self, "Warning", str(e))
+            self.convert_btn.setEnabled(True)
+            return
+        
         # Setup processor thread with new options
         self.processor = ImageProcessor(
             [self.current_image_path], 
@@ -1173,23 +1905,73 @@ class IndexedColorConverter(QMainWindow):
             upscale_height=upscale_height,
             upscale_method=upscale_method,
             upscale_dithering=upscale_dithering,
-            downscale_method=downscale_method
+            downscale_method=downscale_method,
+            export_stats=self.export_stats_checkbox.isChecked(),
+            profile=self.profile_checkbox.isChecked(),
+            output_variants=output_variants,
+            source_cache=self.source_cache,
+            sequence_mode=self.sequence_mode_checkbox.isChecked(),
+            **self.get_quality_settings(),
+            **self.get_region_settings(),
+            **self.get_palette_order_settings()
         )
+        self.processor.shared_buffers = self.shared_buffers
         self.processor.progress_updated.connect(self.single_progress.setValue)
+        self.processor.stats_updated.connect(self.on_stage_stats)
+        self.processor.preview_ready.connect(self.on_shared_preview)
         self.processor.processing_complete.connect(self.on_single_conversion_complete)
+        if on_complete is not None:
+            self.processor.processing_complete.connect(on_complete)
         
         # Start processing
-        self.processor.start()
+        self.submit_job("convert", self.processor, PRIORITY_INTERACTIVE)
+    
+    def on_shared_preview(self, handles):
+        """Show a result from its shared buffers: preview and palette list without decoding the file"""
+        buffers = {}
+        try:
+            for key in ("indices", "palette", "preview"):
+                buffers[key] = SharedArray(handles[key])
+            
+            image = qimage_over_indices(buffers["preview"].array, buffers["palette"].array, handles["transparency"])
+            self.indexed_image_label.setPixmap(QPixmap.fromImage(image))
+            del image  # Drawn from the shared buffer, so it must go before the buffer is unmapped
+            
+            used = np.flatnonzero(np.bincount(buffers["indices"].array.ravel(), minlength=256))
+            self.populate_color_list(used, buffers["palette"].array.ravel().tolist())
+            self.shared_preview_path = handles["path"]
+        except Exception as e:
+            print(f"Shared preview failed, falling back to the file: {e}")
+            self.shared_preview_path = None
+        finally:
+            for shared in buffers.values():
+                shared.close()
+            for key in ("indices", "palette", "preview"):
+                self.shared_buffers.release(handles[key])
     
     def on_single_conversion_complete(self, processed_files):
         if processed_files:
             self.current_indexed_image_path = processed_files[0]
-            self.load_image_preview(self.current_indexed_image_path, self.indexed_image_label)
-            self.load_color_palette(self.current_indexed_image_path)
+            # Already shown from shared memory unless that path failed (or was not used)
+            if self.shared_preview_path != self.current_indexed_image_path:
+                self.load_image_preview(self.current_indexed_image_path, self.indexed_image_label)
+                self.load_color_palette(self.current_indexed_image_path)
+            self.shared_preview_path = None
             self.render_btn.setEnabled(True)
         
         self.convert_btn.setEnabled(True)
     
+    def on_stage_stats(self, stats):
+        """Show the per-stage timings of the most recent file"""
+        stages = [key[:-len("_wall_ms")] for key in stats if key.endswith("_wall_ms") and key != "total_wall_ms"]
+        parts = [f"{name} {stats[name + '_wall_ms']:.0f}ms" for name in stages if stats[name + "_wall_ms"] > 0]
+        rss = f" | peak RSS {stats['peak_rss_mb']:.0f} MB" if stats.get("peak_rss_mb") is not None else ""
+        error = f" | error: {stats['error']}" if stats.get("error") else ""
+        self.stats_label.setText(
+            f"Stage timings for {os.path.basename(stats['file'])}: {stats['total_wall_ms']:.0f}ms total "
+            f"({', '.join(parts)}){rss}{error}"
+        )
+    
     def load_color_palette(self, indexed_image_path):
         try:
             # Clear the list
@@ -1206,33 +1988,42 @@ class IndexedColorConverter(QMainWindow):
                     # Find the unique colors in use
                     img_array = np.array(img)
                     unique_indices = np.unique(img_array)
-                    
-                    for idx in unique_indices:
-                        r = palette[idx*3]
-                        g = palette[idx*3 + 1]
-                        b = palette[idx*3 + 2]
-                        
-                        color = (r, g, b)
-                        self.current_palette.append((idx, color))
-                        
-                        # Create list item
-                        item = QListWidgetItem(f"Color {idx}: RGB({r}, {g}, {b})")
-                        
-                        # Set background color
-                        item.setBackground(QColor(r, g, b))
-                        
-                        # Set text color for better visibility
-                        brightness = (r * 299 + g * 587 + b * 114) / 1000
-                        text_color = QColor(0, 0, 0) if brightness > 128 else QColor(255, 255, 255)
-                        item.setForeground(text_color)
-                        
-                        self.color_list.addItem(item)
+                    self.populate_color_list(unique_indices, palette)
             else:
                 QMessageBox.warning(self, "Warning", f"The image is not in indexed color mode (current mode: {img.mode}).")
                 
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to load color palette: {str(e)}")
     
+    def populate_color_list(self, unique_indices, palette):
+        """Fill the color list and current_palette from the used indices and a flat RGB palette"""
+        self.color_list.clear()
+        self.current_palette = []
+        
+        for idx in unique_indices:
+            r = palette[idx*3]
+            g = palette[idx*3 + 1]
+            b = palette[idx*3 + 2]
+            
+            color = (r, g, b)
+            self.current_palette.append((idx, color))
+            
+            # Create list item
+            item = QListWidgetItem(f"Color {idx}: RGB({r}, {g}, {b})")
+            
+            # Set background color
+            item.setBackground(QColor(r, g, b))
+            
+            # Set text color for better visibility
+            brightness = (r * 299 + g * 587 + b * 114) / 1000
+            text_color = QColor(0, 0, 0) if brightness > 128 else QColor(255, 255, 255)
+            item.setForeground(text_color)
+            
+            self.color_list.addItem(item)
+        
+        # Edits change current_palette; the colors as converted stay the matching reference
+        self.reference_palette = list(self.current_palette)
+    
     def edit_color(self, item):
         row = self.color_list.row(item)
         if row < len(self.current_palette):
@@ -1254,6 +2045,71 @@ class IndexedColorConverter(QMainWindow):
                 text_color = QColor(0, 0, 0) if brightness > 128 else QColor(255, 255, 255)
                 item.setForeground(text_color)
     
+    def get_size_variants(self):
+        """
+        Parse the size variants field: comma separated longest-side sizes, each with an
+        optional xN upscale factor. Returns a list of (size, factor) or None when empty.
+        """
+        text = self.size_variants_edit.text().strip()
+        if not text:
+            return None
+        
+        variants = []
+        for part in text.replace(";", ",").split(","):
+            part = part.strip().lower()
+            if not part:
+                continue
+            size, _, factor = part.partition("x")
+            try:
+                size = int(size.replace("px", ""))
+                factor = int(factor) if factor else 1
+            except ValueError:
+                raise ValueError(f"Invalid size variant '{part}', expected e.g. 256 or 128x2")
+            if size <= 0 or factor <= 0:
+                raise ValueError(f"Invalid size variant '{part}', sizes and factors must be positive")
+            variants.append((size, factor))
+        
+        return variants or None
+    
+    def on_quality_metric_changed(self, index):
+        """Switch the threshold range between OKLab dE (lower is better) and PSNR (higher is better)"""
+        if index == 0:
+            self.quality_threshold_spin.setDecimals(3)
+            self.quality_threshold_spin.setRange(0.001, 0.5)
+            self.quality_threshold_spin.setSingleStep(0.005)
+            self.quality_threshold_spin.setValue(0.02)
+        else:
+            self.quality_threshold_spin.setDecimals(1)
+            self.quality_threshold_spin.setRange(10.0, 60.0)
+            self.quality_threshold_spin.setSingleStep(0.5)
+            self.quality_threshold_spin.setValue(35.0)
+    
+    def get_quality_settings(self):
+        """Keyword arguments for ImageProcessor's auto color mode"""
+        return {
+            "auto_colors": self.auto_colors_checkbox.isChecked(),
+            "quality_metric": "deltae" if self.quality_metric_combo.currentIndex() == 0 else "psnr",
+            "quality_threshold": self.quality_threshold_spin.value(),
+        }
+    
+    def get_region_settings(self):
+        """Keyword arguments for ImageProcessor's border trim and flat-region handling"""
+        return {
+            "auto_crop": self.auto_crop_checkbox.isChecked(),
+            "skip_flat_regions": self.skip_flat_checkbox.isChecked(),
+        }
+    
+    def get_palette_order_settings(self):
+        """Keyword arguments for ImageProcessor's palette reordering"""
+        palette_order = self.palette_order_combo.currentText().lower()
+        pinned_indices = None
+        if self.pin_indices_checkbox.isChecked() and self.current_palette:
+            pinned_indices = [int(idx) for idx, _ in self.current_palette]
+        return {
+            "palette_order": palette_order if palette_order in PALETTE_ORDERS else None,
+            "pinned_indices": pinned_indices,
+        }
+    
     def toggle_dithering(self, state):
         """Toggle dithering on/off"""
         self.use_dithering = state == Qt.Checked
@@ -1334,10 +2190,11 @@ class IndexedColorConverter(QMainWindow):
                 downscale_method=downscale_method
             )
             self.color_editor.progress_updated.connect(self.single_progress.setValue)
+            self.color_editor.stats_updated.connect(self.on_stage_stats)
             self.color_editor.processing_complete.connect(self.on_recolor_complete)
             
             # Start processing
-            self.color_editor.start()
+            self.submit_job("render", self.color_editor, PRIORITY_INTERACTIVE)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error starting color editor: {str(e)}")
             self.render_btn.setEnabled(True)
@@ -1359,6 +2216,7 @@ class IndexedColorConverter(QMainWindow):
         if folder_path:
             self.folder_path_edit.setText(folder_path)
             self.process_batch_btn.setEnabled(True)
+            self.watch_folder_btn.setEnabled(True)
     
     def select_output_folder(self):
         """Select output folder for batch processing"""
@@ -1421,13 +2279,25 @@ class IndexedColorConverter(QMainWindow):
         upscale_method = self.upscale_method_combo.currentText()
         downscale_method = self.downscale_method_combo.currentText()
         
+        try:
+            self.batch_output_variants = self.get_size_variants()
+        except ValueError as e:
+            QMessageBox.warning(self, "Warning", str(e))
+            self.process_batch_btn.setEnabled(True)
+            return
+        
         # Store processed files to track progress
         self.batch_processed_files = []
+        self.batch_output_files = []
         self.batch_total_files = len(file_paths)
         self.batch_current_file = 0
         
         # Always use the current palette from the single image processing
         self.batch_custom_palette = self.current_palette if self.current_palette else None
+        # Original colors of those indices, which each batch file's palette is matched against
+        self.batch_reference_palette = None
+        if self.batch_custom_palette and self.match_palettes_checkbox.isChecked():
+            self.batch_reference_palette = list(self.reference_palette)
         
         # Start the first stage: Convert to indexed PNGs
         self.start_batch_indexing(file_paths, target_width, target_height, upscale_width, upscale_height, 
@@ -1456,13 +2326,22 @@ class IndexedColorConverter(QMainWindow):
             upscale_height=upscale_height,
             upscale_method=upscale_method,
             upscale_dithering=upscale_dithering,
-            downscale_method=downscale_method
+            downscale_method=downscale_method,
+            export_stats=self.export_stats_checkbox.isChecked(),
+            memory_budget_mb=self.memory_budget_spin.value() or None,
+            output_variants=self.batch_output_variants,
+            sequence_mode=self.sequence_mode_checkbox.isChecked(),
+            skip_duplicates=self.skip_duplicates_checkbox.isChecked(),
+            **self.get_quality_settings(),
+            **self.get_region_settings(),
+            **self.get_palette_order_settings()
         )
         self.batch_processor.progress_updated.connect(self.batch_progress.setValue)
+        self.batch_processor.stats_updated.connect(self.on_stage_stats)
         self.batch_processor.processing_complete.connect(self.on_batch_indexing_complete)
         
         # Start processing
-        self.batch_processor.start()
+        self.submit_job("batch-index", self.batch_processor, PRIORITY_BATCH)
 
     def on_batch_indexing_complete(self, processed_files):
         """Callback after converting images to indexed PNGs"""
@@ -1472,18 +2351,20 @@ class IndexedColorConverter(QMainWindow):
         self.batch_processed_files = processed_files
         
         # If we have a custom palette, start the recoloring stage
-        if self.batch_custom_palette:
+        if self.batch_custom_palette and self.batch_processed_files:
             self.start_batch_recoloring()
         else:
             # Finish batch processing if no custom palette
-            self.finalize_batch_processing()
+            self.batch_output_files = list(processed_files)
+            self.finish_batch_outputs()
 
     def start_batch_recoloring(self):
         """Second stage of batch processing: Apply custom palette to indexed PNGs"""
         print(f"Starting batch recoloring for {len(self.batch_processed_files)} files")
         
-        # Reset progress
+        # Reset progress (size variants can give several outputs per input file)
         self.batch_current_file = 0
+        self.batch_total_files = len(self.batch_processed_files)
         self.batch_progress.setValue(0)
         
         # Prepare color mapping dictionary
@@ -1494,6 +2375,12 @@ class IndexedColorConverter(QMainWindow):
         self.indexed_files_to_delete = [] # Track files to delete after recoloring
         
         for input_path in self.batch_processed_files:
+            # Recoloring rewrites a single frame, so animations keep their shared palette
+            if is_animated(input_path):
+                print(f"Keeping animation {input_path} as indexed (recoloring is still-image only)")
+                self.on_batch_recolor_file_complete(input_path)
+                continue
+            
             # Prepare output path with the new naming scheme
             dir_name = os.path.dirname(input_path)
             basename = os.path.basename(input_path)
@@ -1524,15 +2411,16 @@ class IndexedColorConverter(QMainWindow):
                 upscale_height=upscale_height,
                 upscale_method=self.upscale_method_combo.currentText(),
                 upscale_dithering=self.upscale_dithering_checkbox.isChecked(),
-                downscale_method=self.downscale_method_combo.currentText()
+                downscale_method=self.downscale_method_combo.currentText(),
+                reference_palette=self.batch_reference_palette
             )
             
             # Connect signals
             color_thread.processing_complete.connect(self.on_batch_recolor_file_complete)
             
-            # Store and start thread
+            # Store and queue the job
             self.batch_color_threads.append(color_thread)
-            color_thread.start()
+            self.submit_job("batch-recolor", color_thread, PRIORITY_BATCH)
 
     def on_batch_recolor_file_complete(self, result):
         """Callback for each completed recoloring thread"""
@@ -1545,10 +2433,40 @@ class IndexedColorConverter(QMainWindow):
         # Add to results list if successful
         if os.path.isfile(result):
             self.results_list.addItem(result)
+            self.batch_output_files.append(result)
         
         # Check if all files are processed
         if self.batch_current_file >= self.batch_total_files:
+            self.finish_batch_outputs()
+    
+    def finish_batch_outputs(self):
+        """Pack the batch results into atlases when atlas mode is on, then finalize"""
+        # Animations keep their own files; an atlas holds still sprites only
+        sprite_paths = [path for path in self.batch_output_files if not is_animated(path)]
+        if not self.atlas_checkbox.isChecked() or not sprite_paths:
             self.finalize_batch_processing()
+            return
+        
+        palette_colors = None
+        if self.batch_custom_palette:
+            palette_colors = [color for _, color in self.batch_custom_palette]
+        
+        print(f"Packing {len(sprite_paths)} batch results into atlases")
+        self.atlas_thread = AtlasPackerThread(
+            sprite_paths,
+            os.path.dirname(sprite_paths[0]),
+            palette_colors=palette_colors,
+            page_size=self.atlas_size_spin.value()
+        )
+        self.atlas_thread.processing_complete.connect(self.on_atlas_complete)
+        self.submit_job("atlas", self.atlas_thread, PRIORITY_BATCH)
+    
+    def on_atlas_complete(self, output_paths):
+        """List the atlas pages and index, then finish the batch"""
+        for output_path in output_paths:
+            self.results_list.addItem(output_path)
+        self.atlas_thread = None
+        self.finalize_batch_processing()
 
     def finalize_batch_processing(self):
         """Final cleanup after batch processing"""
@@ -1574,10 +2492,158 @@ class IndexedColorConverter(QMainWindow):
         
         # Clear temporary storage
         self.batch_processed_files = []
+        self.batch_output_files = []
         self.batch_color_threads = []
         if hasattr(self, 'indexed_files_to_delete'):
             self.indexed_files_to_delete = []
 
+    def toggle_watch_folder(self, checked):
+        """Start or stop the long-running watch on the input folder"""
+        if not checked:
+            if self.watch_thread:
+                self.watch_folder_btn.setEnabled(False)
+                self.watch_thread.stop()
+            return
+        
+        folder_path = self.folder_path_edit.text()
+        if not folder_path or not os.path.isdir(folder_path):
+            self.watch_folder_btn.setChecked(False)
+            return
+        
+        # Get output folder
+        output_folder = self.output_folder_edit.text()
+        if not output_folder or not os.path.isdir(output_folder):
+            output_folder = folder_path
+        
+        # One processor holds the saved settings and palette for every arrival
+        watch_processor = self.build_settings_processor(output_folder)
+        
+        self.watch_thread = WatchFolderThread(folder_path, watch_processor)
+        self.watch_thread.stats_updated.connect(self.on_stage_stats)
+        self.watch_thread.file_processed.connect(self.results_list.addItem)
+        self.watch_thread.status_updated.connect(self.statusBar().showMessage)
+        self.watch_thread.finished.connect(self.on_watch_folder_stopped)
+        
+        self.process_batch_btn.setEnabled(False)
+        self.select_folder_btn.setEnabled(False)
+        self.watch_folder_btn.setText("Stop Watching Folder")
+        self.watch_thread.start()
+    
+    def build_settings_processor(self, output_folder):
+        """ImageProcessor carrying the current settings and saved palette, used without start()"""
+        # Get target dimensions (if specified)
+        target_width = self.target_width_spin.value() if self.target_width_spin.value() > 0 else None
+        target_height = self.target_height_spin.value() if self.target_height_spin.value() > 0 else None
+        
+        # Get upscale dimensions (if specified)
+        upscale_width = self.upscale_width_spin.value() if self.upscale_width_spin.value() > 0 else None
+        upscale_height = self.upscale_height_spin.value() if self.upscale_height_spin.value() > 0 else None
+        
+        return ImageProcessor(
+            [],
+            self.num_colors_spin.value(),
+            target_width=target_width,
+            target_height=target_height,
+            output_folder=output_folder,
+            custom_palette=self.current_palette if self.current_palette else None,
+            use_dithering=self.dithering_checkbox.isChecked(),
+            upscale_width=upscale_width,
+            upscale_height=upscale_height,
+            upscale_method=self.upscale_method_combo.currentText(),
+            upscale_dithering=self.upscale_dithering_checkbox.isChecked(),
+            downscale_method=self.downscale_method_combo.currentText(),
+            **self.get_quality_settings(),
+            **self.get_region_settings(),
+            **self.get_palette_order_settings()
+        )
+    
+    def index_video(self):
+        """Stream a video clip through ffmpeg and index every frame without temp files"""
+        video_path, _ = QFileDialog.getOpenFileName(
+            self, "Select Video", "", "Videos (*.mp4 *.mov *.mkv *.avi *.webm *.gif)")
+        if not video_path:
+            return
+        
+        # Get output folder
+        output_folder = self.output_folder_edit.text()
+        if not output_folder or not os.path.isdir(output_folder):
+            output_folder = os.path.dirname(video_path)
+        
+        output_video_path = None
+        if self.video_output_combo.currentIndex() == 1:
+            name, _ = os.path.splitext(os.path.basename(video_path))
+            output_video_path, _ = QFileDialog.getSaveFileName(
+                self, "Save Indexed Video", os.path.join(output_folder, f"{name}_indexed.mp4"),
+                "Videos (*.mp4 *.mkv *.mov *.gif)")
+            if not output_video_path:
+                return
+        
+        self.video_thread = VideoIndexerThread(
+            video_path,
+            self.build_settings_processor(output_folder),
+            output_folder=output_folder,
+            output_video_path=output_video_path,
+            temporal_threshold=self.temporal_threshold_spin.value()
+        )
+        self.video_thread.progress_updated.connect(self.batch_progress.setValue)
+        self.video_thread.stats_updated.connect(self.on_stage_stats)
+        self.video_thread.status_updated.connect(self.statusBar().showMessage)
+        self.video_thread.processing_complete.connect(self.on_video_indexing_complete)
+        
+        self.index_video_btn.setEnabled(False)
+        self.batch_progress.setValue(0)
+        self.video_future = self.submit_job("video", self.video_thread, PRIORITY_BATCH)
+    
+    def submit_job(self, kind, job, priority=PRIORITY_BATCH):
+        """Run a worker object on the app-wide executor instead of its own QThread"""
+        if isinstance(job, ImageProcessor):
+            job.palette_cache = self.executor.palette_cache
+        return self.executor.submit(kind, job, priority)
+    
+    def open_transparency_maker(self):
+        """Open the Transparency Maker, with the current indexed result loaded if there is one"""
+        if self.transparency_window is None:
+            self.transparency_window = TransparencyMaker()
+        if self.current_indexed_image_path and os.path.isfile(self.current_indexed_image_path):
+            self.transparency_window.select_image_by_path(self.current_indexed_image_path)
+        self.transparency_window.show()
+        self.transparency_window.raise_()
+        self.transparency_window.activateWindow()
+    
+    def on_video_indexing_complete(self, output_paths):
+        """List the written frames (or the encoded video) in the results"""
+        self.results_list.clear()
+        for output_path in output_paths:
+            self.results_list.addItem(output_path)
+        self.index_video_btn.setEnabled(True)
+        self.video_thread = None
+        self.video_future = None
+    
+    def on_watch_folder_stopped(self):
+        """Restore the batch controls once the watch thread has drained"""
+        self.watch_thread = None
+        self.watch_folder_btn.blockSignals(True)
+        self.watch_folder_btn.setChecked(False)
+        self.watch_folder_btn.blockSignals(False)
+        self.watch_folder_btn.setText("Start Watching Folder")
+        self.watch_folder_btn.setEnabled(True)
+        self.process_batch_btn.setEnabled(True)
+        self.select_folder_btn.setEnabled(True)
+    
+    def closeEvent(self, event):
+        """Stop the watch and video threads and thumbnail loaders before the window goes away"""
+        if self.watch_thread:
+            self.watch_thread.stop()
+            self.watch_thread.wait()
+        if self.video_thread:
+            self.video_thread.stop()
+            # A queued job is dropped; a running one ends after its current frame
+            if not self.video_future.cancel():
+                self.video_future.exception()
+        self.results_list.shutdown()
+        self.shared_buffers.release_all()
+        super().closeEvent(event)
+
 def main():
     app = QApplication(sys.argv)
     
@@ -1588,7 +2654,10 @@ def main():
         window = IndexedColorConverter()
         
     window.show()
-    sys.exit(app.exec_())
+    exit_code = app.exec_()
+    # Queued jobs are dropped; running batches stop before their next file
+    shutdown_executor()
+    sys.exit(exit_code)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
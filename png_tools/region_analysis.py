@@ -0,0 +1,62 @@
+import numpy as np
+from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
+from palette_tools import pack_rgb, unpack_rgb
+
+def _bbox(mask):
+    """(left, top, right, bottom) of the True pixels of a 2D mask, or None"""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+def content_bbox(rgb_array, tolerance=0):
+    """
+    Box of the pixels that differ from the top-left (border) color by more than tolerance
+    in any channel. Returns None for a uniform image; the full frame if nothing can be trimmed.
+    """
+    if tolerance == 0:
+        different = pack_rgb(rgb_array) != pack_rgb(rgb_array[0, 0])
+    else:
+        border = rgb_array[0, 0].astype(np.int16)
+        different = np.abs(rgb_array.astype(np.int16) - border).max(axis=-1) > tolerance
+    return _bbox(different)
+
+class FlatRegions:
+    """Which tile_size x tile_size tiles of an RGB array hold a single color"""
+    def __init__(self, rgb_array, tile_size=16):
+        self.tile_size = tile_size
+        self.packed = pack_rgb(rgb_array)
+        height, width = self.packed.shape
+        tiles_y, tiles_x = height // tile_size, width // tile_size
+
+        # Only whole tiles are tested; the ragged right/bottom edge is always treated as content
+        blocks = self.packed[:tiles_y * tile_size, :tiles_x * tile_size].reshape(tiles_y, tile_size, tiles_x, tile_size)
+        first = blocks[:, :1, :, :1]
+        flat_tiles = (blocks == first).all(axis=(1, 3))
+
+        self.pixel_mask = np.zeros((height, width), dtype=bool)
+        self.pixel_mask[:tiles_y * tile_size, :tiles_x * tile_size] = np.repeat(
+            np.repeat(flat_tiles, tile_size, axis=0), tile_size, axis=1)
+        self.colors = np.unique(first[:, 0, :, 0][flat_tiles])
+        self.coverage = float(self.pixel_mask.mean()) if self.pixel_mask.size else 0.0
+
+    def content_box(self):
+        """Box around the pixels that are not in a flat tile, or None"""
+        return _bbox(~self.pixel_mask)
+
+    def palette_sample(self, include_flat_colors=True):
+        """(n, 1) RGB image of all non-flat pixels, plus one pixel per flat color if asked"""
+        samples = self.packed[~self.pixel_mask]
+        if include_flat_colors or samples.size == 0:
+            samples = np.concatenate([samples, self.colors])
+        return PILImage.fromarray(unpack_rgb(samples)[:, None, :], "RGB")
+
+    def fill_flat(self, indices, palette_img):
+        """Write each flat tile's nearest palette index into indices (no dithering needed)"""
+        if self.colors.size == 0:
+            return indices
+        color_img = PILImage.fromarray(unpack_rgb(self.colors)[None, :, :], "RGB")
+        color_indices = np.asarray(color_img.quantize(palette=palette_img, dither=0))[0]
+        indices[self.pixel_mask] = color_indices[np.searchsorted(self.colors, self.packed[self.pixel_mask])]
+        return indices
@@ -0,0 +1,152 @@
+import os
+import threading
+from collections import namedtuple
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+from PyQt5 import sip
+from PyQt5.QtGui import QImage
+
+# What crosses the process (or thread) boundary: a few picklable fields, never the pixels.
+# stride is the row length in elements; rows are padded so QImage can use the buffer as is
+BufferHandle = namedtuple("BufferHandle", "name shape dtype stride")
+
+# Qt wants 32-bit aligned scanlines
+QIMAGE_ROW_ALIGN = 4
+
+# Only POSIX segments go through the resource tracker, registered under "/" + their public name
+_TRACKED_SEGMENTS = os.name != "nt"
+
+def _padded_stride(shape, dtype, row_align):
+    """Row length in elements so that each row starts on a row_align byte boundary"""
+    if len(shape) < 2:
+        return int(np.prod(shape, dtype=np.int64))
+    row_elements = int(np.prod(shape[1:], dtype=np.int64))
+    itemsize = np.dtype(dtype).itemsize
+    row_bytes = -(-row_elements * itemsize // row_align) * row_align
+    return row_bytes // itemsize
+
+def _view(shm, handle):
+    """Array view of a segment following its handle (no copy)"""
+    dtype = np.dtype(handle.dtype)
+    rows = handle.shape[0] if len(handle.shape) > 1 else 1
+    flat = np.ndarray((rows * handle.stride,), dtype=dtype, buffer=shm.buf)
+    if len(handle.shape) < 2:
+        return flat[:handle.shape[0] if handle.shape else 1].reshape(handle.shape)
+    row_elements = int(np.prod(handle.shape[1:], dtype=np.int64))
+    return flat.reshape(rows, handle.stride)[:, :row_elements].reshape(handle.shape)
+
+class SharedBufferPool:
+    """
+    Producer side of the transport. share() copies an array into a new shared memory
+    segment and returns its handle. The pool owns every segment until release() (unlink)
+    or hand_off() (the receiver unlinks it once done, via SharedArray.release()).
+    """
+    def __init__(self):
+        self._segments = {}
+        self._lock = threading.Lock()
+
+    def share(self, array, row_align=QIMAGE_ROW_ALIGN):
+        array = np.asarray(array)
+        stride = _padded_stride(array.shape, array.dtype, row_align)
+        rows = array.shape[0] if array.ndim > 1 else 1
+        shm = shared_memory.SharedMemory(create=True, size=max(1, rows * stride * array.itemsize))
+        handle = BufferHandle(shm.name, tuple(array.shape), array.dtype.str, stride)
+        _view(shm, handle)[...] = array
+
+        with self._lock:
+            self._segments[handle.name] = shm
+        return handle
+
+    def release(self, handle):
+        """Unmap and unlink a segment this pool still owns"""
+        self._release(handle.name)
+
+    def _release(self, name):
+        with self._lock:
+            shm = self._segments.pop(name, None)
+        if shm is not None:
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass  # A receiver released it already
+
+    def hand_off(self, handle):
+        """Give up ownership (e.g. after sending the handle to another process) without unlinking"""
+        with self._lock:
+            shm = self._segments.pop(handle.name, None)
+        if shm is not None:
+            shm.close()
+            # The receiver unlinks it, so this process must not clean it up at exit
+            if _TRACKED_SEGMENTS:
+                resource_tracker.unregister("/" + shm.name, "shared_memory")
+
+    def release_all(self):
+        with self._lock:
+            names = list(self._segments)
+        for name in names:
+            self._release(name)
+
+    def __len__(self):
+        return len(self._segments)
+
+class SharedArray:
+    """Receiver side: maps a handle and exposes the segment as a NumPy array without copying"""
+    def __init__(self, handle):
+        self.handle = handle
+        self._shm = shared_memory.SharedMemory(name=handle.name)
+        self.array = _view(self._shm, handle)
+
+    def close(self):
+        """Unmap; every view (and QImage) over the buffer must be dropped first"""
+        if self._shm is not None:
+            self.array = None
+            self._shm.close()
+            self._shm = None
+
+    def release(self):
+        """Unmap and unlink, for segments that were handed off to us"""
+        name = self._shm.name if self._shm is not None else None
+        self.close()
+        if name is not None:
+            try:
+                shared_memory.SharedMemory(name=name).unlink()
+            except FileNotFoundError:
+                pass  # The producer released it already
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def share_indexed_result(pool, img_indexed, output_path, preview_size=(400, 300)):
+    """
+    Publish an indexed result as handles: full index array, palette (n, 3) and a nearest-
+    neighbour preview proxy that fits preview_size. Returns a dict the UI can act on.
+    """
+    indices = np.asarray(img_indexed)
+    palette = np.array(img_indexed.getpalette(), dtype=np.uint8).reshape(-1, 3)
+    transparency = img_indexed.info.get("transparency")
+    step = max(1, -(-indices.shape[1] // preview_size[0]), -(-indices.shape[0] // preview_size[1]))
+    return {
+        "path": output_path,
+        "indices": pool.share(indices),
+        "palette": pool.share(palette, row_align=1),
+        "preview": pool.share(indices[::step, ::step]),
+        "transparency": transparency if isinstance(transparency, int) else None,
+    }
+
+def qimage_over_indices(indices, palette, transparent_index=None):
+    """
+    Indexed8 QImage drawn straight from a (h, w) uint8 array whose rows are 4-byte aligned
+    (a SharedArray view). Only the color table is copied; keep the array alive while the
+    image is used.
+    """
+    height, width = indices.shape
+    image = QImage(sip.voidptr(indices.ctypes.data), width, height, indices.strides[0], QImage.Format_Indexed8)
+    colors = [0xFF000000 | (int(r) << 16) | (int(g) << 8) | int(b) for r, g, b in palette]
+    if transparent_index is not None and transparent_index < len(colors):
+        colors[transparent_index] &= 0x00FFFFFF
+    image.setColorTable(colors)
+    return image
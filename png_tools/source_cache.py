@@ -0,0 +1,55 @@
+import os
+import threading
+from collections import OrderedDict
+
+class DecodedSourceCache:
+    """Thread-safe LRU of decoded (and resized) RGB arrays, capped by total bytes"""
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(file_path, size, downscale_method):
+        """Key on path + mtime/size of the file so edits on disk invalidate the entry"""
+        stat = os.stat(file_path)
+        return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, size, downscale_method)
+
+    def get(self, key):
+        with self._lock:
+            array = self._entries.get(key)
+            if array is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return array
+
+    def put(self, key, array):
+        # Shared between conversions, so nobody may write into it
+        array.flags.writeable = False
+        if array.nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            # Drop this key and any entry for an older version of the same file
+            for old_key in [k for k in self._entries if k == key or (k[0] == key[0] and k[1:3] != key[1:3])]:
+                self.current_bytes -= self._entries.pop(old_key).nbytes
+            self._entries[key] = array
+            self.current_bytes += array.nbytes
+
+            # Evict least recently used entries until we're back under the cap
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,59 @@
+import pytest
+import numpy as np
+from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
+from duplicate_finder import find_duplicates, load_fingerprint, duplicate_output_path, link_or_copy
+
+def _indexed_image(palette, transparency=None):
+    indices = (np.arange(64 * 64, dtype=np.uint8) % 4).reshape(64, 64)
+    img = PILImage.fromarray(indices, 'P')
+    img.putpalette(palette)
+    if transparency is not None:
+        img.info["transparency"] = transparency
+    return img
+
+def test_palette_swapped_images_are_not_duplicates(tmp_path):
+    palette = [255, 0, 0, 0, 255, 0, 0, 0, 255, 255, 255, 255]
+    swapped = palette[3:6] + palette[:3] + palette[6:]
+    first = str(tmp_path / "first.png")
+    second = str(tmp_path / "second.png")
+    copy = str(tmp_path / "copy.png")
+    _indexed_image(palette).save(first)
+    _indexed_image(swapped).save(second)
+    _indexed_image(palette).save(copy)
+
+    assert load_fingerprint(first)[0] != load_fingerprint(second)[0]
+    unique, duplicates, _ = find_duplicates([first, second, copy])
+    assert unique == [first, second]
+    assert duplicates == {first: [copy]}
+
+def test_transparency_is_part_of_the_fingerprint(tmp_path):
+    palette = [255, 0, 0, 0, 255, 0, 0, 0, 255, 255, 255, 255]
+    opaque = str(tmp_path / "opaque.png")
+    transparent = str(tmp_path / "transparent.png")
+    _indexed_image(palette).save(opaque)
+    _indexed_image(palette, transparency=0).save(transparent)
+
+    assert load_fingerprint(opaque)[0] != load_fingerprint(transparent)[0]
+
+def test_same_named_duplicates_get_their_own_output(tmp_path):
+    output = tmp_path / "out" / "sprite.png"
+    output.parent.mkdir()
+    output.write_bytes(b"kept output")
+    taken = {str(output)}
+
+    first = duplicate_output_path(str(output), "sprite", "sprite", taken)
+    taken.add(first)
+    second = duplicate_output_path(str(output), "sprite", "sprite", taken)
+    assert first == str(tmp_path / "out" / "sprite_1.png")
+    assert second == str(tmp_path / "out" / "sprite_2.png")
+
+    link_or_copy(str(output), first)
+    assert output.read_bytes() == b"kept output"
+    assert (tmp_path / "out" / "sprite_1.png").read_bytes() == b"kept output"
+
+def test_link_onto_its_own_source_keeps_the_output(tmp_path):
+    output = tmp_path / "sprite.png"
+    output.write_bytes(b"kept output")
+    with pytest.raises(ValueError):
+        link_or_copy(str(output), str(output))
+    assert output.read_bytes() == b"kept output"
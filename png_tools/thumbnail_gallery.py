@@ -0,0 +1,238 @@
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtWidgets import QListWidget, QListWidgetItem, QListView
+from PyQt5.QtGui import QImage, QPixmap, QPixmapCache, QIcon
+from PyQt5.QtCore import Qt, QSize, QTimer, pyqtSignal
+from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
+from image_io import encode_image, write_file_atomic
+
+THUMBNAIL_SIZE = 96
+THUMBNAIL_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "png_tools", "thumbnails")
+# The disk cache is pruned to this size, least recently used thumbnails first
+THUMBNAIL_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Outputs that get a gallery entry; reports such as atlas.json do not
+THUMBNAIL_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp", ".tif", ".tiff")
+
+# Item data role holding the full output path (the item text is only the file name)
+PATH_ROLE = Qt.UserRole
+
+def thumbnail_key(file_path, size=THUMBNAIL_SIZE):
+    """Cache key on path + mtime/size of the file, so a rewritten output gets a new thumbnail"""
+    stat = os.stat(file_path)
+    text = f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}|{size}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def load_thumbnail(file_path, key, size=THUMBNAIL_SIZE, cache_dir=THUMBNAIL_CACHE_DIR):
+    """
+    RGBA thumbnail as a QImage, from the disk cache or by decoding the file (worker threads
+    only; QImage is safe off the UI thread, QPixmap is not)
+    """
+    cached_path = os.path.join(cache_dir, key[:2], f"{key}.png")
+    if os.path.isfile(cached_path):
+        image = QImage(cached_path)
+        if not image.isNull():
+            try:
+                os.utime(cached_path)  # mtime is the last use, for prune_thumbnail_cache
+            except OSError:
+                pass
+            return image
+
+    with PILImage.open(file_path) as img:
+        # JPEG decodes straight at a reduced scale
+        img.draft("RGB", (size, size))
+        img.thumbnail((size, size), PILImage.BOX)
+        thumb = img.convert("RGBA")
+
+    data = thumb.tobytes()
+    image = QImage(data, thumb.width, thumb.height, thumb.width * 4, QImage.Format_RGBA8888).copy()
+
+    try:
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        write_file_atomic(encode_image(thumb, cached_path), cached_path)
+    except OSError as e:
+        print(f"Could not cache thumbnail for {file_path}: {e}")
+    return image
+
+def prune_thumbnail_cache(cache_dir=THUMBNAIL_CACHE_DIR, max_bytes=THUMBNAIL_CACHE_MAX_BYTES):
+    """Delete the least recently used cached thumbnails until the cache fits max_bytes"""
+    entries = []
+    for folder, _, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    if removed:
+        print(f"Pruned {removed} cached thumbnails from {cache_dir}")
+    return removed
+
+class ThumbnailGallery(QListWidget):
+    """
+    Results list drawn as a grid of thumbnails. Only rows in view get a thumbnail; they
+    are loaded by a small thread pool and kept in QPixmapCache (memory LRU) and on disk.
+    addItem(path) works like on a plain QListWidget, but skips paths that are not images.
+    """
+    thumbnail_ready = pyqtSignal(str, str, QImage)
+
+    def __init__(self, parent=None, thumbnail_size=THUMBNAIL_SIZE, max_workers=2, cache_limit_kb=64 * 1024):
+        super().__init__(parent)
+        self.thumbnail_size = thumbnail_size
+        self.setViewMode(QListView.IconMode)
+        self.setResizeMode(QListView.Adjust)
+        self.setMovement(QListView.Static)
+        self.setIconSize(QSize(thumbnail_size, thumbnail_size))
+        self.setGridSize(QSize(thumbnail_size + 24, thumbnail_size + 32))
+        self.setWordWrap(True)
+        # Uniform items and batched layout keep 10k rows cheap to lay out
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(200)
+        QPixmapCache.setCacheLimit(max(QPixmapCache.cacheLimit(), cache_limit_kb))
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumbnail")
+        # Keep the disk cache bounded across sessions
+        self._executor.submit(prune_thumbnail_cache)
+        # key -> Future for thumbnails being loaded, and keys that could not be decoded
+        self._pending = {}
+        self._failed = set()
+        # Rows showing an icon; icons are released again when their row leaves the view,
+        # so only QPixmapCache's LRU holds pixmaps for rows out of sight
+        self._shown_rows = set()
+        self.thumbnail_ready.connect(self._on_thumbnail_ready)
+
+        # Coalesce scroll/resize/insert bursts into one visibility pass
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(50)
+        self._refresh_timer.timeout.connect(self.load_visible_thumbnails)
+        self.verticalScrollBar().valueChanged.connect(self.schedule_refresh)
+        self.model().rowsInserted.connect(self.schedule_refresh)
+
+    def addItem(self, item):
+        """Add an output path (or a ready-made item)"""
+        if isinstance(item, QListWidgetItem):
+            super().addItem(item)
+            return
+        if not item.lower().endswith(THUMBNAIL_EXTENSIONS):
+            return  # e.g. an atlas.json written next to the images
+        super().addItem(self.make_item(item))
+
+    def make_item(self, file_path):
+        item = QListWidgetItem(os.path.basename(file_path))
+        item.setData(PATH_ROLE, file_path)
+        item.setToolTip(file_path)
+        return item
+
+    @staticmethod
+    def item_path(item):
+        """Full path of a gallery item"""
+        return item.data(PATH_ROLE) or item.text()
+
+    def clear(self):
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._shown_rows.clear()
+        super().clear()
+
+    def schedule_refresh(self, *args):
+        self._refresh_timer.start()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.schedule_refresh()
+
+    def visible_rows(self):
+        """Rows whose cells intersect the viewport"""
+        viewport = self.viewport().rect()
+        first = self.indexAt(viewport.topLeft())
+        start = first.row() if first.isValid() else 0
+        rows = []
+        for row in range(start, self.count()):
+            rect = self.visualItemRect(self.item(row))
+            if rect.top() > viewport.bottom():
+                break
+            if rect.intersects(viewport):
+                rows.append(row)
+        return rows
+
+    def load_visible_thumbnails(self):
+        """Set cached icons on visible rows and queue the missing ones; drop work now out of view"""
+        visible = self.visible_rows()
+        for row in self._shown_rows.difference(visible):
+            if row < self.count():
+                self.item(row).setData(Qt.DecorationRole, None)
+        self._shown_rows.intersection_update(visible)
+
+        wanted = set()
+        for row in visible:
+            item = self.item(row)
+            if row in self._shown_rows:
+                continue
+            file_path = self.item_path(item)
+            try:
+                key = thumbnail_key(file_path, self.thumbnail_size)
+            except OSError:
+                continue  # Deleted (e.g. an intermediate file removed after recoloring)
+            if key in self._failed:
+                continue
+
+            pixmap = QPixmapCache.find(key)
+            if pixmap is not None and not pixmap.isNull():
+                item.setIcon(QIcon(pixmap))
+                self._shown_rows.add(row)
+                continue
+
+            wanted.add(key)
+            if key not in self._pending:
+                self._pending[key] = self._executor.submit(self._load, file_path, key)
+
+        # Work for rows scrolled away is cancelled if it has not started yet
+        for key in [k for k in self._pending if k not in wanted]:
+            if self._pending[key].cancel():
+                del self._pending[key]
+
+    def _load(self, file_path, key):
+        try:
+            image = load_thumbnail(file_path, key, self.thumbnail_size)
+        except Exception as e:
+            print(f"No thumbnail for {file_path}: {e}")
+            image = QImage()
+        try:
+            self.thumbnail_ready.emit(file_path, key, image)
+        except RuntimeError:
+            pass  # The gallery was deleted while this was loading
+
+    def _on_thumbnail_ready(self, file_path, key, image):
+        """UI thread: turn the QImage into a cached pixmap and show it"""
+        self._pending.pop(key, None)
+        if image.isNull():
+            self._failed.add(key)
+            return
+
+        pixmap = QPixmap.fromImage(image)
+        QPixmapCache.insert(key, pixmap)
+        for row in self.visible_rows():
+            item = self.item(row)
+            if self.item_path(item) == file_path:
+                item.setIcon(QIcon(pixmap))
+                self._shown_rows.add(row)
+
+    def shutdown(self):
+        """Stop the loader pool (call from the window's closeEvent)"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,287 @@
+import os
+import json
+import threading
+import subprocess
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+from PIL import Image as PILImage  # Renamed to avoid namespace conflicts
+from pipeline_stats import FileStats
+from image_io import encode_image, write_file_atomic
+from animation import plan_frame_deltas, encode_indexed_gif, GIF_DISPOSAL_KEEP
+
+# PIL resample name -> ffmpeg scale flag, so resizing happens inside the decoder
+FFMPEG_SCALE_FLAGS = {"NEAREST": "neighbor", "BOX": "area", "BILINEAR": "bilinear",
+                      "HAMMING": "bicubic", "BICUBIC": "bicubic", "LANCZOS": "lanczos"}
+
+# Output extension -> encoder arguments; lossless so the palette survives the encode.
+# GIF is not encoded by ffmpeg (it would build its own palette), see encode_video_gif
+VIDEO_ENCODE_ARGS = {
+    ".mp4": ["-c:v", "libx264rgb", "-crf", "0", "-preset", "veryfast"],
+    ".mkv": ["-c:v", "libx264rgb", "-crf", "0", "-preset", "veryfast"],
+    ".mov": ["-c:v", "qtrle"],
+}
+
+def stream_rotation(stream):
+    """Display rotation in degrees of an ffprobe stream (rotate tag or display matrix), 0 if none"""
+    rotation = stream.get("tags", {}).get("rotate")
+    for side_data in stream.get("side_data_list", []):
+        rotation = side_data.get("rotation", rotation)
+    try:
+        return int(float(rotation or 0))
+    except ValueError:
+        return 0
+
+def probe_video(video_path):
+    """
+    Return (width, height, fps, frame count or None) of the first video stream. width and
+    height are those of the decoded frames: ffmpeg autorotates, so a 90 degree rotation
+    (phone videos) swaps the coded dimensions
+    """
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=width,height,r_frame_rate,nb_frames:stream_tags=rotate:stream_side_data=rotation",
+        "-of", "json", video_path
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    stream = json.loads(result.stdout)["streams"][0]
+
+    numerator, _, denominator = stream["r_frame_rate"].partition("/")
+    fps = float(numerator) / float(denominator or 1)
+    frame_count = int(stream["nb_frames"]) if str(stream.get("nb_frames", "")).isdigit() else None
+    width, height = int(stream["width"]), int(stream["height"])
+    if stream_rotation(stream) % 180 == 90:
+        width, height = height, width
+    return width, height, fps, frame_count
+
+def read_video_frames(video_path, size, scale_size=None, scale_flags="lanczos"):
+    """
+    Yield (height, width, 3) uint8 RGB frames decoded by ffmpeg into its stdout pipe.
+    size is the decoded frame size; pass scale_size to let ffmpeg resize first.
+    """
+    cmd = ["ffmpeg", "-v", "error", "-i", video_path]
+    if scale_size:
+        cmd += ["-vf", f"scale={scale_size[0]}:{scale_size[1]}:flags={scale_flags}"]
+        size = scale_size
+    cmd += ["-f", "rawvideo", "-pix_fmt", "rgb24", "-"]
+
+    width, height = size
+    frame_bytes = width * height * 3
+    # stderr is discarded so a chatty decoder can never fill the pipe and stall us
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=frame_bytes)
+    try:
+        while True:
+            data = process.stdout.read(frame_bytes)
+            if not data:
+                break
+            if len(data) < frame_bytes:
+                # A frame size that does not match the decoder's would show up here
+                raise RuntimeError(f"Video stream ended partway through a frame ({len(data)} of {frame_bytes} bytes)")
+            yield np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with code {process.returncode} while decoding")
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+def open_video_writer(output_path, size, fps, encode_args=None):
+    """Start an ffmpeg process that encodes rgb24 frames written to its stdin"""
+    if encode_args is None:
+        encode_args = VIDEO_ENCODE_ARGS.get(os.path.splitext(output_path)[1].lower(), [])
+    cmd = [
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{size[0]}x{size[1]}", "-r", f"{fps:g}",
+        "-i", "-"
+    ] + encode_args + [output_path]
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+def encode_video_gif(index_frames, palette_data, fps):
+    """
+    GIF bytes of indexed frames with exactly their shared palette, as delta frames when
+    there is a free palette slot for the transparent index, else as full frames
+    """
+    durations = [max(10, round(1000 / fps)) if fps else 100] * len(index_frames)
+    palette_data = list(palette_data)
+    if len(palette_data) // 3 < 256:
+        transparent_index = len(palette_data) // 3
+        palette_data += [0, 0, 0]
+        plan = plan_frame_deltas(index_frames, durations, transparent_index)
+    else:
+        transparent_index = None
+        height, width = index_frames[0].shape
+        plan = [{"data": indices, "box": (0, 0, width, height), "duration": duration,
+                 "disposal": GIF_DISPOSAL_KEEP} for indices, duration in zip(index_frames, durations)]
+    return encode_indexed_gif(plan, palette_data, transparent_index)
+
+class TemporalIndexer:
+    """
+    Maps RGB frames onto a fixed palette. With a threshold, a pixel keeps the index it had
+    in the previous frame while its source color stays within threshold of the color it
+    had when that index was chosen, which stops dither noise and flicker on static areas.
+    """
+    def __init__(self, palette_img, dither=0, threshold=0):
+        self.palette_img = palette_img
+        self.dither = dither
+        self.threshold = threshold
+        self.previous_indices = None
+        self.reference_rgb = None
+
+    def map(self, rgb):
+        indices = np.array(PILImage.fromarray(rgb, "RGB").quantize(palette=self.palette_img, dither=self.dither))
+        if not self.threshold:
+            return indices
+
+        if self.previous_indices is None or self.previous_indices.shape != indices.shape:
+            self.reference_rgb = rgb.astype(np.int16)
+        else:
+            still = np.abs(rgb.astype(np.int16) - self.reference_rgb).max(axis=-1) <= self.threshold
+            indices[still] = self.previous_indices[still]
+            # Only re-anchor pixels that took a new index, so slow fades can't drift forever
+            self.reference_rgb[~still] = rgb[~still]
+
+        self.previous_indices = indices
+        return indices
+
+class VideoIndexerThread(QThread):
+    """Streams a video through ffmpeg, indexes each frame and writes PNGs or a re-encoded video"""
+    progress_updated = pyqtSignal(int)
+    status_updated = pyqtSignal(str)
+    stats_updated = pyqtSignal(dict)
+    processing_complete = pyqtSignal(list)
+
+    def __init__(self, video_path, processor, output_folder=None, output_video_path=None,
+                 temporal_threshold=0, encode_args=None):
+        super().__init__()
+        self.video_path = video_path
+        # ImageProcessor holding the palette and resize/upscale settings (not started)
+        self.processor = processor
+        # Either a folder for <name>_<frame>_indexed.png files or a video path for ffmpeg
+        self.output_folder = output_folder or os.path.dirname(video_path)
+        self.output_video_path = output_video_path
+        self.temporal_threshold = temporal_threshold
+        self.encode_args = encode_args
+        self._stop_event = threading.Event()
+        print(f"VideoIndexerThread initialized for {self.video_path}, temporal threshold {self.temporal_threshold}")
+
+    def stop(self):
+        """Stop after the current frame"""
+        self._stop_event.set()
+
+    def build_palette_image(self, first_frame, stats):
+        """Palette image holding exactly the palette colors (no zero padding to pick from)"""
+        processor = self.processor
+        if processor.custom_palette:
+            palette_data = processor.build_custom_palette_image().getpalette()[:len(processor.custom_palette) * 3]
+        else:
+            palette_data = processor.build_standard_palette(first_frame, stats).getpalette()[:processor.num_colors * 3]
+
+        palette_img = PILImage.new('P', (1, 1))
+        palette_img.putpalette(palette_data)
+        return palette_img
+
+    def run(self):
+        stats = FileStats(self.video_path)
+        processor = self.processor
+        outputs = []
+        frames = None
+        writer = None
+        # GIF output keeps the index frames (one byte per pixel) until the end
+        gif_frames = [] if self.output_video_path and self.output_video_path.lower().endswith(".gif") else None
+        gif_palette = None
+        try:
+            width, height, fps, frame_count = probe_video(self.video_path)
+            self.status_updated.emit(f"Indexing {os.path.basename(self.video_path)}: {width}x{height} @ {fps:g} fps")
+
+            # Let ffmpeg do the downscale unless we need a majority-vote resize
+            target_size = None
+            if processor.target_width and processor.target_height:
+                target_size = (processor.target_width, processor.target_height)
+            ffmpeg_scale = target_size if target_size and processor.downscale_method != "MODE" else None
+            frames = read_video_frames(self.video_path, (width, height), ffmpeg_scale,
+                                       FFMPEG_SCALE_FLAGS.get(processor.downscale_method, "lanczos"))
+
+            name, _ = os.path.splitext(os.path.basename(self.video_path))
+            indexer = None
+            frame_index = 0
+            while not self._stop_event.is_set():
+                with stats.stage("decode"):
+                    rgb = next(frames, None)
+                if rgb is None:
+                    break
+
+                if target_size and ffmpeg_scale is None:
+                    with stats.stage("resize"):
+                        rgb = np.asarray(processor.downscale(PILImage.fromarray(rgb, "RGB"), target_size))
+
+                # The palette comes from the saved batch palette, or else the first frame
+                if indexer is None:
+                    palette_img = self.build_palette_image(PILImage.fromarray(rgb, "RGB"), stats)
+                    dither_value = 1 if processor.use_dithering else 0
+                    indexer = TemporalIndexer(palette_img, dither_value, self.temporal_threshold)
+
+                with stats.stage("quantize"):
+                    img_indexed = PILImage.fromarray(indexer.map(rgb), 'P')
+                    img_indexed.putpalette(palette_img.getpalette())
+
+                if processor.upscale_width and processor.upscale_height:
+                    with stats.stage("upscale"):
+                        img_indexed = processor.upscale_indexed(img_indexed)
+
+                if gif_frames is not None:
+                    gif_frames.append(np.asarray(img_indexed))
+                    gif_palette = img_indexed.getpalette()
+                elif self.output_video_path:
+                    # Expand indices to RGB in one lookup and hand them to the encoder
+                    with stats.stage("encode"):
+                        if writer is None:
+                            writer = open_video_writer(self.output_video_path, img_indexed.size, fps, self.encode_args)
+                        lut = np.array(img_indexed.getpalette(), dtype=np.uint8).reshape(-1, 3)
+                        writer.stdin.write(lut[np.asarray(img_indexed)].tobytes())
+                else:
+                    output_path = os.path.join(self.output_folder, f"{name}_{frame_index:06d}_indexed.png")
+                    with stats.stage("encode"):
+                        data = encode_image(img_indexed, output_path)
+                    with stats.stage("write"):
+                        write_file_atomic(data, output_path)
+                    outputs.append(output_path)
+
+                frame_index += 1
+                if frame_count:
+                    self.progress_updated.emit(min(100, int(frame_index / frame_count * 100)))
+
+            if writer is not None:
+                with stats.stage("encode"):
+                    writer.stdin.close()
+                    if writer.wait() != 0:
+                        raise RuntimeError(f"ffmpeg exited with code {writer.returncode} while encoding")
+                outputs.append(self.output_video_path)
+                writer = None
+
+            if gif_frames:
+                with stats.stage("encode"):
+                    data = encode_video_gif(gif_frames, gif_palette, fps)
+                with stats.stage("write"):
+                    write_file_atomic(data, self.output_video_path)
+                outputs.append(self.output_video_path)
+
+            stats.finish()
+            print(f"Indexed {frame_index} frames: {stats.summary()}")
+            self.status_updated.emit(f"Indexed {frame_index} frames of {os.path.basename(self.video_path)}")
+
+        except Exception as e:
+            print(f"Video indexing error for {self.video_path}: {e}")
+            stats.finish(str(e))
+            self.status_updated.emit(f"Error: {e}")
+        finally:
+            # Closing the generator ends the decoder early when we were stopped
+            if frames is not None:
+                frames.close()
+            if writer is not None:
+                writer.stdin.close()
+                writer.kill()
+                writer.wait()
+
+        self.stats_updated.emit(stats.as_dict())
+        self.progress_updated.emit(100)
+        self.processing_complete.emit(outputs)
@@ -0,0 +1,118 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QThread, pyqtSignal
+from pipeline_stats import FileStats
+
+class WatchFolderThread(QThread):
+    """Polls an input folder and feeds new, fully written images to a warm worker pool"""
+    file_processed = pyqtSignal(str)
+    status_updated = pyqtSignal(str)
+    stats_updated = pyqtSignal(dict)
+
+    image_extensions = ['.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff']
+
+    def __init__(self, input_folder, processor, poll_interval=0.25, settle_time=0.5, max_workers=None):
+        super().__init__()
+        self.input_folder = input_folder
+        # Any object with get_output_path(path) and process_file(path, output_path, stats),
+        # e.g. an ImageProcessor built once from the saved settings and palette
+        self.processor = processor
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self._stop_event = threading.Event()
+
+        # path -> (size, mtime, first time this size/mtime was seen)
+        self._pending = {}
+        # path -> (size, mtime) of the version that was already submitted
+        self._submitted = {}
+        print(f"WatchFolderThread initialized for {self.input_folder} with {self.max_workers} workers")
+
+    def stop(self):
+        """Ask the watch loop to finish; queued files are still completed"""
+        self._stop_event.set()
+
+    def is_candidate(self, file_name):
+        """Skip non-images and our own outputs so a shared in/out folder does not loop"""
+        name, ext = os.path.splitext(file_name)
+        if ext.lower() not in self.image_extensions or file_name.startswith("."):
+            return False
+        return not name.endswith("_indexed")
+
+    def scan_ready_files(self):
+        """Return files whose size and mtime have been stable for settle_time seconds"""
+        ready = []
+        now = time.monotonic()
+
+        try:
+            entries = list(os.scandir(self.input_folder))
+        except OSError as e:
+            self.status_updated.emit(f"Cannot read watch folder: {e}")
+            return ready
+
+        present = set()
+        for entry in entries:
+            if not entry.is_file() or not self.is_candidate(entry.name):
+                continue
+
+            path = entry.path
+            present.add(path)
+
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # File vanished between scandir and stat
+
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if stat.st_size == 0 or self._submitted.get(path) == signature:
+                continue
+
+            # Restart the settle timer whenever the file is still growing
+            pending = self._pending.get(path)
+            if pending is None or pending[:2] != signature:
+                self._pending[path] = (signature[0], signature[1], now)
+            elif now - pending[2] >= self.settle_time:
+                del self._pending[path]
+                self._submitted[path] = signature
+                ready.append(path)
+
+        # Forget files that were removed so a re-copy is picked up again
+        for path in list(self._pending):
+            if path not in present:
+                del self._pending[path]
+        for path in list(self._submitted):
+            if path not in present:
+                del self._submitted[path]
+
+        return ready
+
+    def process_one(self, file_path):
+        """Worker body: run the shared processor on one arrival"""
+        stats = FileStats(file_path)
+        output_path = self.processor.get_output_path(file_path)
+        try:
+            self.processor.process_file(file_path, output_path, stats)
+        except Exception as e:
+            print(f"Watch folder error processing {file_path}: {e}")
+            self.status_updated.emit(f"Error: {os.path.basename(file_path)}: {e}")
+            self.stats_updated.emit(stats.finish(str(e)).as_dict())
+            return
+
+        stats.finish()
+        print(f"Watch folder processed {stats.summary()}")
+        self.stats_updated.emit(stats.as_dict())
+        self.file_processed.emit(output_path)
+
+    def run(self):
+        self.status_updated.emit(f"Watching {self.input_folder}")
+
+        # The pool lives as long as the watch, so workers stay warm between arrivals
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="watch") as executor:
+            while not self._stop_event.is_set():
+                for file_path in self.scan_ready_files():
+                    executor.submit(self.process_one, file_path)
+                self._stop_event.wait(self.poll_interval)
+
+        self.status_updated.emit("Stopped watching")